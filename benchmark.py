@@ -0,0 +1,350 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+
+import data_analyze
+from group_stats import analyze_groups
+from plot_render import render_adjusted_plot
+from run_table import read_run_table
+from session import (
+    AnalysisSession,
+    build_species_index,
+    normalize_species_name,
+    species_state,
+)
+from spatial_index import build_spatial_index, nearby_records
+from species_db import species_table_from_rows
+
+RUN_SIZES = (10**2, 10**3, 10**4, 10**5, 10**6)
+QUICK_RUN_SIZES = (10**2, 10**3, 10**4)
+SPECIES_SIZES = (10**3, 10**4, 10**5)
+MAX_PLOT_ROWS = 10**3
+LOOKUP_QUERIES = 1000
+RESULTS_PATH = "bench_results.jsonl"
+
+PICARRO_HEADER = (
+    "Sample Id,Peak Number,Description,Start Time,End Time,Max 12CO2 (ppm),"
+    "12CO2 Integral,13CO2 Integral,Delta CRDS,12CO2 Baseline,13CO2 Baseline,"
+    "Threshold,Number of data points,Time interval (seconds)"
+)
+
+
+def write_synthetic_run(file_path, n_rows, seed=0):
+    rng = np.random.default_rng(seed)
+    start = np.datetime64("2024-07-03T08:00:00") + np.arange(n_rows) * np.timedelta64(
+        931, "s"
+    )
+    end = start + np.timedelta64(480, "s")
+    delta = np.where(
+        np.arange(n_rows) < 3,
+        rng.normal(-6.76, 0.03, n_rows),
+        rng.normal(-10.0, 1.5, n_rows),
+    )
+    max_co2 = rng.uniform(2500, 4000, n_rows)
+    integral_12 = max_co2 * 190
+    integral_13 = integral_12 * 0.0111 * (1 + delta / 1000)
+    points = rng.integers(400, 470, n_rows)
+    start_text = np.datetime_as_string(start).tolist()
+    end_text = np.datetime_as_string(end).tolist()
+    with open(file_path, mode="w", newline="") as file:
+        file.write(PICARRO_HEADER + "\n")
+        for i in range(n_rows):
+            file.write(
+                f"{i + 1:>10},{1:>10},{'':>40},"
+                f"{start_text[i].replace('-', '/').replace('T', ' '):>25},"
+                f"{end_text[i].replace('-', '/').replace('T', ' ')},"
+                f"{max_co2[i]:>20.3f},{integral_12[i]:>20.3f},"
+                f"{integral_13[i]:>20.3f},{delta[i]:>20.3f},"
+                f"{rng.uniform(1, 20):>20.3f},{rng.uniform(0.05, 0.25):>20.3f},"
+                f"{70.0:>20.3f},{points[i]:>10},{points[i] * 1.07:>10.3f}\n"
+            )
+
+
+def synthetic_species_rows(n_rows, seed=0):
+    rng = np.random.default_rng(seed)
+    n_species = max(n_rows // 3, 1)
+    genera = [f"Genus{i}" for i in range(max(n_species // 10, 1))]
+    species = [f"{genera[i % len(genera)]} species{i}" for i in range(n_species)]
+    picks = rng.integers(0, n_species, n_rows)
+    little = rng.normal(-28, 2, n_rows)
+    big = rng.normal(20, 2, n_rows)
+    return [
+        {
+            "species": species[picks[i]],
+            "ps.type": "C3",
+            "little.d13.org": "NA" if i % 15 == 0 else f"{little[i]:.2f}",
+            "big.D13.org": f"{big[i]:.2f}",
+            "big.D13.merged": f"{big[i]:.2f}",
+            "latitude": f"{rng.uniform(-60, 70):.3f}",
+            "longitude": f"{rng.uniform(-180, 180):.3f}",
+            "author": "Synthetic_etal",
+            "year": "2024",
+        }
+        for i in range(n_rows)
+    ]
+
+
+def measure(func, repeat=3):
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    gc.collect()
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(timings), peak
+
+
+def linear_species_scan(rows, species_name):
+    for row in rows:
+        if row["species"].strip().lower() == species_name:
+            return row
+    return None
+
+
+def run_stages(run_path, n_rows, repeat):
+    rows = data_analyze.read_csv(run_path)
+    table = read_run_table(run_path)
+    average = data_analyze.glucose_average(table)
+    values = data_analyze.adjusted_delta(table, average, verbose=False)
+    labels = np.arange(len(values)) % max(len(values) // 10, 2)
+    stages = {
+        "read_csv": lambda: data_analyze.read_csv(run_path),
+        "read_run_table": lambda: read_run_table(run_path),
+        "adjusted_delta_rows": lambda: data_analyze.adjusted_delta(
+            rows, data_analyze.glucose_average(rows), verbose=False
+        ),
+        "adjusted_delta_table": lambda: data_analyze.adjusted_delta(
+            table, data_analyze.glucose_average(table), verbose=False
+        ),
+        "statistical_analysis": lambda: analyze_groups(
+            [value for _, value in values], labels, posthoc=("welch",)
+        ),
+    }
+    if n_rows <= MAX_PLOT_ROWS:
+        plot_path = run_path + ".png"
+        stages["plot_adjusted_data"] = lambda: render_adjusted_plot(plot_path, values)
+    for stage, func in stages.items():
+        seconds, peak = measure(func, repeat)
+        yield stage, seconds, peak
+
+
+def species_stages(n_rows, repeat):
+    rows = synthetic_species_rows(n_rows)
+    table = species_table_from_rows(rows)
+    rng = np.random.default_rng(1)
+    queries = [
+        normalize_species_name(rows[i]["species"])
+        for i in rng.integers(0, n_rows, LOOKUP_QUERIES)
+    ]
+    sites = np.column_stack(
+        [rng.uniform(-60, 70, LOOKUP_QUERIES), rng.uniform(-180, 180, LOOKUP_QUERIES)]
+    )
+    spatial_index = build_spatial_index(table)
+
+    def indexed_lookups():
+        session = AnalysisSession()
+        session.set_species(species_state(table))
+        for query in queries:
+            session.lookup_species(query)
+
+    stages = {
+        "species_index_build": lambda: build_species_index(table),
+        "species_lookup_indexed": indexed_lookups,
+        "species_lookup_scan": lambda: [
+            linear_species_scan(rows, query) for query in queries
+        ],
+        "spatial_index_build": lambda: build_spatial_index(table),
+        "spatial_lookup_radius": lambda: [
+            nearby_records(spatial_index, table, latitude, longitude)
+            for latitude, longitude in sites
+        ],
+        "spatial_lookup_nearest": lambda: [
+            nearby_records(spatial_index, table, latitude, longitude, None, k=10)
+            for latitude, longitude in sites
+        ],
+    }
+    for stage, func in stages.items():
+        seconds, peak = measure(func, repeat)
+        yield stage, seconds, peak
+
+
+def import_times(module="data_analyze"):
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    times = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        times.append((name.strip(), depth, int(self_us), int(cumulative_us)))
+    return times
+
+
+def startup_report(module="data_analyze", top=15):
+    times = import_times(module)
+    total = next(cumulative for name, depth, _, cumulative in times if name == module)
+    # Direct imports of the module; their cumulative times add up to the total.
+    imports = [entry for entry in times if entry[1] == 1]
+    imports.sort(key=lambda entry: -entry[3])
+    lines = [
+        f"Importing {module} took {total / 1000:.1f} ms",
+        f"{'module':<32}{'cumulative':>14}{'self':>12}",
+    ]
+    for name, _, self_us, cumulative_us in imports[:top]:
+        lines.append(
+            f"{name:<32}{cumulative_us / 1000:>11.1f} ms{self_us / 1000:>9.1f} ms"
+        )
+    return "\n".join(lines)
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(run_sizes, species_sizes, repeat=3, report=print):
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for n_rows in run_sizes:
+            run_path = os.path.join(directory, f"run_{n_rows}.csv")
+            write_synthetic_run(run_path, n_rows)
+            for stage, seconds, peak in run_stages(run_path, n_rows, repeat):
+                results.append(
+                    {"stage": stage, "size": n_rows, "seconds": seconds, "peak": peak}
+                )
+                report(format_result(results[-1]))
+    for n_rows in species_sizes:
+        for stage, seconds, peak in species_stages(n_rows, repeat):
+            results.append(
+                {"stage": stage, "size": n_rows, "seconds": seconds, "peak": peak}
+            )
+            report(format_result(results[-1]))
+    return results
+
+
+def format_result(result):
+    return (
+        f"{result['stage']:<24}{result['size']:>10}"
+        f"{result['seconds'] * 1000:>14.3f} ms{result['peak'] / 2**20:>12.2f} MiB"
+    )
+
+
+def save_results(file_path, results):
+    record = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+    with open(file_path, mode="a") as file:
+        file.write(json.dumps(record) + "\n")
+    return record
+
+
+def load_results(file_path):
+    if not os.path.exists(file_path):
+        return []
+    with open(file_path, mode="r") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def compare_results(previous, current):
+    before = {(r["stage"], r["size"]): r for r in previous["results"]}
+    lines = [
+        f"Compared with {previous['commit']} ({previous['timestamp']}):",
+        f"{'stage':<24}{'size':>10}{'time':>10}{'memory':>10}",
+    ]
+    for result in current["results"]:
+        old = before.get((result["stage"], result["size"]))
+        if old is None or not old["seconds"] or not old["peak"]:
+            continue
+        lines.append(
+            f"{result['stage']:<24}{result['size']:>10}"
+            f"{result['seconds'] / old['seconds']:>9.2f}x"
+            f"{result['peak'] / old['peak']:>9.2f}x"
+        )
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark parsing, correction, lookup, statistics and plotting."
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=None,
+        help="Synthetic run sizes in rows (default: 10^2 to 10^6)",
+    )
+    parser.add_argument(
+        "--species-sizes",
+        type=int,
+        nargs="+",
+        default=list(SPECIES_SIZES),
+        help="Synthetic species database sizes in rows",
+    )
+    parser.add_argument(
+        "--quick", action="store_true", help="Only run sizes up to 10^4 rows"
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="Timing repetitions")
+    parser.add_argument(
+        "--startup",
+        action="store_true",
+        help="Only report the import time of data_analyze by module",
+    )
+    parser.add_argument(
+        "-o", "--output", default=RESULTS_PATH, help="JSON lines results history"
+    )
+    args = parser.parse_args(argv)
+
+    if args.startup:
+        print(startup_report())
+        return 0
+
+    sizes = args.sizes or list(QUICK_RUN_SIZES if args.quick else RUN_SIZES)
+    print(f"{'stage':<24}{'size':>10}{'time':>17}{'peak memory':>16}")
+    results = run_benchmarks(sizes, args.species_sizes, args.repeat)
+
+    history = load_results(args.output)
+    record = save_results(args.output, results)
+    previous = [entry for entry in history if entry["commit"] != record["commit"]]
+    if previous:
+        print()
+        print(compare_results(previous[-1], record))
+    print(f"\nResults appended to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
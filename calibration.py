@@ -0,0 +1,179 @@
+import json
+import re
+
+import numpy as np
+
+from run_table import GLUCOSE_STANDARDS, CALIBRATION_OFFSET
+
+GLUCOSE_REFERENCE_VALUE = -CALIBRATION_OFFSET
+
+MODEL_TERMS = {
+    "offset": ("intercept",),
+    "drift": ("intercept", "drift"),
+    "linear": ("slope", "intercept"),
+    "linear_drift": ("slope", "intercept", "drift"),
+}
+
+# The historical rule: the first three rows are the glucose standard.
+DEFAULT_CALIBRATION = {
+    "model": "offset",
+    "standards": [
+        {
+            "name": "glucose",
+            "value": GLUCOSE_REFERENCE_VALUE,
+            "first": GLUCOSE_STANDARDS,
+        }
+    ],
+}
+
+
+def load_calibration_config(file_path):
+    with open(file_path, mode="r") as file:
+        config = json.load(file)
+    validate_calibration_config(config)
+    return config
+
+
+def validate_calibration_config(config):
+    model = config.get("model", "offset")
+    if model not in MODEL_TERMS:
+        raise ValueError(
+            f"Unknown calibration model '{model}', use one of {', '.join(MODEL_TERMS)}"
+        )
+    standards = config.get("standards")
+    if not standards:
+        raise ValueError("Calibration config has no standards")
+    for standard in standards:
+        if "value" not in standard:
+            raise ValueError(f"Standard {standard.get('name')} has no known value")
+        if not any(key in standard for key in ("pattern", "first")):
+            raise ValueError(
+                f"Standard {standard.get('name')} needs a 'pattern' or 'first' rule"
+            )
+
+
+def match_pattern(pattern, values):
+    regex = re.compile(pattern, re.IGNORECASE)
+    unique, inverse = np.unique(values, return_inverse=True)
+    matched = np.array([bool(regex.search(value)) for value in unique.tolist()])
+    return matched[inverse] if len(unique) else np.zeros(len(values), dtype=bool)
+
+
+def identify_standards(table, standards):
+    n_rows = len(table["Delta CRDS"])
+    known = np.full(n_rows, np.nan)
+    material = np.full(n_rows, -1)
+    for i, standard in enumerate(standards):
+        if "first" in standard:
+            mask = np.arange(n_rows) < standard["first"]
+        else:
+            mask = np.zeros(n_rows, dtype=bool)
+            for column in standard.get("columns", ("Sample Id", "Description")):
+                if column in table:
+                    mask |= match_pattern(standard["pattern"], table[column])
+        mask &= material < 0
+        known[mask] = standard["value"]
+        material[mask] = i
+    return known, material
+
+
+def run_hours(table):
+    if "Start Time" not in table or len(table["Start Time"]) == 0:
+        return np.zeros(len(table["Delta CRDS"])), None
+    start = table["Start Time"]
+    t0 = start.min()
+    return (start - t0) / np.timedelta64(1, "h"), t0
+
+
+def design_matrix(terms, measured, hours):
+    columns = {
+        "slope": measured,
+        "intercept": np.ones_like(measured),
+        "drift": hours,
+    }
+    return np.column_stack([columns[term] for term in terms])
+
+
+def fit_calibration(table, config=DEFAULT_CALIBRATION, exclude=None):
+    model = config.get("model", "offset")
+    terms = MODEL_TERMS[model]
+    standards = config["standards"]
+    known, material = identify_standards(table, standards)
+    is_standard = material >= 0
+    measured = table["Delta CRDS"]
+    hours, t0 = run_hours(table)
+    # Excluded standards (e.g. failed QC) stay out of the samples but do not
+    # contribute to the fit.
+    if exclude is not None:
+        material = np.where(exclude, -1, material)
+    fitted = material >= 0
+
+    n_standards = int(fitted.sum())
+    if n_standards < len(terms):
+        raise ValueError(
+            f"The '{model}' calibration needs at least {len(terms)} standard rows, "
+            f"found {n_standards}"
+        )
+    if "slope" in terms and len(np.unique(known[fitted])) < 2:
+        raise ValueError(
+            f"The '{model}' calibration needs at least two reference materials"
+        )
+
+    X = design_matrix(terms, measured[fitted], hours[fitted])
+    y = known[fitted]
+    if "slope" not in terms:
+        y = y - measured[fitted]
+    coefficients, _, _, _ = np.linalg.lstsq(X, y, rcond=None)
+    residuals = y - X @ coefficients
+
+    return {
+        "model": model,
+        "coefficients": dict(zip(terms, coefficients.tolist())),
+        "t0": None if t0 is None else str(t0),
+        "n_standards": n_standards,
+        "rmse": float(np.sqrt(np.mean(residuals**2))),
+        "residuals": residuals,
+        "standards": {
+            standard.get("name", str(i)): {
+                "value": standard["value"],
+                "n": int((material == i).sum()),
+                "measured_mean": (
+                    float(measured[material == i].mean())
+                    if (material == i).any()
+                    else None
+                ),
+            }
+            for i, standard in enumerate(standards)
+        },
+        "is_standard": is_standard,
+    }
+
+
+def apply_calibration(fit, table):
+    terms = MODEL_TERMS[fit["model"]]
+    measured = table["Delta CRDS"]
+    if fit["t0"] is None:
+        hours = np.zeros(len(measured))
+    else:
+        hours = (table["Start Time"] - np.datetime64(fit["t0"])) / np.timedelta64(
+            1, "h"
+        )
+    coefficients = np.array([fit["coefficients"][term] for term in terms])
+    corrected = design_matrix(terms, measured, hours) @ coefficients
+    if "slope" not in terms:
+        corrected = corrected + measured
+    return corrected
+
+
+def calibrate_run(table, config=DEFAULT_CALIBRATION, exclude=None):
+    fit = fit_calibration(table, config, exclude)
+    corrected = apply_calibration(fit, table)
+    samples = ~fit["is_standard"]
+    return table["Sample Id"][samples], corrected[samples], fit
+
+
+def describe_calibration(fit):
+    terms = ", ".join(
+        f"{term}={value:.4f}" for term, value in fit["coefficients"].items()
+    )
+    return f"{fit['model']}: {terms} (n={fit['n_standards']}, rmse={fit['rmse']:.3f})"
@@ -1,17 +1,120 @@
+import argparse
 import csv
+import glob
+import os
+import sys
 import tkinter as tk
-from tkinter import messagebox, filedialog, simpledialog
-import matplotlib.pyplot as plt
+from tkinter import messagebox, filedialog, simpledialog, ttk
 import numpy as np
-from scipy.stats import ttest_ind, f_oneway
 import statistics
-
-species_data = []
-adjusted_values = []
-group_data = None
-species_d13c_value = {}
-
-
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from drift_monitor import format_excursions, record_runs
+from calibration import (
+    DEFAULT_CALIBRATION,
+    calibrate_run,
+    describe_calibration,
+    load_calibration_config,
+)
+from uncertainty import (
+    UNCERTAINTY_FIELDS,
+    UNCERTAINTY_METHODS,
+    format_uncertainty,
+    propagate_uncertainty,
+)
+from qc import (
+    QC_REPORT_FIELDS,
+    failed_rows,
+    flag_reasons,
+    load_qc_limits,
+    qc_report_rows,
+    quality_flags,
+)
+from replicates import (
+    REJECTION_RULES,
+    REPLICATE_FIELDS,
+    aggregate_replicates,
+    replicate_rows,
+)
+from run_table import (
+    CALIBRATION_OFFSET,
+    GLUCOSE_STANDARDS,
+    adjusted_delta_sequences,
+    read_run_table,
+    sequence_ids,
+    table_length,
+    glucose_average_table,
+    adjusted_delta_table,
+)
+from gui_tasks import TaskCancelled, TaskContext, TaskRunner
+from instrumentation import (
+    CAPTURES,
+    count_rows,
+    current_profile,
+    finish_profile,
+    profile_settings,
+    run_profiled,
+    stage,
+    start_profile,
+    timed,
+    write_report,
+)
+from group_stats import analyze_groups, format_posthoc, format_report
+from plot_render import PLOT_FORMATS, draw_adjusted_data, plot_paths, render_plots
+from results_store import ingest_files
+from run_archive import (
+    ARCHIVE_SUMMARY_FIELDS,
+    CHUNK_ROWS,
+    close_archive,
+    correct_archive,
+    open_archive,
+)
+from run_stream import follow_run_file
+from session import (
+    AnalysisSession,
+    group_values,
+    species_state,
+)
+from sample_sheet import (
+    SHEET_FIELDS,
+    group_by_sheet,
+    join_sample_sheet,
+    load_sample_sheet,
+    sample_names_from_sheet,
+)
+from species_db import DATABASE_PATH, load_species_table
+from species_search import complete_species
+from spatial_index import (
+    PS_TYPES,
+    RADIUS_KM,
+    SITE_REFERENCE_FIELDS,
+    format_site_reference,
+    read_sites,
+    site_reference_row,
+)
+
+# The GUI's session; the module names below are its containers, kept for
+# callers written against the former module-level state.
+session = AnalysisSession()
+species_index = session.species_index
+genus_index = session.genus_index
+adjusted_values = session.adjusted_values
+species_d13c_value = session.species_d13c_value
+task_runner = None
+SUMMARY_FIELDS = [
+    "file",
+    "status",
+    "n_samples",
+    "glucose_average",
+    "sequences",
+    "mean",
+    "stdev",
+    "calibration",
+    "qc_failed",
+    "error",
+]
+
+
+@timed("read_csv")
 def read_csv(file_path):
     data = []
     with open(file_path, mode="r") as file:
@@ -22,7 +125,10 @@ def read_csv(file_path):
     return data
 
 
+@timed("glucose_average")
 def glucose_average(data):
+    if isinstance(data, dict):
+        return glucose_average_table(data)
     glucose_values = []
     for i, row in enumerate(data):
         if i < 3:
@@ -31,24 +137,876 @@ def glucose_average(data):
     return average
 
 
-def adjusted_delta(data, average):
-    adjustment = average + 11.768
-    adjusted_values = []
+def print_adjusted_report(adjusted_values):
     print("\nCarbon Isotope Composition Report\n")
+    for sample_id, adjusted_value in adjusted_values:
+        print(f"Sample ID: {sample_id}, Adjusted Delta value = {adjusted_value:.3f}")
+
+
+@timed("adjusted_delta")
+def adjusted_delta(data, average, verbose=True):
+    adjustment = average + CALIBRATION_OFFSET
+    adjusted_values = []
+    if isinstance(data, dict):
+        sample_ids, adjusted = adjusted_delta_table(data, average)
+        adjusted_values = list(zip(sample_ids.tolist(), adjusted.tolist()))
+        if verbose:
+            print_adjusted_report(adjusted_values)
+        return adjusted_values
+    if verbose:
+        print("\nCarbon Isotope Composition Report\n")
     for i, row in enumerate(data):
         if i >= 3:
             delta_raw = float(row["Delta CRDS"])
             adjusted_value = delta_raw - adjustment
             sample_id = row["Sample Id"].strip()
-            print(
-                f"Sample ID: {sample_id}, Adjusted Delta value = {adjusted_value:.3f}"
-            )
+            if verbose:
+                print(
+                    f"Sample ID: {sample_id}, Adjusted Delta value = {adjusted_value:.3f}"
+                )
             adjusted_values.append((sample_id, adjusted_value))
     return adjusted_values
 
 
+def process_run_file(
+    file_path, calibration=None, qc=None, qc_limits=None, sequence_gap=None
+):
+    sequences = None
+    try:
+        with stage("read_run_table"):
+            run_table = read_run_table(file_path)
+        count_rows("read_run_table", table_length(run_table))
+        failed = None
+        if qc:
+            with stage("qc"):
+                flags = quality_flags(run_table, qc_limits)
+                failed = failed_rows(flags, table_length(run_table))
+            calibration = calibration or DEFAULT_CALIBRATION
+        peaks = run_table.get(
+            "Peak Number", np.ones(table_length(run_table), dtype=np.int64)
+        )
+        if sequence_gap is not None:
+            with stage("adjusted_delta_sequences"):
+                correction = adjusted_delta_sequences(
+                    run_table, sequence_ids(run_table, sequence_gap)
+                )
+            values = list(
+                zip(correction["Sample Id"].tolist(), correction["adjusted"].tolist())
+            )
+            count_rows("adjusted_delta_sequences", len(values))
+            sequences = correction["sequence"]
+            standard_sequences = correction["standard_sequence"]
+            average_glucose = float(np.mean(correction["averages"]))
+            peaks = peaks[~correction["standard"]]
+            residuals = correction["residuals"]
+            fit = None
+        elif calibration is None:
+            average_glucose = glucose_average(run_table)
+            values = adjusted_delta(run_table, average_glucose, verbose=False)
+            count_rows("adjusted_delta", len(values))
+            peaks = peaks[GLUCOSE_STANDARDS:]
+            residuals = average_glucose - run_table["Delta CRDS"][:GLUCOSE_STANDARDS]
+            fit = None
+        else:
+            with stage("calibrate_run"):
+                sample_ids, corrected, fit = calibrate_run(
+                    run_table, calibration, failed
+                )
+            values = list(zip(sample_ids.tolist(), corrected.tolist()))
+            count_rows("calibrate_run", len(values))
+            glucose = fit["standards"].get("glucose", {})
+            average_glucose = glucose.get("measured_mean")
+            samples = ~fit["is_standard"]
+            peaks = peaks[samples]
+            residuals = fit["residuals"]
+            fit = {
+                key: value
+                for key, value in fit.items()
+                if key not in ("is_standard", "residuals")
+            }
+    except Exception as e:
+        return {"file": file_path, "error": f"{type(e).__name__}: {e}"}
+    result = {
+        "file": file_path,
+        "glucose_average": average_glucose,
+        "adjusted_values": values,
+        "peaks": peaks.tolist(),
+        "standard_residuals": residuals.tolist(),
+        "calibration": fit,
+        "error": None,
+    }
+    if sequences is not None:
+        result["sequences"] = sequences.tolist()
+        result["standard_sequences"] = standard_sequences.tolist()
+    if qc:
+        reasons = flag_reasons(flags, len(failed))
+        result["qc_report"] = qc_report_rows(run_table, flags, file_path)
+        result["qc_failed"] = int(failed.sum())
+        result["qc_reasons"] = [reasons[i] for i in np.flatnonzero(samples)]
+        if qc == "drop":
+            keep = ~failed[samples]
+            result["adjusted_values"] = [
+                value for value, kept in zip(values, keep.tolist()) if kept
+            ]
+            result["peaks"] = peaks[keep].tolist()
+            result["qc_reasons"] = [""] * len(result["adjusted_values"])
+    return result
+
+
+def collect_run_files(patterns):
+    files = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            files.extend(sorted(glob.glob(os.path.join(pattern, "*.csv"))))
+        else:
+            files.extend(sorted(glob.glob(pattern)))
+    return list(dict.fromkeys(files))
+
+
+def batch_process(
+    file_paths,
+    workers=None,
+    calibration=None,
+    qc=None,
+    qc_limits=None,
+    qc_report=None,
+    standard_residuals=None,
+    sequence_gap=None,
+    profiles=None,
+    profile_captures=(),
+):
+    results = {}
+    reports = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        arguments = (calibration, qc, qc_limits, sequence_gap)
+        futures = {
+            (
+                executor.submit(process_run_file, path, *arguments)
+                if profiles is None
+                # Each worker profiles its own run, so the report splits
+                # the batch by file.
+                else executor.submit(
+                    run_profiled,
+                    path,
+                    profile_captures,
+                    process_run_file,
+                    path,
+                    *arguments,
+                )
+            ): path
+            for path in file_paths
+        }
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                results[path] = future.result()
+            except Exception as e:
+                results[path] = {"file": path, "error": f"{type(e).__name__}: {e}"}
+            if profiles is not None and isinstance(results[path], tuple):
+                results[path], reports[path] = results[path]
+    if profiles is not None:
+        profiles.extend(reports[path] for path in file_paths if path in reports)
+
+    table = []
+    summary = []
+    for path in file_paths:
+        result = results[path]
+        if result["error"]:
+            summary.append(
+                {
+                    "file": path,
+                    "status": "failed",
+                    "n_samples": 0,
+                    "glucose_average": "",
+                    "sequences": "",
+                    "mean": "",
+                    "stdev": "",
+                    "calibration": "",
+                    "qc_failed": "",
+                    "error": result["error"],
+                }
+            )
+            continue
+        values = [value for _, value in result["adjusted_values"]]
+        for i, (sample_id, value) in enumerate(result["adjusted_values"]):
+            row = {
+                "file": path,
+                "Sample Id": sample_id,
+                "Peak Number": result["peaks"][i],
+                "Adjusted Delta": value,
+            }
+            if "sequences" in result:
+                row["sequence"] = result["sequences"][i]
+            if "qc_reasons" in result:
+                row["qc"] = result["qc_reasons"][i]
+            table.append(row)
+        if qc_report is not None:
+            qc_report.extend(result.get("qc_report", []))
+        if standard_residuals is not None:
+            # Keyed by file and sequence, as each sequence has its own offset
+            # from its own standards. The file's key holds all its standards,
+            # for replicate means that may span sequences.
+            standard_residuals[(path, None)] = result["standard_residuals"]
+            for residual, sequence in zip(
+                result["standard_residuals"], result.get("standard_sequences", [])
+            ):
+                standard_residuals.setdefault((path, sequence), []).append(residual)
+        summary.append(
+            {
+                "file": path,
+                "status": "ok",
+                "n_samples": len(values),
+                "glucose_average": (
+                    ""
+                    if result["glucose_average"] is None
+                    else result["glucose_average"]
+                ),
+                "sequences": (
+                    max(result["sequences"]) + 1 if result.get("sequences") else 1
+                ),
+                "mean": statistics.mean(values) if values else "",
+                "stdev": statistics.stdev(values) if len(values) > 1 else "",
+                "calibration": (
+                    describe_calibration(result["calibration"])
+                    if result["calibration"]
+                    else ""
+                ),
+                "qc_failed": result.get("qc_failed", ""),
+                "error": "",
+            }
+        )
+    return table, summary
+
+
+def write_csv(file_path, rows, fieldnames):
+    with open(file_path, mode="w", newline="") as file:
+        csv_writer = csv.DictWriter(file, fieldnames=fieldnames)
+        csv_writer.writeheader()
+        csv_writer.writerows(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Correct Picarro delta 13C runs without the GUI."
+    )
+    parser.add_argument(
+        "inputs", nargs="+", help="Run CSV files, directories or glob patterns"
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        default="corrected_delta13C.csv",
+        help="Consolidated corrected delta 13C table",
+    )
+    parser.add_argument(
+        "-s", "--summary", default="run_summary.csv", help="Per-file summary table"
+    )
+    parser.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of worker processes (default: number of CPUs)",
+    )
+    parser.add_argument(
+        "-f",
+        "--follow",
+        action="store_true",
+        help="Follow a single run file as the instrument appends peaks",
+    )
+    parser.add_argument(
+        "--poll",
+        type=float,
+        default=1.0,
+        help="Seconds between checks for new rows in follow mode",
+    )
+    parser.add_argument(
+        "--idle-timeout",
+        type=float,
+        default=None,
+        help="Stop following after this many seconds without new rows",
+    )
+    parser.add_argument(
+        "--sequence-gap",
+        type=float,
+        default=None,
+        metavar="MINUTES",
+        help="Split each run into sequences at idle gaps longer than this",
+    )
+    parser.add_argument(
+        "--archive",
+        action="store_true",
+        help="Correct one large concatenated run archive out of core",
+    )
+    parser.add_argument(
+        "--runs",
+        type=int,
+        nargs="+",
+        default=None,
+        help="Archive runs to correct, counted from 0",
+    )
+    parser.add_argument(
+        "--day",
+        default=None,
+        help="Correct the archive runs with peaks on this day (YYYY-MM-DD)",
+    )
+    parser.add_argument(
+        "--chunk-rows",
+        type=int,
+        default=CHUNK_ROWS,
+        help="Archive rows corrected at once",
+    )
+    parser.add_argument(
+        "-c",
+        "--calibration",
+        default=None,
+        help="JSON calibration config with standard patterns, known values and model",
+    )
+    parser.add_argument(
+        "--sample-sheet",
+        default=None,
+        help="CSV or YAML sheet mapping Sample Id to group, name, species and treatment",
+    )
+    parser.add_argument(
+        "--plot-dir",
+        default=None,
+        help="Render one bar plot per run file into this directory",
+    )
+    parser.add_argument(
+        "--plot-format",
+        choices=PLOT_FORMATS,
+        default="png",
+        help="File format of the rendered plots",
+    )
+    parser.add_argument(
+        "--db",
+        default=None,
+        help="Ingest the runs into this SQLite results store, skipping stored files",
+    )
+    parser.add_argument(
+        "--instrument",
+        default=None,
+        help="Instrument name recorded with --db and --monitor",
+    )
+    parser.add_argument(
+        "--monitor",
+        default=None,
+        help="Record the glucose standards of the runs in this drift monitoring store",
+    )
+    parser.add_argument(
+        "--qc",
+        choices=("flag", "drop"),
+        default=None,
+        help="Check peaks against the QC limits and flag or drop the failures",
+    )
+    parser.add_argument(
+        "--qc-limits", default=None, help="JSON file overriding the default QC limits"
+    )
+    parser.add_argument(
+        "--qc-report",
+        default="qc_report.csv",
+        help="Table of the peaks that failed QC, with the reasons",
+    )
+    parser.add_argument(
+        "--replicates",
+        action="store_true",
+        help="Average replicate injections per Sample Id and peak before statistics",
+    )
+    parser.add_argument(
+        "--reject",
+        nargs="+",
+        choices=REJECTION_RULES,
+        default=[],
+        help="Outlier rules applied to the replicates, in order",
+    )
+    parser.add_argument(
+        "--uncertainty",
+        type=int,
+        default=None,
+        metavar="DRAWS",
+        help="Propagate standard and replicate scatter with this many draws",
+    )
+    parser.add_argument(
+        "--uncertainty-method",
+        choices=UNCERTAINTY_METHODS,
+        default="montecarlo",
+        help="Draw the glucose offset from a normal or by resampling the standards",
+    )
+    parser.add_argument(
+        "--calibration-sd",
+        type=float,
+        default=0.0,
+        help="Standard uncertainty of the glucose reference value",
+    )
+    parser.add_argument(
+        "--uncertainty-output",
+        default="uncertainty.csv",
+        help="Per-sample mean, SD and 95%% interval of the corrected value",
+    )
+    parser.add_argument(
+        "--replicate-output",
+        default="replicates.csv",
+        help="Per-sample table of replicate mean, SD and n",
+    )
+    parser.add_argument(
+        "--site",
+        type=float,
+        nargs=2,
+        metavar=("LAT", "LON"),
+        default=None,
+        help="Field site whose nearby literature values become the plot reference",
+    )
+    parser.add_argument(
+        "--sites",
+        default=None,
+        help="CSV of Sample Id, latitude and longitude, one field site per sample",
+    )
+    parser.add_argument(
+        "--radius",
+        type=float,
+        default=RADIUS_KM,
+        help="Search radius around a site in km",
+    )
+    parser.add_argument(
+        "--nearest",
+        type=int,
+        default=None,
+        help="Use only the nearest records within the radius",
+    )
+    parser.add_argument(
+        "--ps-type",
+        nargs="+",
+        choices=PS_TYPES,
+        default=None,
+        help="Only literature records of these photosynthetic types",
+    )
+    parser.add_argument(
+        "--years",
+        type=int,
+        nargs=2,
+        metavar=("FIRST", "LAST"),
+        default=None,
+        help="Only literature records published in this range of years",
+    )
+    parser.add_argument(
+        "--site-output",
+        default="site_references.csv",
+        help="Per-sample literature values near each site from --sites",
+    )
+    parser.add_argument(
+        "--profile",
+        default=None,
+        help="Write a JSON timing report of the stages and runs "
+        "(or set PICARRO_PROFILE)",
+    )
+    parser.add_argument(
+        "--profile-capture",
+        nargs="+",
+        choices=CAPTURES,
+        default=None,
+        help="Also capture cProfile and/or tracemalloc statistics "
+        "(or set PICARRO_PROFILE_CAPTURE)",
+    )
+    args = parser.parse_args(argv)
+    if args.db:
+        # The results store keeps the corrected samples only; the batch
+        # outputs and analyses are not made in this mode.
+        ignored = [
+            option
+            for option, name in (
+                ("-o/--output", "output"),
+                ("-s/--summary", "summary"),
+                ("--qc", "qc"),
+                ("--replicates", "replicates"),
+                ("--uncertainty", "uncertainty"),
+                ("--sequence-gap", "sequence_gap"),
+                ("--sites", "sites"),
+                ("--plot-dir", "plot_dir"),
+            )
+            if getattr(args, name) != parser.get_default(name)
+        ]
+        if ignored:
+            parser.error(f"--db cannot be combined with {', '.join(ignored)}")
+
+    try:
+        report_path, captures = profile_settings(args.profile, args.profile_capture)
+    except ValueError as e:
+        print(f"Invalid profile settings: {e}", file=sys.stderr)
+        return 1
+    if not report_path:
+        return run_command(args)
+    profile = start_profile("data_analyze", captures)
+    try:
+        return run_command(args)
+    finally:
+        report = finish_profile(profile)
+        report["argv"] = sys.argv[1:] if argv is None else list(argv)
+        write_report(report_path, report)
+        print(f"Timing report written to {report_path}")
+
+
+def run_command(args):
+    sheet = None
+    if args.sample_sheet:
+        try:
+            sheet = load_sample_sheet(args.sample_sheet)
+        except (OSError, ValueError, ImportError) as e:
+            print(f"Invalid sample sheet: {e}", file=sys.stderr)
+            return 1
+
+    sites = []
+    if args.sites:
+        try:
+            sites = read_sites(args.sites)
+        except (OSError, ValueError) as e:
+            print(f"Invalid site table: {e}", file=sys.stderr)
+            return 1
+
+    calibration = None
+    if args.calibration:
+        try:
+            calibration = load_calibration_config(args.calibration)
+        except (OSError, ValueError) as e:
+            print(f"Invalid calibration config: {e}", file=sys.stderr)
+            return 1
+
+    if (
+        args.uncertainty
+        and calibration
+        and calibration.get("model", "offset") != "offset"
+    ):
+        print(
+            "Uncertainty propagation supports the offset calibration model only.",
+            file=sys.stderr,
+        )
+        return 1
+
+    if args.sequence_gap is not None and (calibration or args.qc):
+        print(
+            "Sequence splitting uses the glucose standards at the start of each "
+            "sequence and cannot be combined with a calibration config or QC.",
+            file=sys.stderr,
+        )
+        return 1
+    sequence_gap = None
+    if args.sequence_gap is not None:
+        sequence_gap = np.timedelta64(int(args.sequence_gap * 60), "s")
+
+    qc_limits = None
+    if args.qc_limits:
+        try:
+            qc_limits = load_qc_limits(args.qc_limits)
+        except (OSError, ValueError) as e:
+            print(f"Invalid QC limits: {e}", file=sys.stderr)
+            return 1
+
+    if args.follow:
+        if len(args.inputs) != 1 or not os.path.isfile(args.inputs[0]):
+            print("Follow mode needs exactly one run file.", file=sys.stderr)
+            return 1
+        try:
+            follow_run_file(
+                args.inputs[0],
+                output=args.output,
+                poll_interval=args.poll,
+                idle_timeout=args.idle_timeout,
+            )
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    if args.archive:
+        if len(args.inputs) != 1 or not os.path.isfile(args.inputs[0]):
+            print("Archive mode needs exactly one archive file.", file=sys.stderr)
+            return 1
+        malformed = []
+        try:
+            archive = open_archive(args.inputs[0])
+            try:
+                with stage("correct_archive"):
+                    summary = correct_archive(
+                        archive,
+                        args.output,
+                        runs=args.runs,
+                        day=args.day,
+                        chunk_rows=args.chunk_rows,
+                        malformed=malformed,
+                    )
+            finally:
+                close_archive(archive)
+        except (OSError, ValueError) as e:
+            print(f"Invalid archive: {e}", file=sys.stderr)
+            return 1
+        write_csv(args.summary, summary, ARCHIVE_SUMMARY_FIELDS)
+        print(
+            f"{sum(row['n_samples'] for row in summary)} corrected samples of "
+            f"{len(summary)} runs written to {args.output}"
+        )
+        for line, reason in malformed:
+            print(f"Malformed row: line {line}: {reason}", file=sys.stderr)
+        return 0
+
+    file_paths = collect_run_files(args.inputs)
+    if not file_paths:
+        print("No run files found.", file=sys.stderr)
+        return 1
+
+    monitor_failed = []
+    if args.monitor:
+        with stage("monitor"):
+            monitor = record_runs(args.monitor, file_paths, instrument=args.instrument)
+        monitor_failed = monitor["failed"]
+        recorded = len(monitor["recorded"])
+        excursions = [run for run in monitor["recorded"] if run[1]]
+        print(
+            f"Recorded the standards of {recorded} of "
+            f"{recorded + len(monitor_failed)} new runs in {args.monitor}, "
+            f"{len(excursions)} with drift excursions"
+        )
+        for path, flags in excursions:
+            print(format_excursions(path, flags), file=sys.stderr)
+        for path, error in monitor_failed:
+            print(f"Not recorded: {path}: {error}", file=sys.stderr)
+
+    if args.db:
+        with stage("ingest"):
+            ingest = ingest_files(
+                args.db,
+                file_paths,
+                instrument=args.instrument,
+                calibration=calibration,
+                sheet=sheet,
+                workers=args.workers,
+            )
+        n_samples = sum(n for _, n in ingest["ingested"])
+        print(
+            f"Ingested {len(ingest['ingested'])} new runs ({n_samples} samples), "
+            f"skipped {len(ingest['skipped'])} already stored runs into {args.db}"
+        )
+        for path, error in ingest["failed"]:
+            print(f"Failed: {path}: {error}", file=sys.stderr)
+        return 1 if ingest["failed"] or monitor_failed else 0
+
+    qc_report = []
+    standard_residuals = {}
+    profile = current_profile()
+    with stage("batch_process"):
+        table, summary = batch_process(
+            file_paths,
+            workers=args.workers,
+            calibration=calibration,
+            qc=args.qc,
+            qc_limits=qc_limits,
+            qc_report=qc_report,
+            standard_residuals=standard_residuals,
+            sequence_gap=sequence_gap,
+            profiles=None if profile is None else profile["runs"],
+            profile_captures=() if profile is None else profile["captures"],
+        )
+    table_fields = ["file", "Sample Id", "Peak Number", "Adjusted Delta"]
+    if sequence_gap is not None:
+        table_fields.append("sequence")
+    if args.qc:
+        table_fields.append("qc")
+        write_csv(args.qc_report, qc_report, QC_REPORT_FIELDS)
+        print(f"{len(qc_report)} peaks failed QC, listed in {args.qc_report}")
+    if sheet:
+        join_sample_sheet(table, sheet)
+        table_fields += list(SHEET_FIELDS)
+    write_csv(args.output, table, table_fields)
+    write_csv(args.summary, summary, SUMMARY_FIELDS)
+
+    if args.replicates or args.reject:
+        with stage("replicates"):
+            aggregate = aggregate_replicates(
+                [row["Adjusted Delta"] for row in table],
+                [row["Sample Id"] for row in table],
+                [row["Peak Number"] for row in table],
+                [row["file"] for row in table],
+                rules=args.reject,
+            )
+        # Statistics and plots use the collapsed table from here on.
+        table = replicate_rows(aggregate)
+        replicate_fields = list(REPLICATE_FIELDS)
+        if sheet:
+            join_sample_sheet(table, sheet)
+            replicate_fields += list(SHEET_FIELDS)
+        write_csv(args.replicate_output, table, replicate_fields)
+        print(
+            f"{len(table)} samples from {len(aggregate['rejected'])} injections, "
+            f"{int(aggregate['rejected'].sum())} rejected, "
+            f"written to {args.replicate_output}"
+        )
+
+    failed = [row for row in summary if row["status"] == "failed"]
+    print(
+        f"Processed {len(summary) - len(failed)} of {len(summary)} files, "
+        f"{len(table)} corrected samples written to {args.output}"
+    )
+    for row in failed:
+        print(f"Failed: {row['file']}: {row['error']}", file=sys.stderr)
+
+    if args.uncertainty and table:
+        # Replicate means carry no sequence and use all the file's standards.
+        runs = list(dict.fromkeys((row["file"], row.get("sequence")) for row in table))
+        run_index = {run: i for i, run in enumerate(runs)}
+        labels = None
+        if sheet:
+            labels = [None if row["group"] == "" else row["group"] for row in table]
+        replicated = "n" in table[0]
+        with stage("uncertainty"):
+            uncertainty = propagate_uncertainty(
+                [row["Adjusted Delta"] for row in table],
+                [run_index[row["file"], row.get("sequence")] for row in table],
+                [standard_residuals[run] for run in runs],
+                sd=(
+                    [np.nan if row["sd"] == "" else row["sd"] for row in table]
+                    if replicated
+                    else None
+                ),
+                n=[row["n"] for row in table] if replicated else None,
+                labels=labels,
+                n_draws=args.uncertainty,
+                method=args.uncertainty_method,
+                calibration_sd=args.calibration_sd,
+            )
+        write_csv(
+            args.uncertainty_output,
+            [
+                {
+                    "file": row["file"],
+                    "Sample Id": row["Sample Id"],
+                    "Adjusted Delta": row["Adjusted Delta"],
+                    "sd": uncertainty["sd"][i],
+                    "lower": uncertainty["lower"][i],
+                    "upper": uncertainty["upper"][i],
+                }
+                for i, row in enumerate(table)
+            ],
+            UNCERTAINTY_FIELDS,
+        )
+        print(
+            f"Uncertainty of {len(table)} samples written to {args.uncertainty_output}"
+        )
+        if "groups" in uncertainty and len(uncertainty["groups"]["group"]):
+            print(format_uncertainty(uncertainty["groups"]))
+
+    references = AnalysisSession()
+    if args.site or sites:
+        with stage("load_species"):
+            references.load_species()
+        query = {
+            "radius_km": args.radius,
+            "k": args.nearest,
+            "ps_type": args.ps_type,
+            "years": args.years,
+        }
+        if args.site:
+            stats = references.nearby_reference(*args.site, **query)
+            print(format_site_reference(stats))
+            references.record_species(stats["species"], stats["little.d13.org"]["mean"])
+        if sites:
+            write_csv(
+                args.site_output,
+                [
+                    site_reference_row(
+                        sample_id,
+                        latitude,
+                        longitude,
+                        references.nearby_reference(latitude, longitude, **query),
+                    )
+                    for sample_id, latitude, longitude in sites
+                ],
+                SITE_REFERENCE_FIELDS,
+            )
+            print(
+                f"Literature values near {len(sites)} sites written to {args.site_output}"
+            )
+
+    if args.plot_dir:
+        os.makedirs(args.plot_dir, exist_ok=True)
+        values_by_file = {}
+        for row in table:
+            values_by_file.setdefault(row["file"], []).append(
+                (row["Sample Id"], row["Adjusted Delta"])
+            )
+        jobs = []
+        output_paths = plot_paths(args.plot_dir, list(values_by_file), args.plot_format)
+        for output_path, (path, values) in zip(output_paths, values_by_file.items()):
+            jobs.append(
+                {
+                    "output_path": output_path,
+                    "adjusted_values": values,
+                    "species_d13c_value": references.species_d13c_value,
+                    "group_data": group_by_sheet(values, sheet)[0] if sheet else None,
+                    "sample_names": (
+                        sample_names_from_sheet([val[0] for val in values], sheet)
+                        if sheet
+                        else None
+                    ),
+                    "title": f"Leaf Delta 13C - {os.path.basename(path)}",
+                }
+            )
+        with stage("render_plots"):
+            rendered = render_plots(jobs, workers=args.workers)
+        for output_path, error in rendered:
+            if error:
+                print(f"Plot failed: {output_path}: {error}", file=sys.stderr)
+        print(f"Rendered {len(jobs)} plots to {args.plot_dir}")
+
+    batch_session = AnalysisSession(sample_sheet=sheet)
+    batch_session.set_adjusted_values(
+        [(row["Sample Id"], row["Adjusted Delta"]) for row in table]
+    )
+    with stage("statistical_analysis"):
+        result = batch_session.group_statistics()
+    if result:
+        print(format_report(result))
+        posthoc_report = format_posthoc(result)
+        if posthoc_report:
+            print(posthoc_report)
+    return 1 if failed or monitor_failed else 0
+
+
+def run_task(func, *args, on_done=None, on_error=None):
+    if task_runner is not None:
+        return task_runner.submit(func, *args, on_done=on_done, on_error=on_error)
+    # Without a GUI event loop (tests, scripts) the task runs inline.
+    try:
+        result = func(*args, task=TaskContext())
+    except Exception as e:
+        if on_error is None:
+            raise
+        on_error(e)
+    else:
+        if on_done:
+            on_done(result)
+
+
+def show_task_error(error, file_path=None):
+    if isinstance(error, TaskCancelled):
+        return
+    if isinstance(error, FileNotFoundError) and file_path:
+        messagebox.showerror("Error", f"File '{file_path}' not found.")
+    else:
+        messagebox.showerror("Error", f"An error occurred: {error}")
+
+
+def show_task_progress(task_id, fraction, message):
+    status_label.config(text=message)
+    progress_bar["value"] = fraction * 100
+
+
+def process_isotopic_file(file_path, task):
+    task.progress(0.1, "Reading and correcting isotopic data")
+    with stage("load_run"):
+        table, values = session.correct_run(file_path)
+    task.check_cancelled()
+    print_adjusted_report(values)
+    return table, values
+
+
 def load_isotopic_data():
-    global adjusted_values
     file_path = filedialog.askopenfilename(
         title="Select Isotopic Data CSV File",
         filetypes=(("CSV files", "*.csv"), ("All files", "*.*")),
@@ -56,97 +1014,165 @@ def load_isotopic_data():
     if not file_path:
         return
 
-    try:
-        isotopic_data = read_csv(file_path)
-        average_glucose = glucose_average(isotopic_data)
-        adjusted_values[:] = adjusted_delta(isotopic_data, average_glucose)
-
+    def finish(result):
+        session.set_run(*result)
         messagebox.showinfo(
             "Info", "Processed isotopic data and calculated adjusted delta values."
         )
-    except FileNotFoundError:
-        messagebox.showerror("Error", f"File '{file_path}' not found.")
-    except Exception as e:
-        messagebox.showerror("Error", f"An error occurred: {e}")
-    prompt_for_species()
+        prompt_for_species()
 
+    def fail(error):
+        show_task_error(error, file_path)
+        prompt_for_species()
+
+    run_task(process_isotopic_file, file_path, on_done=finish, on_error=fail)
+
+
+@timed("search_species")
+def lookup_species(species_name, by_genus=False):
+    return session.lookup_species(species_name, by_genus)
+
+
+def load_sample_sheet_file():
+    file_path = filedialog.askopenfilename(
+        title="Select Sample Sheet",
+        filetypes=(
+            ("Sample sheets", "*.csv *.yaml *.yml"),
+            ("All files", "*.*"),
+        ),
+    )
+    if not file_path:
+        return
 
-def load_species_data():
-    global species_data
-    file_path = "leaf13C_database.csv"
     try:
-        species_data = read_csv(file_path)
+        session.sample_sheet = load_sample_sheet(file_path)
+        messagebox.showinfo(
+            "Info", f"Loaded group assignments for {len(session.sample_sheet)} samples."
+        )
     except FileNotFoundError:
         messagebox.showerror("Error", f"File '{file_path}' not found.")
     except Exception as e:
         messagebox.showerror("Error", f"An error occurred: {e}")
 
 
-def search_species():
-    global species_d13c_value
+def update_species_suggestions(event=None):
+    suggestion_list.delete(0, tk.END)
+    if session.species_search_index is None:
+        return
+    for name in complete_species(session.species_search_index, entry.get()):
+        suggestion_list.insert(tk.END, name)
 
-    while True:
-        species_name = entry.get().strip().lower()
-        if not species_name:
-            messagebox.showinfo("Info", "Please enter a species name.")
-            return
 
-        if not species_data:
-            messagebox.showwarning("Warning", "Species data not loaded yet.")
-            return
-        if species_name is not None:
-            if any(species_name.lower() == k.lower() for k in species_d13c_value):
-                messagebox.showinfo("Result", f"'{species_name}' already searched.")
-
-                if not messagebox.askyesno(
-                    "Search Another", "Do you want to search for another species?"
-                ):
-                    ask_for_statistical_analysis()
-                    return
-                else:
-                    entry.delete(0, tk.END)
-                    continue
-
-        found = False
-        for row in species_data:
-            if row["species"].strip().lower() == species_name:
-                little_d13_org = row["little.d13.org"]
-                species_name = row["species"]
-                if little_d13_org == "NA":
-                    messagebox.showinfo(
-                        "Result",
-                        f"'{species_name}' leaf delta 13C value was not found.",
-                    )
-                    species_d13c_value[species_name] = None
-                else:
-                    messagebox.showinfo(
-                        "Result",
-                        f"'{species_name}' leaf delta 13C value is: {little_d13_org}",
-                    )
-                    species_d13c_value[species_name] = float(little_d13_org)
-                    print(
-                        f"'{species_name}' literature leaf delta 13C value is: {little_d13_org}"
-                    )
-                found = True
-                break
+def select_species_suggestion(event=None):
+    selection = suggestion_list.curselection()
+    if selection:
+        entry.delete(0, tk.END)
+        entry.insert(0, suggestion_list.get(selection[0]))
+        suggestion_list.delete(0, tk.END)
+
+
+def build_species_state(file_path, task):
+    task.progress(0.1, "Loading species database")
+    table = load_species_table(file_path)
+    task.check_cancelled()
+    task.progress(0.6, "Indexing species names")
+    return species_state(table)
+
 
-        if not found:
+def load_species_data():
+    file_path = DATABASE_PATH
+
+    run_task(
+        build_species_state,
+        file_path,
+        on_done=session.set_species,
+        on_error=lambda error: show_task_error(error, file_path),
+    )
+
+
+def search_species():
+    species_name = entry.get().strip().lower()
+    if not species_name:
+        messagebox.showinfo("Info", "Please enter a species name.")
+        return
+
+    if not session.species_loaded():
+        messagebox.showwarning("Warning", "Species data not loaded yet.")
+        return
+    if any(species_name == k.lower() for k in session.species_d13c_value):
+        messagebox.showinfo("Result", f"'{species_name}' already searched.")
+        ask_search_another()
+        return
+
+    result = lookup_species(species_name)
+    if result is None:
+        suggestions = session.suggest_species(species_name)
+        if suggestions and messagebox.askyesno(
+            "Did You Mean",
+            f"'{species_name}' not found in the database. "
+            f"Did you mean '{suggestions[0]}'?"
+            + (
+                f"\n\nOther close matches: {', '.join(suggestions[1:])}"
+                if len(suggestions) > 1
+                else ""
+            ),
+        ):
+            result = lookup_species(suggestions[0])
+    if result is not None:
+        species_name = result["species"]
+        little_d13_org = result["little.d13.org"]
+        big_d13_merged = result["big.D13.merged"]
+        if little_d13_org["n"] == 0:
+            messagebox.showinfo(
+                "Result",
+                f"'{species_name}' leaf delta 13C value was not found.",
+            )
+            session.record_species(species_name, None)
+        else:
+            summary = (
+                f"mean {little_d13_org['mean']:.3f}, "
+                f"median {little_d13_org['median']:.3f}, "
+                f"n = {little_d13_org['n']}"
+            )
             messagebox.showinfo(
-                "Result", f"'{species_name}' not found in the database."
+                "Result",
+                f"'{species_name}' leaf delta 13C value is: {summary}",
+            )
+            session.record_species(species_name, little_d13_org["mean"])
+            print(f"'{species_name}' literature leaf delta 13C value is: {summary}")
+        if big_d13_merged["n"]:
+            print(
+                f"'{species_name}' literature leaf Delta 13C: "
+                f"mean {big_d13_merged['mean']:.3f}, "
+                f"median {big_d13_merged['median']:.3f}, "
+                f"n = {big_d13_merged['n']}"
             )
-            species_d13c_value[species_name] = None
+    else:
+        message = f"'{species_name}' not found in the database."
+        genus = lookup_species(species_name, by_genus=True)
+        if genus is not None and genus["little.d13.org"]["n"]:
+            message += (
+                f"\nGenus '{genus['species'].split(' ')[0]}' leaf delta 13C: "
+                f"mean {genus['little.d13.org']['mean']:.3f}, "
+                f"n = {genus['little.d13.org']['n']}"
+            )
+        messagebox.showinfo("Result", message)
+        session.record_species(species_name, None)
 
-        if not messagebox.askyesno(
-            "Search Another", "Do you want to search for another species?"
-        ):
-            ask_for_statistical_analysis()
-            return
+    ask_search_another()
 
-        entry.delete(0, tk.END)
+
+def ask_search_another():
+    if not messagebox.askyesno(
+        "Search Another", "Do you want to search for another species?"
+    ):
+        ask_for_statistical_analysis()
+        return
+    entry.delete(0, tk.END)
 
 
 def ask_for_statistical_analysis():
-    if not adjusted_values:
+    if not session.adjusted_values:
         messagebox.showwarning(
             "Warning", "No isotopic data available for statistical analysis."
         )
@@ -155,10 +1181,17 @@ def ask_for_statistical_analysis():
     perform_stat_analysis = messagebox.askyesno(
         "Statistical Analysis", "Do you want to perform statistical analysis?"
     )
-    if perform_stat_analysis:
-        group_data, report = statistical_analysis(adjusted_values)
+    if perform_stat_analysis and task_runner is not None:
+        statistical_analysis(
+            session.adjusted_values,
+            on_done=lambda groups, report: offer_to_plot_data(
+                groups, session.species_d13c_value
+            ),
+        )
+    elif perform_stat_analysis:
+        group_data, report = statistical_analysis(session.adjusted_values)
         if report:
-            offer_to_plot_data(group_data, species_d13c_value)
+            offer_to_plot_data(group_data, session.species_d13c_value)
 
 
 def offer_to_plot_data(group_data, species_d13c_value):
@@ -171,71 +1204,96 @@ def offer_to_plot_data(group_data, species_d13c_value):
         else:
             include_species_d13c = False
         plot_adjusted_data(
-            adjusted_values,
+            session.adjusted_values,
             species_d13c_value if include_species_d13c else None,
             group_data,
         )
 
 
-def statistical_analysis(data):
-    global group_data
+def assign_groups(data, sheet=None):
     if not data:
         messagebox.showerror("Error", "No data available for statistical analysis.")
-        return None, None
+        return None
 
-    num_groups = simpledialog.askinteger(
-        "Number of Groups", "How many groups does your data have?"
-    )
-    if num_groups is None:
-        return None, None
-
-    group_data = {}
-    if num_groups in (0, 1):
-        group_data[1] = data
-    else:
-        for i in range(num_groups):
-            group_data[i + 1] = []
-        for val in data:
-            group_number = simpledialog.askinteger(
-                "Group Assignment", f"Enter the group number for Sample {val[0]}:"
+    if sheet is None:
+        sheet = session.sample_sheet
+    if sheet:
+        group_data, unassigned = group_by_sheet(data, sheet)
+        if unassigned:
+            print(
+                "Samples without a group in the sample sheet: "
+                + ", ".join(str(sample_id) for sample_id in unassigned)
             )
-            if group_number in group_data:
-                group_data[group_number].append(val)
+        if not group_data:
+            messagebox.showerror(
+                "Error", "No sample in the data has a group in the sample sheet."
+            )
+            return None
+    else:
+        num_groups = simpledialog.askinteger(
+            "Number of Groups", "How many groups does your data have?"
+        )
+        if num_groups is None:
+            return None
+
+        group_data = {}
+        if num_groups in (0, 1):
+            group_data[1] = data
+        else:
+            for i in range(num_groups):
+                group_data[i + 1] = []
+            for val in data:
+                group_number = simpledialog.askinteger(
+                    "Group Assignment", f"Enter the group number for Sample {val[0]}:"
+                )
+                if group_number in group_data:
+                    group_data[group_number].append(val)
 
     if any(len(group) == 0 for group in group_data.values()):
         messagebox.showerror("Error", "Not enough data for statistical analysis.")
-        return None, None
+        return None
+    return group_data
 
-    report = []
-    for group_number, group in group_data.items():
-        group_values = [item[1] for item in group]
-        mean = statistics.mean(group_values)
-        stdev = statistics.stdev(group_values)
-        median = statistics.median(group_values)
-        report.append(
-            f"Group {group_number}: Mean = {mean:.3f}, Standard Deviation = {stdev:.3f}, Median = {median:.3f}"
-        )
 
-    if num_groups == 2:
-        group_1_values = [item[1] for item in group_data[1]]
-        group_2_values = [item[1] for item in group_data[2]]
-        t_stat, p_value = ttest_ind(group_1_values, group_2_values)
-        report.append(f"T-Test: T-statistic = {t_stat}, P-value = {p_value}")
-    elif num_groups > 2:
-        group_values_list = [
-            [item[1] for item in group] for group in group_data.values()
-        ]
-        f_stat, p_value = f_oneway(*group_values_list)
-        report.append(f"ANOVA: F-statistic = {f_stat}, P-value = {p_value}")
-    else:
-        report.append("Only one group found. No t-test or ANOVA performed.")
+@timed("statistical_analysis")
+def group_statistics_report(group_data, task):
+    task.progress(0.2, "Computing group statistics")
+    result = analyze_groups(*group_values(group_data))
 
-    statistical_report = "\n".join(report)
+    statistical_report = format_report(result)
     print(statistical_report)
-    return group_data, statistical_report
+    posthoc_report = format_posthoc(result)
+    if posthoc_report:
+        print(posthoc_report)
+    return statistical_report
+
+
+def statistical_analysis(data, sheet=None, on_done=None):
+    assigned = assign_groups(data, sheet)
+    if assigned is None:
+        return None, None
 
+    reports = []
+
+    def finish(statistical_report):
+        session.set_group_data(assigned)
+        reports.append(statistical_report)
+        if on_done:
+            on_done(assigned, statistical_report)
+
+    run_task(
+        group_statistics_report, assigned, on_done=finish, on_error=show_task_error
+    )
+    return assigned, reports[0] if reports else None
 
-def plot_adjusted_data(adjusted_values, species_d13c_value, group_data=None):
+
+def plot_adjusted_data(
+    adjusted_values, species_d13c_value, group_data=None, sheet=None
+):
+    if sheet is None:
+        sheet = session.sample_sheet
+    if group_data is None and sheet:
+        group_data, _ = group_by_sheet(adjusted_values, sheet)
     if group_data is None:
         if species_d13c_value and any(species_d13c_value.values()):
             messagebox.askyesno(
@@ -270,14 +1328,11 @@ def plot_adjusted_data(adjusted_values, species_d13c_value, group_data=None):
     else:
         group_data = group_data
 
-    give_sample_names = messagebox.askyesno(
-        "Sample Names", "Do you want to give the samples names?"
-    )
-
     sample_ids = [val[0] for val in adjusted_values]
-    adjusted_deltas = [val[1] for val in adjusted_values]
 
-    if give_sample_names:
+    if sheet and any(entry["name"] for entry in sheet.values()):
+        sample_names = sample_names_from_sheet(sample_ids, sheet)
+    elif messagebox.askyesno("Sample Names", "Do you want to give the samples names?"):
         sample_names = [
             simpledialog.askstring("Sample Name", f"Enter name for sample {sample_id}:")
             for sample_id in sample_ids
@@ -285,54 +1340,14 @@ def plot_adjusted_data(adjusted_values, species_d13c_value, group_data=None):
     else:
         sample_names = sample_ids
 
-    x = np.arange(len(sample_names))
-
-    plt.figure(figsize=(10, 6))
-    ax = plt.gca()
-    bars = ax.bar(np.arange(len(sample_names)), adjusted_deltas)
-
-    ax.set_xlabel("Sample")
-    ax.set_ylabel("Delta 13C")
-    ax.set_title("Leaf Delta 13C")
-
-    ax.set_xticks(np.arange(len(sample_names)))
-    ax.set_xticklabels(sample_names, rotation=45, ha="right")
-
-    if species_d13c_value and any(species_d13c_value.values()):
-        for idx, (species, value) in enumerate(species_d13c_value.items()):
-            if value is not None:
-                plt.axhline(
-                    y=value,
-                    color="black",
-                    linestyle="--",
-                    label=f"{value} ({species} leaf delta\n13C literature value)",
-                )
-        plt.legend(bbox_to_anchor=(1.05, 1), loc="upper left")
-
-    if group_data:
-        group_data = {
-            group_number: (
-                [entry[0] for entry in group] if isinstance(group[0], tuple) else group
-            )
-            for group_number, group in group_data.items()
-        }
-
-        cmap = plt.get_cmap("tab10")
-        colors = [cmap(i) for i in range(cmap.N)]
-
-        group_colors = {
-            group_number: colors[group_number % len(colors)]
-            for group_number in group_data.keys()
-        }
+    import matplotlib.pyplot as plt
 
-        for group_number, group in group_data.items():
-            color = group_colors[group_number]
-            for sample_id in group:
-                if sample_id in sample_ids:
-                    index = sample_ids.index(sample_id)
-                    bars[index].set_color(color)
-
-    plt.tight_layout()
+    with stage("plot_adjusted_data"):
+        plt.figure(figsize=(10, 6))
+        draw_adjusted_data(
+            plt.gca(), adjusted_values, species_d13c_value, group_data, sample_names
+        )
+        plt.tight_layout()
     plt.show()
 
 
@@ -345,6 +1360,13 @@ def show_initial_message():
 
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        sys.exit(main())
+
+    # PICARRO_PROFILE times the GUI session; the report is written on close.
+    report_path, captures = profile_settings()
+    gui_profile = start_profile("gui", captures) if report_path else None
+
     # Create the main application window
     root = tk.Tk()
     root.title("Isotopic Data Analysis")
@@ -355,11 +1377,21 @@ if __name__ == "__main__":
     )
     load_isotopic_data_button.pack(pady=10)
 
+    load_sample_sheet_button = tk.Button(
+        root, text="Load Sample Sheet", command=load_sample_sheet_file
+    )
+    load_sample_sheet_button.pack(pady=10)
+
     label = tk.Label(root, text="Enter Plant Species:")
     label.pack()
 
     entry = tk.Entry(root)
     entry.pack(pady=5)
+    entry.bind("<KeyRelease>", update_species_suggestions)
+
+    suggestion_list = tk.Listbox(root, height=5)
+    suggestion_list.pack()
+    suggestion_list.bind("<<ListboxSelect>>", select_species_suggestion)
 
     search_species_button = tk.Button(
         root, text="Search Species", command=search_species
@@ -369,7 +1401,7 @@ if __name__ == "__main__":
     plot_button = tk.Button(
         root,
         text="statistical analysis",
-        command=lambda: statistical_analysis(adjusted_values),
+        command=lambda: statistical_analysis(session.adjusted_values),
     )
     plot_button.pack(pady=10)
 
@@ -377,11 +1409,31 @@ if __name__ == "__main__":
         root,
         text="Plot Data",
         command=lambda: plot_adjusted_data(
-            adjusted_values, species_d13c_value, group_data
+            session.adjusted_values, session.species_d13c_value, session.group_data
         ),
     )
     plot_button.pack(pady=10)
 
+    status_label = tk.Label(root, text="Ready")
+    status_label.pack()
+
+    progress_bar = ttk.Progressbar(root, length=200, maximum=100)
+    progress_bar.pack(pady=5)
+
+    cancel_button = tk.Button(root, text="Cancel", command=lambda: task_runner.cancel())
+    cancel_button.pack(pady=10)
+
+    task_runner = TaskRunner(root, on_progress=show_task_progress)
+    task_runner.poll()
+
+    def close():
+        task_runner.shutdown()
+        root.destroy()
+        if gui_profile is not None:
+            write_report(report_path, finish_profile(gui_profile))
+
+    root.protocol("WM_DELETE_WINDOW", close)
+
     show_initial_message()
 
     load_species_data()
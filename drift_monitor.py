@@ -0,0 +1,333 @@
+import argparse
+import csv
+import math
+import os
+import sqlite3
+import sys
+from datetime import datetime, timezone
+
+import numpy as np
+
+from results_store import file_hash, time_text
+from run_table import GLUCOSE_STANDARDS, read_run_table
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS monitor_runs (
+    id INTEGER PRIMARY KEY,
+    file_hash TEXT NOT NULL UNIQUE,
+    file_path TEXT NOT NULL,
+    instrument TEXT NOT NULL,
+    run_start TEXT,
+    n_standards INTEGER NOT NULL,
+    recorded_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS monitor_charts (
+    run_id INTEGER NOT NULL REFERENCES monitor_runs (id),
+    instrument TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    value REAL,
+    center REAL,
+    sigma REAL,
+    n INTEGER NOT NULL,
+    mean REAL NOT NULL,
+    m2 REAL NOT NULL,
+    ewma REAL,
+    cusum_high REAL NOT NULL,
+    cusum_low REAL NOT NULL,
+    flags TEXT NOT NULL,
+    PRIMARY KEY (run_id, metric)
+);
+CREATE INDEX IF NOT EXISTS monitor_charts_latest
+    ON monitor_charts (instrument, metric, run_id);
+"""
+
+# Metric name and the column of the standard peaks it averages.
+METRICS = {
+    "standard_mean": "Delta CRDS",
+    "standard_sd": "Delta CRDS",
+    "baseline_12co2": "12CO2 Baseline",
+    "baseline_13co2": "13CO2 Baseline",
+    "peak_co2": "Max 12CO2 (ppm)",
+}
+
+# The first baseline_runs runs of an instrument set the center and sigma of
+# its charts; the runs after them are checked against these limits.
+CHART_SETTINGS = {
+    "baseline_runs": 20,
+    "shewhart_limit": 3.0,
+    "ewma_lambda": 0.2,
+    "ewma_limit": 3.0,
+    "cusum_k": 0.5,
+    "cusum_h": 5.0,
+}
+
+CHART_STATE = ("n", "mean", "m2", "ewma", "cusum_high", "cusum_low")
+
+HISTORY_FIELDS = [
+    "file_path",
+    "instrument",
+    "run_start",
+    "metric",
+    "value",
+    "center",
+    "sigma",
+    "ewma",
+    "cusum_high",
+    "cusum_low",
+    "flags",
+]
+
+
+def connect(db_path):
+    connection = sqlite3.connect(db_path)
+    connection.execute("PRAGMA foreign_keys = ON")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def standard_metrics(table, n_standards=GLUCOSE_STANDARDS):
+    standards = {name: values[:n_standards] for name, values in table.items()}
+    metrics = {}
+    for metric, column in METRICS.items():
+        values = standards.get(column)
+        if values is None or len(values) == 0:
+            metrics[metric] = None
+        elif metric == "standard_sd":
+            metrics[metric] = float(values.std(ddof=1)) if len(values) > 1 else None
+        else:
+            metrics[metric] = float(values.mean())
+    return metrics
+
+
+def extract_standards(file_path, n_standards=GLUCOSE_STANDARDS):
+    try:
+        table = read_run_table(file_path)
+    except Exception as e:
+        return {"file": file_path, "error": f"{type(e).__name__}: {e}"}
+    if len(table.get("Delta CRDS", ())) == 0:
+        return {"file": file_path, "error": "The run has no glucose standard rows"}
+    times = table.get("Start Time", np.zeros(0, dtype="M8[s]"))
+    times = times[~np.isnat(times)]
+    return {
+        "file": file_path,
+        "run_start": time_text(times.min()) if len(times) else None,
+        "n_standards": min(n_standards, len(table["Delta CRDS"])),
+        "metrics": standard_metrics(table, n_standards),
+        "error": None,
+    }
+
+
+def chart_update(state, value, settings=CHART_SETTINGS):
+    # One step of the Shewhart, EWMA and two-sided CUSUM charts. Only the
+    # previous point's state is needed, so a new run costs O(1).
+    state = dict(
+        state or {"n": 0, "mean": 0.0, "m2": 0.0, "ewma": None},
+        center=None,
+        sigma=None,
+        flags=[],
+    )
+    state.setdefault("cusum_high", 0.0)
+    state.setdefault("cusum_low", 0.0)
+    if value is None or not math.isfinite(value):
+        return state
+    if state["n"] < settings["baseline_runs"]:
+        # Welford's update of the baseline mean and sum of squares.
+        state["n"] += 1
+        delta = value - state["mean"]
+        state["mean"] += delta / state["n"]
+        state["m2"] += delta * (value - state["mean"])
+        if state["n"] == settings["baseline_runs"]:
+            state["ewma"] = state["mean"]
+        return state
+
+    center = state["mean"]
+    sigma = math.sqrt(state["m2"] / (state["n"] - 1)) if state["n"] > 1 else 0.0
+    state["center"], state["sigma"] = center, sigma
+    lam = settings["ewma_lambda"]
+    state["ewma"] = lam * value + (1 - lam) * state["ewma"]
+    if sigma == 0:
+        # A metric that did not vary over the baseline has no scale: any
+        # change from it is an excursion.
+        if value != center:
+            state["flags"].append("shewhart")
+        return state
+    z = (value - center) / sigma
+    state["cusum_high"] = max(0.0, state["cusum_high"] + z - settings["cusum_k"])
+    state["cusum_low"] = max(0.0, state["cusum_low"] - z - settings["cusum_k"])
+    ewma_sigma = sigma * math.sqrt(lam / (2 - lam))
+    if abs(z) > settings["shewhart_limit"]:
+        state["flags"].append("shewhart")
+    if abs(state["ewma"] - center) > settings["ewma_limit"] * ewma_sigma:
+        state["flags"].append("ewma")
+    if state["cusum_high"] > settings["cusum_h"]:
+        state["flags"].append("cusum_high")
+    if state["cusum_low"] > settings["cusum_h"]:
+        state["flags"].append("cusum_low")
+    return state
+
+
+def latest_state(connection, instrument, metric):
+    row = connection.execute(
+        f"SELECT {', '.join(CHART_STATE)} FROM monitor_charts"
+        " WHERE instrument = ? AND metric = ? ORDER BY run_id DESC LIMIT 1",
+        (instrument, metric),
+    ).fetchone()
+    return None if row is None else dict(zip(CHART_STATE, row))
+
+
+def record_runs(db_path, file_paths, instrument=None, settings=None):
+    # Appends the standards of the new runs, oldest first, and extends each
+    # metric's charts from its latest stored point. Stored rows are never
+    # rewritten, so a run older than the stored ones is charted as it arrives.
+    settings = dict(CHART_SETTINGS, **(settings or {}))
+    instrument = instrument or ""
+    connection = connect(db_path)
+    try:
+        known = {
+            row[0] for row in connection.execute("SELECT file_hash FROM monitor_runs")
+        }
+        new_runs = []
+        skipped = []
+        failed = []
+        for path in file_paths:
+            digest = file_hash(path)
+            if digest in known:
+                skipped.append(path)
+                continue
+            known.add(digest)
+            run = extract_standards(path)
+            if run["error"]:
+                failed.append((path, run["error"]))
+            else:
+                new_runs.append((digest, run))
+        new_runs.sort(
+            key=lambda item: (
+                item[1]["run_start"] is None,
+                item[1]["run_start"] or "",
+                item[1]["file"],
+            )
+        )
+
+        recorded = []
+        recorded_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        states = {
+            metric: latest_state(connection, instrument, metric) for metric in METRICS
+        }
+        with connection:
+            for digest, run in new_runs:
+                cursor = connection.execute(
+                    "INSERT INTO monitor_runs (file_hash, file_path, instrument,"
+                    " run_start, n_standards, recorded_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        digest,
+                        os.path.abspath(run["file"]),
+                        instrument,
+                        run["run_start"],
+                        run["n_standards"],
+                        recorded_at,
+                    ),
+                )
+                excursions = []
+                for metric, value in run["metrics"].items():
+                    state = chart_update(states[metric], value, settings)
+                    states[metric] = state
+                    connection.execute(
+                        "INSERT INTO monitor_charts (run_id, instrument, metric, value,"
+                        " center, sigma, n, mean, m2, ewma, cusum_high, cusum_low, flags)"
+                        " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (
+                            cursor.lastrowid,
+                            instrument,
+                            metric,
+                            value,
+                            state["center"],
+                            state["sigma"],
+                        )
+                        + tuple(state[key] for key in CHART_STATE)
+                        + (",".join(state["flags"]),),
+                    )
+                    if state["flags"]:
+                        excursions.append((metric, state["flags"]))
+                recorded.append((run["file"], excursions))
+    finally:
+        connection.close()
+    return {"recorded": recorded, "skipped": skipped, "failed": failed}
+
+
+def drift_history(db_path, instrument=None, metrics=None):
+    conditions = []
+    parameters = []
+    if instrument is not None:
+        conditions.append("monitor_charts.instrument = ?")
+        parameters.append(instrument)
+    if metrics:
+        conditions.append(f"metric IN ({', '.join('?' for _ in metrics)})")
+        parameters += list(metrics)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    columns = [
+        field if field in ("file_path", "run_start") else f"monitor_charts.{field}"
+        for field in HISTORY_FIELDS
+    ]
+    connection = connect(db_path)
+    try:
+        cursor = connection.execute(
+            f"SELECT {', '.join(columns)} FROM monitor_charts"
+            f" JOIN monitor_runs ON monitor_runs.id = monitor_charts.run_id {where}"
+            " ORDER BY monitor_charts.instrument, metric, run_id",
+            parameters,
+        )
+        return [dict(zip(HISTORY_FIELDS, row)) for row in cursor]
+    finally:
+        connection.close()
+
+
+def format_excursions(path, excursions):
+    return f"Drift: {path}: " + "; ".join(
+        f"{metric} ({', '.join(flags)})" for metric, flags in excursions
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Record glucose standards and chart the instrument drift."
+    )
+    parser.add_argument("db", help="SQLite monitoring store")
+    parser.add_argument("inputs", nargs="*", help="Run files to record")
+    parser.add_argument("--instrument", default=None)
+    parser.add_argument(
+        "--metrics",
+        nargs="+",
+        choices=list(METRICS),
+        default=None,
+        help="Metrics exported and plotted, all by default",
+    )
+    parser.add_argument("--plot", default=None, help="Render the control charts here")
+    args = parser.parse_args(argv)
+
+    if not args.inputs and not os.path.exists(args.db):
+        print(f"Monitoring store '{args.db}' not found.", file=sys.stderr)
+        return 1
+    failed = []
+    if args.inputs:
+        result = record_runs(args.db, args.inputs, instrument=args.instrument)
+        failed = result["failed"]
+        for path, excursions in result["recorded"]:
+            if excursions:
+                print(format_excursions(path, excursions), file=sys.stderr)
+        for path, error in failed:
+            print(f"Failed: {path}: {error}", file=sys.stderr)
+    history = drift_history(args.db, args.instrument, args.metrics)
+    if args.plot:
+        from plot_render import render_drift_plot
+
+        render_drift_plot(
+            args.plot, history, args.metrics, CHART_SETTINGS["shewhart_limit"]
+        )
+    csv_writer = csv.DictWriter(sys.stdout, fieldnames=HISTORY_FIELDS)
+    csv_writer.writeheader()
+    csv_writer.writerows(history)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
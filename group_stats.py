@@ -0,0 +1,183 @@
+import numpy as np
+
+from run_table import group_statistics
+
+# scipy.stats takes about a second to import, so it is imported by the
+# functions that run the tests rather than when the module loads.
+
+POSTHOC_TESTS = ("welch", "tukey")
+# studentized_range.sf integrates numerically, so p-values for every pair of
+# hundreds of groups would take minutes; past this the critical q is used.
+TUKEY_PVALUE_PAIRS = 200
+REPORT_PAIRS = 45
+
+
+def split_groups(values, inverse, counts):
+    order = np.argsort(inverse, kind="stable")
+    return np.split(values[order], np.cumsum(counts)[:-1])
+
+
+def welch_pairs(groups):
+    from scipy.stats import t as t_distribution
+
+    n, mean = groups["n"], groups["mean"]
+    variance_of_mean = groups["stdev"] ** 2 / n
+    a, b = np.triu_indices(len(n), 1)
+    se2 = variance_of_mean[a] + variance_of_mean[b]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        statistic = (mean[a] - mean[b]) / np.sqrt(se2)
+        df = se2**2 / (
+            variance_of_mean[a] ** 2 / (n[a] - 1)
+            + variance_of_mean[b] ** 2 / (n[b] - 1)
+        )
+    return {
+        "group_a": groups["group"][a],
+        "group_b": groups["group"][b],
+        "statistic": statistic,
+        "df": df,
+        "pvalue": 2 * t_distribution.sf(np.abs(statistic), df),
+    }
+
+
+def tukey_hsd_pairs(groups, alpha=0.05):
+    from scipy.stats import studentized_range
+
+    n, mean, stdev = groups["n"], groups["mean"], groups["stdev"]
+    k = len(n)
+    df = int(n.sum()) - k
+    within = np.nansum((n - 1) * stdev**2) / df
+    a, b = np.triu_indices(k, 1)
+    difference = mean[a] - mean[b]
+    se = np.sqrt(within / 2 * (1 / n[a] + 1 / n[b]))
+    q = np.abs(difference) / se
+    q_critical = float(studentized_range.ppf(1 - alpha, k, df))
+    if len(q) <= TUKEY_PVALUE_PAIRS:
+        pvalue = studentized_range.sf(q, k, df)
+    else:
+        pvalue = np.full(len(q), np.nan)
+    return {
+        "group_a": groups["group"][a],
+        "group_b": groups["group"][b],
+        "difference": difference,
+        "q": q,
+        "q_critical": q_critical,
+        "lower": difference - q_critical * se,
+        "upper": difference + q_critical * se,
+        "reject": q > q_critical,
+        "pvalue": pvalue,
+        "alpha": alpha,
+    }
+
+
+def analyze_groups(values, labels, posthoc=POSTHOC_TESTS, alpha=0.05):
+    from scipy.stats import f_oneway, kruskal, ttest_ind
+
+    values = np.asarray(values, dtype=np.float64)
+    labels = np.asarray(labels)
+    groups = group_statistics(values, labels)
+    _, inverse = np.unique(labels, return_inverse=True)
+    k = len(groups["group"])
+
+    result = {
+        "groups": groups,
+        "t_test": None,
+        "anova": None,
+        "kruskal": None,
+        "welch": None,
+        "tukey_hsd": None,
+    }
+    if k < 2:
+        return result
+
+    samples = split_groups(values, inverse, groups["n"])
+    if k == 2:
+        statistic, pvalue = ttest_ind(samples[0], samples[1])
+        result["t_test"] = {"statistic": statistic, "pvalue": pvalue}
+    else:
+        statistic, pvalue = f_oneway(*samples)
+        result["anova"] = {"statistic": statistic, "pvalue": pvalue}
+    if len(np.unique(values)) > 1:
+        statistic, pvalue = kruskal(*samples)
+        result["kruskal"] = {"statistic": statistic, "pvalue": pvalue}
+
+    if "welch" in posthoc:
+        result["welch"] = welch_pairs(groups)
+    if "tukey" in posthoc and int(groups["n"].sum()) > k:
+        result["tukey_hsd"] = tukey_hsd_pairs(groups, alpha)
+    return result
+
+
+def format_report(result):
+    groups = result["groups"]
+    report = [
+        f"Group {group}: Mean = {mean:.3f}, Standard Deviation = {stdev:.3f}, "
+        f"Median = {median:.3f}"
+        for group, mean, stdev, median in zip(
+            groups["group"].tolist(),
+            groups["mean"].tolist(),
+            groups["stdev"].tolist(),
+            groups["median"].tolist(),
+        )
+    ]
+    if result["t_test"]:
+        report.append(
+            f"T-Test: T-statistic = {result['t_test']['statistic']}, "
+            f"P-value = {result['t_test']['pvalue']}"
+        )
+    elif result["anova"]:
+        report.append(
+            f"ANOVA: F-statistic = {result['anova']['statistic']}, "
+            f"P-value = {result['anova']['pvalue']}"
+        )
+    else:
+        report.append("Only one group found. No t-test or ANOVA performed.")
+    return "\n".join(report)
+
+
+def format_posthoc(result):
+    report = []
+    if result["kruskal"]:
+        report.append(
+            f"Kruskal-Wallis: H-statistic = {result['kruskal']['statistic']:.4f}, "
+            f"P-value = {result['kruskal']['pvalue']:.4g}"
+        )
+    welch = result["welch"]
+    if welch is not None:
+        if len(welch["pvalue"]) <= REPORT_PAIRS:
+            for a, b, statistic, pvalue in zip(
+                welch["group_a"].tolist(),
+                welch["group_b"].tolist(),
+                welch["statistic"].tolist(),
+                welch["pvalue"].tolist(),
+            ):
+                report.append(
+                    f"Welch t-test {a} vs {b}: T-statistic = {statistic:.4f}, "
+                    f"P-value = {pvalue:.4g}"
+                )
+        else:
+            significant = int(np.sum(welch["pvalue"] < 0.05))
+            report.append(
+                f"Welch t-test: {significant} of {len(welch['pvalue'])} pairs "
+                f"with P-value < 0.05"
+            )
+    tukey = result["tukey_hsd"]
+    if tukey is not None:
+        if len(tukey["q"]) <= REPORT_PAIRS:
+            for a, b, difference, lower, upper, reject in zip(
+                tukey["group_a"].tolist(),
+                tukey["group_b"].tolist(),
+                tukey["difference"].tolist(),
+                tukey["lower"].tolist(),
+                tukey["upper"].tolist(),
+                tukey["reject"].tolist(),
+            ):
+                report.append(
+                    f"Tukey HSD {a} vs {b}: Difference = {difference:.3f} "
+                    f"[{lower:.3f}, {upper:.3f}]" + (", significant" if reject else "")
+                )
+        else:
+            report.append(
+                f"Tukey HSD: {int(tukey['reject'].sum())} of {len(tukey['q'])} "
+                f"pairs differ at alpha = {tukey['alpha']}"
+            )
+    return "\n".join(report)
@@ -0,0 +1,96 @@
+import itertools
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class TaskCancelled(Exception):
+    pass
+
+
+class TaskContext:
+    def __init__(self, task_id=None, events=None, cancel_event=None):
+        self.task_id = task_id
+        self.events = events
+        self.cancel_event = cancel_event or threading.Event()
+
+    def progress(self, fraction, message=""):
+        if self.events is not None:
+            self.events.put((self.task_id, "progress", (fraction, message)))
+
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise TaskCancelled()
+
+
+class TaskRunner:
+    # Work runs on the executor; every callback runs on the Tk thread when
+    # poll() drains the event queue, since Tk widgets are not thread-safe.
+    def __init__(self, root=None, max_workers=2, poll_interval=50, on_progress=None):
+        self.root = root
+        self.poll_interval = poll_interval
+        self.on_progress = on_progress
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.events = queue.Queue()
+        self.tasks = {}
+        self.ids = itertools.count(1)
+
+    def submit(self, func, *args, on_done=None, on_error=None, **kwargs):
+        task_id = next(self.ids)
+        context = TaskContext(task_id, self.events)
+        self.tasks[task_id] = (context, on_done, on_error)
+        self.executor.submit(self.run, context, func, args, kwargs)
+        return task_id
+
+    def run(self, context, func, args, kwargs):
+        try:
+            context.check_cancelled()
+            result = func(*args, task=context, **kwargs)
+            context.check_cancelled()
+        except BaseException as e:
+            self.events.put((context.task_id, "error", e))
+        else:
+            self.events.put((context.task_id, "done", result))
+
+    def cancel(self, task_id=None):
+        task_ids = list(self.tasks) if task_id is None else [task_id]
+        for task_id in task_ids:
+            if task_id in self.tasks:
+                self.tasks[task_id][0].cancel_event.set()
+
+    def busy(self):
+        return bool(self.tasks)
+
+    def process_events(self):
+        while True:
+            try:
+                task_id, kind, payload = self.events.get_nowait()
+            except queue.Empty:
+                return
+            if kind == "progress":
+                if self.on_progress and task_id in self.tasks:
+                    self.on_progress(task_id, *payload)
+                continue
+            context, on_done, on_error = self.tasks.pop(task_id, (None, None, None))
+            if kind == "done" and on_done:
+                on_done(payload)
+            elif kind == "error" and on_error:
+                on_error(payload)
+            if self.on_progress and not self.tasks:
+                self.on_progress(
+                    None,
+                    1.0,
+                    "Cancelled" if context and context.cancelled() else "Ready",
+                )
+
+    def poll(self):
+        self.process_events()
+        if self.root is not None:
+            self.root.after(self.poll_interval, self.poll)
+
+    def shutdown(self):
+        self.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)
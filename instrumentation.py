@@ -0,0 +1,192 @@
+import cProfile
+import json
+import os
+import pstats
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
+from functools import wraps
+
+PROFILE_ENV = "PICARRO_PROFILE"
+CAPTURE_ENV = "PICARRO_PROFILE_CAPTURE"
+CAPTURES = ("cprofile", "tracemalloc")
+TOP_FUNCTIONS = 25
+TOP_ALLOCATIONS = 10
+
+# The profile being recorded in this process, or None. Every hook checks it
+# first, so instrumentation that is off costs one global lookup per stage.
+active = None
+OFF = nullcontext()
+
+
+def profile_settings(report_path=None, captures=None):
+    # The command line wins over the environment, so a production run can be
+    # profiled by setting PICARRO_PROFILE without touching its command.
+    report_path = report_path or os.environ.get(PROFILE_ENV) or None
+    if captures is None:
+        captures = [
+            capture.strip()
+            for capture in os.environ.get(CAPTURE_ENV, "").split(",")
+            if capture.strip()
+        ]
+    unknown = set(captures) - set(CAPTURES)
+    if unknown:
+        raise ValueError(f"Unknown profile captures: {', '.join(sorted(unknown))}")
+    return report_path, tuple(captures)
+
+
+def current_profile():
+    return active
+
+
+def forget_inherited_profile():
+    # A forked worker inherits the parent's profile with its cProfile hook
+    # and traces; it drops them and profiles its own work from scratch.
+    global active
+    profile = active
+    active = None
+    while profile is not None:
+        if "profiler" in profile:
+            profile["profiler"].disable()
+        if profile.get("was_tracing") is False and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        profile = profile["outer"]
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=forget_inherited_profile)
+
+
+def start_profile(label, captures=()):
+    global active
+    profile = {
+        "label": label,
+        "outer": active,
+        "captures": tuple(captures),
+        "started": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "start": time.perf_counter(),
+        "stages": {},
+        "runs": [],
+    }
+    if "tracemalloc" in captures:
+        # A profile nested in a traced one only resets the peak.
+        profile["was_tracing"] = tracemalloc.is_tracing()
+        if profile["was_tracing"]:
+            tracemalloc.reset_peak()
+        else:
+            tracemalloc.start()
+    # Only one cProfile profiler can hook a thread, so nested profiles
+    # leave it to the outer one.
+    outer = active
+    while outer is not None and "profiler" not in outer:
+        outer = outer["outer"]
+    if "cprofile" in captures and outer is None:
+        profile["profiler"] = cProfile.Profile()
+        profile["profiler"].enable()
+    active = profile
+    return profile
+
+
+def top_functions(profiler, limit=TOP_FUNCTIONS):
+    stats = pstats.Stats(profiler).stats
+    rows = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:limit]
+    return [
+        {
+            "function": f"{file}:{line}({name})",
+            "calls": calls,
+            "primitive_calls": primitive_calls,
+            "total_seconds": total,
+            "cumulative_seconds": cumulative,
+        }
+        for (file, line, name), (primitive_calls, calls, total, cumulative, _) in rows
+    ]
+
+
+def finish_profile(profile):
+    global active
+    wall_seconds = time.perf_counter() - profile["start"]
+    report = {
+        "label": profile["label"],
+        "started": profile["started"],
+        "pid": os.getpid(),
+        "wall_seconds": wall_seconds,
+        "captures": list(profile["captures"]),
+        "stages": profile["stages"],
+    }
+    if "profiler" in profile:
+        profile["profiler"].disable()
+        report["cprofile"] = top_functions(profile["profiler"])
+    if "tracemalloc" in profile["captures"]:
+        _, peak = tracemalloc.get_traced_memory()
+        statistics = tracemalloc.take_snapshot().statistics("lineno")
+        report["tracemalloc"] = {
+            "peak_bytes": peak,
+            "top_allocations": [
+                {"location": str(stat.traceback[0]), "bytes": stat.size}
+                for stat in statistics[:TOP_ALLOCATIONS]
+            ],
+        }
+        if not profile["was_tracing"]:
+            tracemalloc.stop()
+    if profile["runs"]:
+        report["runs"] = profile["runs"]
+    active = profile["outer"]
+    return report
+
+
+def stage_entry(profile, name):
+    return profile["stages"].setdefault(name, {"calls": 0, "seconds": 0.0, "rows": 0})
+
+
+@contextmanager
+def timed_stage(profile, name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        entry = stage_entry(profile, name)
+        entry["calls"] += 1
+        entry["seconds"] += time.perf_counter() - start
+
+
+def stage(name):
+    if active is None:
+        return OFF
+    return timed_stage(active, name)
+
+
+def count_rows(name, rows):
+    if active is not None:
+        stage_entry(active, name)["rows"] += int(rows)
+
+
+def timed(name):
+    def decorate(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if active is None:
+                return func(*args, **kwargs)
+            with timed_stage(active, name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def run_profiled(label, captures, func, *args):
+    # Runs func(*args) under its own profile, in a worker process or inline,
+    # and returns its result with the profile report.
+    profile = start_profile(label, captures)
+    try:
+        result = func(*args)
+    finally:
+        report = finish_profile(profile)
+    return result, report
+
+
+def write_report(file_path, report):
+    with open(file_path, mode="w") as file:
+        json.dump(report, file, indent=2, default=float)
+        file.write("\n")
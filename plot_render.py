@@ -0,0 +1,181 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+PLOT_FORMATS = ("png", "svg", "pdf")
+
+
+def group_members(group):
+    if group and isinstance(group[0], tuple):
+        return [entry[0] for entry in group]
+    return list(group)
+
+
+def draw_adjusted_data(
+    ax,
+    adjusted_values,
+    species_d13c_value=None,
+    group_data=None,
+    sample_names=None,
+    title="Leaf Delta 13C",
+):
+    sample_ids = [val[0] for val in adjusted_values]
+    adjusted_deltas = [val[1] for val in adjusted_values]
+    if sample_names is None:
+        sample_names = sample_ids
+
+    positions = np.arange(len(sample_names))
+    bars = ax.bar(positions, adjusted_deltas)
+
+    ax.set_xlabel("Sample")
+    ax.set_ylabel("Delta 13C")
+    ax.set_title(title)
+
+    ax.set_xticks(positions)
+    ax.set_xticklabels(sample_names, rotation=45, ha="right")
+
+    if species_d13c_value and any(species_d13c_value.values()):
+        for species, value in species_d13c_value.items():
+            if value is not None:
+                ax.axhline(
+                    y=value,
+                    color="black",
+                    linestyle="--",
+                    label=f"{value} ({species} leaf delta\n13C literature value)",
+                )
+        ax.legend(bbox_to_anchor=(1.05, 1), loc="upper left")
+
+    if group_data:
+        from matplotlib import colormaps
+
+        cmap = colormaps["tab10"]
+        colors = [cmap(i) for i in range(cmap.N)]
+        index = {sample_id: i for i, sample_id in enumerate(sample_ids)}
+        for i, group in enumerate(group_data.values()):
+            color = colors[(i + 1) % len(colors)]
+            for sample_id in group_members(group):
+                if sample_id in index:
+                    bars[index[sample_id]].set_color(color)
+    return bars
+
+
+def render_adjusted_plot(
+    output_path,
+    adjusted_values,
+    species_d13c_value=None,
+    group_data=None,
+    sample_names=None,
+    title="Leaf Delta 13C",
+):
+    # A bare Figure renders through Agg/SVG/PDF canvases without pyplot, so
+    # no display or interactive backend is touched.
+    from matplotlib.figure import Figure
+
+    figure = Figure(figsize=(10, 6))
+    ax = figure.add_subplot()
+    draw_adjusted_data(
+        ax, adjusted_values, species_d13c_value, group_data, sample_names, title
+    )
+    figure.tight_layout()
+    figure.savefig(output_path)
+    return output_path
+
+
+def render_plot_job(job):
+    try:
+        return render_adjusted_plot(**job), None
+    except Exception as e:
+        return job["output_path"], f"{type(e).__name__}: {e}"
+
+
+def render_plots(jobs, workers=None):
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(render_plot_job, job): i for i, job in enumerate(jobs)
+        }
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                results[i] = future.result()
+            except Exception as e:
+                results[i] = (jobs[i]["output_path"], f"{type(e).__name__}: {e}")
+    return [results[i] for i in range(len(jobs))]
+
+
+def plot_path(output_dir, run_path, plot_format="png"):
+    name = os.path.splitext(os.path.basename(run_path))[0]
+    return os.path.join(output_dir, f"{name}.{plot_format}")
+
+
+def plot_paths(output_dir, run_paths, plot_format="png"):
+    # Runs named alike in different directories (day1/run.csv, day2/run.csv)
+    # are named after their path below the directory they share
+    # (day1_run.png, day2_run.png), so no plot overwrites another.
+    by_name = {}
+    for run_path in run_paths:
+        by_name.setdefault(plot_path(output_dir, run_path, plot_format), []).append(
+            run_path
+        )
+    paths = {}
+    for name, same in by_name.items():
+        if len(same) == 1:
+            paths[same[0]] = name
+            continue
+        common = os.path.commonpath([os.path.abspath(path) for path in same])
+        for run_path in same:
+            relative = os.path.relpath(os.path.abspath(run_path), common)
+            paths[run_path] = plot_path(
+                output_dir, relative.replace(os.sep, "_"), plot_format
+            )
+    # A flattened name can still meet another run's name; number the rest.
+    taken = set()
+    for run_path in run_paths:
+        path = paths[run_path]
+        stem, extension = os.path.splitext(path)
+        number = 2
+        while path in taken:
+            path = f"{stem}_{number}{extension}"
+            number += 1
+        taken.add(path)
+        paths[run_path] = path
+    return [paths[run_path] for run_path in run_paths]
+
+
+def render_drift_plot(output_path, history, metrics=None, limit=3.0):
+    # One control chart per instrument and metric of the drift monitor: the
+    # run values, the EWMA, the baseline center with its limits and the
+    # flagged runs.
+    from matplotlib.figure import Figure
+
+    charts = {}
+    for row in history:
+        if metrics is None or row["metric"] in metrics:
+            charts.setdefault((row["instrument"], row["metric"]), []).append(row)
+    figure = Figure(figsize=(10, 3 * max(len(charts), 1)))
+    for number, ((instrument, metric), rows) in enumerate(charts.items(), 1):
+        ax = figure.add_subplot(len(charts), 1, number)
+        runs = np.arange(1, len(rows) + 1)
+
+        def column(key):
+            return np.array(
+                [np.nan if row[key] is None else row[key] for row in rows], dtype=float
+            )
+
+        values, center, sigma = column("value"), column("center"), column("sigma")
+        flagged = np.array([bool(row["flags"]) for row in rows])
+        ax.plot(runs, values, marker="o", color="tab:blue", label=metric)
+        ax.plot(runs, column("ewma"), color="tab:orange", label="EWMA")
+        ax.plot(runs, center, color="black", linewidth=1, label="center")
+        for side in (-1, 1):
+            ax.plot(runs, center + side * limit * sigma, color="gray", linestyle="--")
+        ax.scatter(
+            runs[flagged], values[flagged], color="red", zorder=3, label="flagged"
+        )
+        ax.set_title(f"{instrument} {metric}".strip())
+        ax.set_xlabel("Run")
+        ax.legend(loc="best", fontsize="small")
+    figure.tight_layout()
+    figure.savefig(output_path)
+    return output_path
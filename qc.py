@@ -0,0 +1,129 @@
+import json
+
+import numpy as np
+
+VPDB_RATIO = 0.0111802
+
+QC_LIMITS = {
+    "min_co2_ppm": 1000.0,
+    "max_co2_ppm": 6000.0,
+    "max_12co2_baseline": 20.0,
+    "max_13co2_baseline": 0.25,
+    "min_data_points": 300,
+    "max_ratio_residual": 1.0,
+}
+
+QC_REPORT_FIELDS = [
+    "file",
+    "row",
+    "Sample Id",
+    "Peak Number",
+    "Max 12CO2 (ppm)",
+    "12CO2 Baseline",
+    "13CO2 Baseline",
+    "Number of data points",
+    "integral residual",
+    "reasons",
+]
+
+QC_CHECKS = (
+    "co2_range",
+    "baseline_12co2",
+    "baseline_13co2",
+    "data_points",
+    "ratio_mismatch",
+)
+
+
+def load_qc_limits(file_path):
+    with open(file_path, mode="r") as file:
+        limits = json.load(file)
+    unknown = set(limits) - set(QC_LIMITS)
+    if unknown:
+        raise ValueError(f"Unknown QC limits: {', '.join(sorted(unknown))}")
+    return dict(QC_LIMITS, **limits)
+
+
+def integral_delta(table):
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ratio = table["13CO2 Integral"] / table["12CO2 Integral"]
+    return (ratio / VPDB_RATIO - 1) * 1000
+
+
+def quality_flags(table, limits=None):
+    limits = dict(QC_LIMITS, **(limits or {}))
+    flags = {}
+    # Comparisons are written so that a missing (NaN) value fails the check.
+    if "Max 12CO2 (ppm)" in table:
+        co2 = table["Max 12CO2 (ppm)"]
+        flags["co2_range"] = ~(
+            (co2 >= limits["min_co2_ppm"]) & (co2 <= limits["max_co2_ppm"])
+        )
+    if "12CO2 Baseline" in table:
+        flags["baseline_12co2"] = ~(
+            table["12CO2 Baseline"] <= limits["max_12co2_baseline"]
+        )
+    if "13CO2 Baseline" in table:
+        flags["baseline_13co2"] = ~(
+            table["13CO2 Baseline"] <= limits["max_13co2_baseline"]
+        )
+    if "Number of data points" in table:
+        flags["data_points"] = ~(
+            table["Number of data points"] >= limits["min_data_points"]
+        )
+    if "12CO2 Integral" in table and "13CO2 Integral" in table:
+        # The integrals are not on the VPDB scale, so only the spread of the
+        # offset between reported and integral-derived delta is checked.
+        residual = table["Delta CRDS"] - integral_delta(table)
+        offset = np.nanmedian(residual) if np.isfinite(residual).any() else 0.0
+        flags["ratio_mismatch"] = ~(
+            np.abs(residual - offset) <= limits["max_ratio_residual"]
+        )
+    return flags
+
+
+def failed_rows(flags, n_rows):
+    failed = np.zeros(n_rows, dtype=bool)
+    for flag in flags.values():
+        failed |= flag
+    return failed
+
+
+def flag_reasons(flags, n_rows):
+    reasons = [[] for _ in range(n_rows)]
+    for check in QC_CHECKS:
+        if check in flags:
+            for i in np.flatnonzero(flags[check]).tolist():
+                reasons[i].append(check)
+    return [";".join(row) for row in reasons]
+
+
+def qc_summary(flags, n_rows):
+    summary = {check: int(flag.sum()) for check, flag in flags.items()}
+    summary["failed"] = int(failed_rows(flags, n_rows).sum())
+    summary["rows"] = n_rows
+    return summary
+
+
+def qc_report_rows(table, flags, file_path=""):
+    n_rows = len(table["Delta CRDS"])
+    reasons = flag_reasons(flags, n_rows)
+    residual = None
+    if "12CO2 Integral" in table and "13CO2 Integral" in table:
+        residual = table["Delta CRDS"] - integral_delta(table)
+    rows = []
+    for i in np.flatnonzero(failed_rows(flags, n_rows)).tolist():
+        row = {"file": file_path, "row": i + 1, "Sample Id": table["Sample Id"][i]}
+        # Columns missing from the run are left blank in the report.
+        for column in (
+            "Peak Number",
+            "Max 12CO2 (ppm)",
+            "12CO2 Baseline",
+            "13CO2 Baseline",
+            "Number of data points",
+        ):
+            row[column] = table[column][i] if column in table else ""
+        row["integral residual"] = "" if residual is None else residual[i]
+        row["reasons"] = reasons[i]
+        rows.append(row)
+    return rows
@@ -0,0 +1,195 @@
+import numpy as np
+
+REJECTION_RULES = ("drop_first", "mad", "grubbs")
+MAD_THRESHOLD = 3.5
+GRUBBS_ALPHA = 0.05
+REPLICATE_FIELDS = [
+    "file",
+    "Sample Id",
+    "Peak Number",
+    "Adjusted Delta",
+    "sd",
+    "n",
+    "n_rejected",
+]
+
+
+def replicate_groups(sample_ids, peaks=None, files=None):
+    n_rows = len(sample_ids)
+    sample_ids = np.asarray(sample_ids).astype(str)
+    files = np.full(n_rows, "") if files is None else np.asarray(files).astype(str)
+    peaks = np.ones(n_rows, dtype=np.int64) if peaks is None else np.asarray(peaks)
+    if n_rows == 0:
+        return {"file": files, "id": sample_ids, "peak": peaks}, np.empty(0, int)
+    codes = np.column_stack(
+        [
+            np.unique(files, return_inverse=True)[1],
+            np.unique(sample_ids, return_inverse=True)[1],
+            peaks,
+        ]
+    )
+    _, first, inverse = np.unique(codes, axis=0, return_index=True, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    # Renumber the groups in order of first appearance, as in the run.
+    order = np.argsort(first, kind="stable")
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    first = first[order]
+    keys = {"file": files[first], "id": sample_ids[first], "peak": peaks[first]}
+    return keys, rank[inverse]
+
+
+def injection_rank(inverse):
+    order = np.argsort(inverse, kind="stable")
+    counts = np.bincount(inverse)
+    starts = np.cumsum(counts) - counts
+    rank = np.empty(len(inverse), dtype=np.int64)
+    rank[order] = np.arange(len(inverse)) - np.repeat(starts, counts)
+    return rank
+
+
+def group_median(values, inverse, n_groups):
+    counts = np.bincount(inverse, minlength=n_groups)
+    median = np.full(n_groups, np.nan)
+    present = counts > 0
+    ordered = values[np.lexsort((values, inverse))]
+    starts = (np.cumsum(counts) - counts)[present]
+    n = counts[present]
+    median[present] = (ordered[starts + (n - 1) // 2] + ordered[starts + n // 2]) / 2
+    return median
+
+
+def group_moments(values, inverse, n_groups):
+    counts = np.bincount(inverse, minlength=n_groups)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.bincount(inverse, weights=values, minlength=n_groups) / counts
+        squares = np.bincount(
+            inverse, weights=(values - mean[inverse]) ** 2, minlength=n_groups
+        )
+        sd = np.sqrt(squares / (counts - 1))
+    return counts, mean, sd
+
+
+def mad_outliers(values, inverse, kept, n_groups, threshold=MAD_THRESHOLD):
+    rows = np.flatnonzero(kept)
+    median = group_median(values[rows], inverse[rows], n_groups)
+    deviation = np.abs(values - median[inverse])
+    mad = group_median(deviation[rows], inverse[rows], n_groups)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        score = 0.6745 * deviation / mad[inverse]
+    # A zero MAD (identical replicates) gives inf or nan and rejects nothing.
+    return kept & np.isfinite(score) & (score > threshold)
+
+
+def grubbs_critical(n, alpha=GRUBBS_ALPHA):
+    from scipy.stats import t as t_distribution
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        t = t_distribution.ppf(1 - alpha / (2 * n), n - 2)
+        return (n - 1) / np.sqrt(n) * np.sqrt(t**2 / (n - 2 + t**2))
+
+
+def grubbs_outliers(values, inverse, kept, n_groups, alpha=GRUBBS_ALPHA):
+    rejected = np.zeros(len(values), dtype=bool)
+    while True:
+        # One pass removes the most extreme value of every group that still
+        # fails the test; groups are tested together on each pass.
+        active = kept & ~rejected
+        rows = np.flatnonzero(active)
+        counts, mean, sd = group_moments(values[rows], inverse[rows], n_groups)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            g = np.abs(values - mean[inverse]) / sd[inverse]
+        g[~active] = -np.inf
+        order = np.lexsort((-g, inverse))
+        candidates = order[np.flatnonzero(np.diff(inverse[order], prepend=-1))]
+        candidates = candidates[counts[inverse[candidates]] >= 3]
+        critical = grubbs_critical(counts[inverse[candidates]], alpha)
+        outliers = candidates[g[candidates] > critical]
+        if len(outliers) == 0:
+            return rejected
+        rejected[outliers] = True
+
+
+def reject_outliers(
+    values, inverse, rules=(), threshold=MAD_THRESHOLD, alpha=GRUBBS_ALPHA
+):
+    values = np.asarray(values, dtype=np.float64)
+    n_groups = int(inverse.max()) + 1 if len(inverse) else 0
+    rejected = np.zeros(len(values), dtype=bool)
+    for rule in rules:
+        if rule not in REJECTION_RULES:
+            raise ValueError(f"Unknown outlier rule '{rule}'")
+        kept = ~rejected
+        if rule == "drop_first":
+            # Memory effect: the first injection carries over the previous
+            # sample, but a sample injected only once is kept.
+            counts = np.bincount(inverse[kept], minlength=n_groups)
+            rank = np.full(len(values), -1)
+            rank[kept] = injection_rank(inverse[kept])
+            rejected |= (rank == 0) & (counts[inverse] > 1)
+        elif rule == "mad":
+            rejected |= mad_outliers(values, inverse, kept, n_groups, threshold)
+        else:
+            rejected |= grubbs_outliers(values, inverse, kept, n_groups, alpha)
+    return rejected
+
+
+def aggregate_replicates(
+    values,
+    sample_ids,
+    peaks=None,
+    files=None,
+    rules=(),
+    threshold=MAD_THRESHOLD,
+    alpha=GRUBBS_ALPHA,
+):
+    values = np.asarray(values, dtype=np.float64)
+    keys, inverse = replicate_groups(sample_ids, peaks, files)
+    rejected = reject_outliers(values, inverse, rules, threshold, alpha)
+    kept = np.flatnonzero(~rejected)
+    n_groups = len(keys["id"])
+    n, mean, sd = group_moments(values[kept], inverse[kept], n_groups)
+    return {
+        "file": keys["file"],
+        "Sample Id": keys["id"],
+        "Peak Number": keys["peak"],
+        "mean": mean,
+        "sd": sd,
+        "n": n,
+        "n_rejected": np.bincount(inverse[rejected], minlength=n_groups),
+        "rejected": rejected,
+    }
+
+
+def replicate_rows(aggregate):
+    return [
+        {
+            "file": str(aggregate["file"][i]),
+            "Sample Id": str(aggregate["Sample Id"][i]),
+            "Peak Number": int(aggregate["Peak Number"][i]),
+            "Adjusted Delta": float(aggregate["mean"][i]),
+            "sd": "" if np.isnan(aggregate["sd"][i]) else float(aggregate["sd"][i]),
+            "n": int(aggregate["n"][i]),
+            "n_rejected": int(aggregate["n_rejected"][i]),
+        }
+        for i in range(len(aggregate["mean"]))
+        if aggregate["n"][i]
+    ]
+
+
+def collapse_replicates(adjusted_values, peaks=None, rules=()):
+    aggregate = aggregate_replicates(
+        [value for _, value in adjusted_values],
+        [sample_id for sample_id, _ in adjusted_values],
+        peaks,
+        rules=rules,
+    )
+    return [
+        (sample_id, mean)
+        for sample_id, mean, n in zip(
+            aggregate["Sample Id"].tolist(),
+            aggregate["mean"].tolist(),
+            aggregate["n"].tolist(),
+        )
+        if n
+    ]
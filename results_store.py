@@ -0,0 +1,268 @@
+import argparse
+import csv
+import hashlib
+import os
+import sqlite3
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timezone
+
+import numpy as np
+
+from calibration import DEFAULT_CALIBRATION, calibrate_run, describe_calibration
+from run_table import read_run_table
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    file_hash TEXT NOT NULL UNIQUE,
+    file_path TEXT NOT NULL,
+    instrument TEXT,
+    run_start TEXT,
+    run_end TEXT,
+    n_samples INTEGER NOT NULL,
+    calibration TEXT,
+    ingested_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS results (
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    sample_id TEXT NOT NULL,
+    peak INTEGER NOT NULL,
+    injection INTEGER NOT NULL,
+    start_time TEXT,
+    delta_raw REAL NOT NULL,
+    adjusted_delta REAL NOT NULL,
+    group_name TEXT,
+    name TEXT,
+    species TEXT,
+    treatment TEXT,
+    PRIMARY KEY (run_id, sample_id, peak, injection)
+);
+CREATE INDEX IF NOT EXISTS runs_instrument ON runs (instrument, run_start);
+CREATE INDEX IF NOT EXISTS results_species ON results (species, start_time);
+CREATE INDEX IF NOT EXISTS results_group ON results (group_name, start_time);
+CREATE INDEX IF NOT EXISTS results_start_time ON results (start_time);
+"""
+
+RESULT_FIELDS = [
+    "file_path",
+    "instrument",
+    "sample_id",
+    "peak",
+    "injection",
+    "start_time",
+    "delta_raw",
+    "adjusted_delta",
+    "group_name",
+    "name",
+    "species",
+    "treatment",
+]
+
+
+def connect(db_path):
+    connection = sqlite3.connect(db_path)
+    connection.execute("PRAGMA foreign_keys = ON")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def file_hash(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, mode="rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def time_text(value):
+    return None if np.isnat(value) else str(value)
+
+
+def extract_run(file_path, calibration=None):
+    try:
+        table = read_run_table(file_path)
+        sample_ids, corrected, fit = calibrate_run(
+            table, calibration or DEFAULT_CALIBRATION
+        )
+    except Exception as e:
+        return {"file": file_path, "error": f"{type(e).__name__}: {e}"}
+    samples = ~fit["is_standard"]
+    peaks = table.get("Peak Number", np.ones(len(samples), dtype=np.int64))[samples]
+    times = table.get("Start Time", np.full(len(samples), "NaT", "M8[s]"))
+    start = times[samples]
+    # Replicate injections repeat a Sample Id and Peak Number; they are told
+    # apart by their order in the run, counted from 1.
+    injections = {}
+    rows = []
+    for sample_id, peak, start_time, raw, adjusted in zip(
+        sample_ids.tolist(),
+        peaks.tolist(),
+        start,
+        table["Delta CRDS"][samples].tolist(),
+        corrected.tolist(),
+    ):
+        key = (sample_id, int(peak))
+        injections[key] = injections.get(key, 0) + 1
+        rows.append(
+            key + (injections[key], time_text(start_time), float(raw), float(adjusted))
+        )
+    times = times[~np.isnat(times)]
+    return {
+        "file": file_path,
+        "rows": rows,
+        "run_start": time_text(times.min()) if len(times) else None,
+        "run_end": time_text(times.max()) if len(times) else None,
+        "calibration": describe_calibration(fit),
+        "error": None,
+    }
+
+
+def stored_hashes(connection):
+    return {row[0] for row in connection.execute("SELECT file_hash FROM runs")}
+
+
+def ingest_files(
+    db_path, file_paths, instrument=None, calibration=None, sheet=None, workers=None
+):
+    connection = connect(db_path)
+    try:
+        known = stored_hashes(connection)
+        new_files = {}
+        skipped = []
+        for path in file_paths:
+            digest = file_hash(path)
+            if digest in known:
+                skipped.append(path)
+            else:
+                new_files[path] = digest
+                known.add(digest)
+
+        extracted = {}
+        if new_files:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = {
+                    executor.submit(extract_run, path, calibration): path
+                    for path in new_files
+                }
+                for future in as_completed(futures):
+                    path = futures[future]
+                    try:
+                        extracted[path] = future.result()
+                    except Exception as e:
+                        extracted[path] = {
+                            "file": path,
+                            "error": f"{type(e).__name__}: {e}",
+                        }
+
+        ingested = []
+        failed = []
+        ingested_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        # One transaction for the whole ingest, so a crash leaves no partial runs.
+        with connection:
+            for path, digest in new_files.items():
+                run = extracted[path]
+                if run["error"]:
+                    failed.append((path, run["error"]))
+                    continue
+                cursor = connection.execute(
+                    "INSERT INTO runs (file_hash, file_path, instrument, run_start,"
+                    " run_end, n_samples, calibration, ingested_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        digest,
+                        os.path.abspath(path),
+                        instrument,
+                        run["run_start"],
+                        run["run_end"],
+                        len(run["rows"]),
+                        run["calibration"],
+                        ingested_at,
+                    ),
+                )
+                connection.executemany(
+                    "INSERT INTO results (run_id, sample_id, peak, injection,"
+                    " start_time, delta_raw, adjusted_delta, group_name, name,"
+                    " species, treatment) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [
+                        (cursor.lastrowid,) + row + sheet_values(sheet, row[0])
+                        for row in run["rows"]
+                    ],
+                )
+                ingested.append((path, len(run["rows"])))
+    finally:
+        connection.close()
+    return {"ingested": ingested, "skipped": skipped, "failed": failed}
+
+
+def sheet_values(sheet, sample_id):
+    entry = (sheet or {}).get(sample_id) or {}
+    group = entry.get("group")
+    return (
+        None if group is None else str(group),
+        entry.get("name"),
+        entry.get("species"),
+        entry.get("treatment"),
+    )
+
+
+def query_results(
+    db_path, species=None, group=None, start=None, end=None, instrument=None
+):
+    conditions = []
+    parameters = []
+    if species is not None:
+        conditions.append("results.species = ?")
+        parameters.append(species)
+    if group is not None:
+        conditions.append("results.group_name = ?")
+        parameters.append(str(group))
+    if start is not None:
+        conditions.append("results.start_time >= ?")
+        parameters.append(start)
+    if end is not None:
+        conditions.append("results.start_time < ?")
+        parameters.append(end)
+    if instrument is not None:
+        conditions.append("runs.instrument = ?")
+        parameters.append(instrument)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    connection = connect(db_path)
+    try:
+        cursor = connection.execute(
+            f"SELECT {', '.join(RESULT_FIELDS)} FROM results"
+            f" JOIN runs ON runs.id = results.run_id {where}"
+            " ORDER BY results.start_time, results.sample_id, results.peak,"
+            " results.injection",
+            parameters,
+        )
+        return [dict(zip(RESULT_FIELDS, row)) for row in cursor]
+    finally:
+        connection.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query the corrected results store.")
+    parser.add_argument("db", help="SQLite results database")
+    parser.add_argument("--species", default=None)
+    parser.add_argument("--group", default=None)
+    parser.add_argument("--start", default=None, help="e.g. 2024-07-01")
+    parser.add_argument("--end", default=None, help="Exclusive, e.g. 2024-08-01")
+    parser.add_argument("--instrument", default=None)
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.db):
+        print(f"Results database '{args.db}' not found.", file=sys.stderr)
+        return 1
+    rows = query_results(
+        args.db, args.species, args.group, args.start, args.end, args.instrument
+    )
+    csv_writer = csv.DictWriter(sys.stdout, fieldnames=RESULT_FIELDS)
+    csv_writer.writeheader()
+    csv_writer.writerows(rows)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,340 @@
+import csv
+import mmap
+import os
+
+import numpy as np
+
+from run_table import (
+    CALIBRATION_OFFSET,
+    GLUCOSE_STANDARDS,
+    block_fields,
+    convert_fields,
+    integer_columns,
+    parse_block,
+    parse_header,
+    read_blocks,
+)
+from species_db import (
+    atomic_write,
+    read_cache_metadata,
+    source_fingerprint,
+    write_cache_metadata,
+)
+
+# One record per data row: where it starts in the file, its line number and
+# its Start Time. The index lives next to the archive and is memory-mapped.
+INDEX_DTYPE = np.dtype([("offset", "<i8"), ("line", "<i8"), ("start_time", "<M8[s]")])
+# Rows corrected at once and bytes indexed at once; the peak memory of a
+# pass over the archive follows these, not the size of the archive.
+CHUNK_ROWS = 2 * 10**4
+CHUNK_BYTES = 8 * 2**20
+ARCHIVE_FIELDS = [
+    "run",
+    "Sample Id",
+    "Peak Number",
+    "Start Time",
+    "Adjusted Delta",
+]
+ARCHIVE_SUMMARY_FIELDS = [
+    "run",
+    "first_row",
+    "rows",
+    "start_time",
+    "n_samples",
+    "glucose_average",
+    "mean",
+    "stdev",
+]
+
+
+def index_paths(file_path):
+    return file_path + ".rows", file_path + ".rows.json"
+
+
+def line_starts(block, offset):
+    ends = np.flatnonzero(np.frombuffer(block, dtype=np.uint8) == 10)
+    return offset + np.concatenate(([0], ends[:-1] + 1))
+
+
+def index_blocks(file, header, chunk_bytes, runs, problems):
+    # Yields the index records of one block at a time, so building the index
+    # of a file of any size holds a single block in memory.
+    offset = file.tell()
+    n_rows = 0
+    for first_line, block in read_blocks(file, chunk_bytes):
+        columns, line_numbers, header_lines = block_fields(
+            header, block, first_line, problems
+        )
+        records = np.empty(len(line_numbers), dtype=INDEX_DTYPE)
+        records["offset"] = line_starts(block, offset)[line_numbers - first_line]
+        records["line"] = line_numbers
+        if "Start Time" in header:
+            fields = columns[header.index("Start Time")]
+            records["start_time"], _ = convert_fields(
+                "Start Time", fields, line_numbers, problems
+            )
+        else:
+            records["start_time"] = np.datetime64("NaT")
+        # Every repeated header starts a new run at the next data row.
+        runs.extend((n_rows + np.searchsorted(line_numbers, header_lines)).tolist())
+        n_rows += len(records)
+        offset += len(block)
+        yield records
+
+
+def build_archive_index(file_path, chunk_bytes=CHUNK_BYTES):
+    index_path, metadata_path = index_paths(file_path)
+    fingerprint = source_fingerprint(file_path)
+    metadata = dict(fingerprint, rows=0)
+    runs = [0]
+    problems = []
+
+    def write(index_file):
+        with open(file_path, mode="rb") as file:
+            header_line = file.readline()
+            metadata["header"] = parse_header(header_line)
+            for records in index_blocks(
+                file, metadata["header"], chunk_bytes, runs, problems
+            ):
+                records.tofile(index_file)
+                metadata["rows"] += len(records)
+
+    atomic_write(index_path, write)
+    # Header rows in a row, or at the end, leave no empty runs behind.
+    metadata["runs"] = sorted({run for run in runs if run < metadata["rows"]})
+    metadata["malformed"] = sorted(problems)
+    write_cache_metadata(metadata_path, metadata)
+    return metadata
+
+
+def load_archive_index(file_path, chunk_bytes=CHUNK_BYTES):
+    index_path, metadata_path = index_paths(file_path)
+    metadata = read_cache_metadata(metadata_path)
+    fingerprint = source_fingerprint(file_path)
+    if (
+        metadata is None
+        or any(metadata.get(key) != value for key, value in fingerprint.items())
+        or not os.path.exists(index_path)
+    ):
+        metadata = build_archive_index(file_path, chunk_bytes)
+    if metadata["rows"] == 0:
+        return metadata, np.zeros(0, dtype=INDEX_DTYPE)
+    return metadata, np.memmap(
+        index_path, dtype=INDEX_DTYPE, mode="r", shape=(metadata["rows"],)
+    )
+
+
+def open_archive(file_path, chunk_bytes=CHUNK_BYTES):
+    metadata, index = load_archive_index(file_path, chunk_bytes)
+    file = open(file_path, mode="rb")
+    size = os.fstat(file.fileno()).st_size
+    data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+    runs = np.array(metadata["runs"], dtype=np.int64)
+    return {
+        "path": file_path,
+        "file": file,
+        "data": data,
+        "size": size,
+        "header": metadata["header"],
+        "index": index,
+        "runs": runs,
+        "run_stops": np.append(runs[1:], len(index)).astype(np.int64),
+        "malformed": [tuple(problem) for problem in metadata["malformed"]],
+    }
+
+
+def close_archive(archive):
+    if isinstance(archive["data"], mmap.mmap):
+        archive["data"].close()
+    archive["file"].close()
+
+
+def release_pages(archive, start, stop):
+    # Pages already processed are dropped from the process, so the resident
+    # size stays bounded however much of the archive has been read.
+    if isinstance(archive["data"], mmap.mmap) and hasattr(mmap, "MADV_DONTNEED"):
+        start -= start % mmap.PAGESIZE
+        if stop > start:
+            archive["data"].madvise(mmap.MADV_DONTNEED, start, stop - start)
+
+
+def byte_range(archive, start, stop):
+    index = archive["index"]
+    begin = int(index["offset"][start])
+    end = int(index["offset"][stop]) if stop < len(index) else archive["size"]
+    return begin, end
+
+
+def read_rows(archive, start, stop, problems=None):
+    # Parses rows [start, stop) straight from the mapped file: the table and
+    # the row numbers of the rows that parsed.
+    index = archive["index"]
+    header = archive["header"]
+    if stop <= start:
+        table, _ = parse_block(header, b"", 0, [])
+        return table, np.zeros(0, dtype=np.int64)
+    begin, end = byte_range(archive, start, stop)
+    block = archive["data"][begin:end]
+    if not block.endswith(b"\n"):
+        block += b"\n"
+    table, line_numbers = parse_block(
+        header, block, int(index["line"][start]), [] if problems is None else problems
+    )
+    rows = start + np.searchsorted(index["line"][start:stop], line_numbers)
+    return integer_columns(table), rows
+
+
+def run_of_rows(archive, rows):
+    return np.searchsorted(archive["runs"], rows, side="right") - 1
+
+
+def time_ranges(archive, first, last):
+    # Row ranges with first <= Start Time < last. Runs are chronological
+    # inside, so each run is searched by bisection and no row is scanned.
+    index = archive["index"]
+    first, last = np.datetime64(first, "s"), np.datetime64(last, "s")
+    ranges = []
+    for start, stop in zip(archive["runs"].tolist(), archive["run_stops"].tolist()):
+        times = index["start_time"][start:stop]
+        if not len(times) or times[0] >= last or times[-1] < first:
+            continue
+        low = start + int(np.searchsorted(times, first))
+        high = start + int(np.searchsorted(times, last))
+        if high > low:
+            ranges.append((low, high))
+    return ranges
+
+
+def day_ranges(archive, day):
+    day = np.datetime64(day, "D")
+    return time_ranges(archive, day, day + np.timedelta64(1, "D"))
+
+
+def selected_runs(archive, runs=None, day=None):
+    # Whole runs, since a run's correction needs its glucose standards.
+    if day is not None:
+        rows = [start for start, _ in day_ranges(archive, day)]
+        runs = sorted(
+            set(run_of_rows(archive, np.array(rows, dtype=np.int64)).tolist())
+        )
+    if runs is None:
+        return np.arange(len(archive["runs"]))
+    runs = np.unique(np.asarray(runs, dtype=np.int64))
+    unknown = runs[(runs < 0) | (runs >= len(archive["runs"]))]
+    if len(unknown):
+        raise ValueError(f"The archive has no run {unknown[0]}")
+    return runs
+
+
+def merge_moments(n, mean, m2, n_b, mean_b, m2_b):
+    # Chan et al.: combines count, mean and sum of squared deviations.
+    total = n + n_b
+    with np.errstate(invalid="ignore", divide="ignore"):
+        delta = np.where(total > 0, mean_b - mean, 0.0)
+        weight = np.where(total > 0, n_b / total, 0.0)
+    return total, mean + delta * weight, m2 + m2_b + delta**2 * n * weight
+
+
+def correct_archive(
+    archive,
+    output=None,
+    runs=None,
+    day=None,
+    chunk_rows=CHUNK_ROWS,
+    n_standards=GLUCOSE_STANDARDS,
+    calibration=CALIBRATION_OFFSET,
+    malformed=None,
+):
+    # Corrects whole runs chunk by chunk. Only per-run accumulators are kept
+    # between chunks, so memory does not grow with the archive.
+    selected = selected_runs(archive, runs, day)
+    n_runs = len(archive["runs"])
+    standard_sum = np.zeros(n_runs)
+    standard_count = np.zeros(n_runs, dtype=np.int64)
+    n = np.zeros(n_runs)
+    mean = np.zeros(n_runs)
+    m2 = np.zeros(n_runs)
+    problems = []
+
+    out_file = None
+    writer = None
+    if output:
+        out_file = open(output, mode="w", newline="")
+        writer = csv.writer(out_file)
+        writer.writerow(ARCHIVE_FIELDS)
+    try:
+        # Consecutive selected runs are read as one stretch of rows.
+        breaks = np.flatnonzero(np.diff(selected) != 1) + 1
+        for stretch in np.split(selected, breaks) if len(selected) else []:
+            first = int(archive["runs"][stretch[0]])
+            last = int(archive["run_stops"][stretch[-1]])
+            for start in range(first, last, chunk_rows):
+                stop = min(start + chunk_rows, last)
+                table, rows = read_rows(archive, start, stop, problems)
+                run = run_of_rows(archive, rows)
+                standard = rows - archive["runs"][run] < n_standards
+                delta = table["Delta CRDS"]
+                standard_sum += np.bincount(
+                    run[standard], weights=delta[standard], minlength=n_runs
+                )
+                standard_count += np.bincount(run[standard], minlength=n_runs)
+                # Standards come first in a run, so they are all summed by the
+                # time its first sample is reached.
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    average = standard_sum / standard_count
+                sample = ~standard
+                adjusted = delta[sample] - average[run[sample]] - calibration
+                sample_run = run[sample]
+                chunk_n = np.bincount(sample_run, minlength=n_runs).astype(float)
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    chunk_mean = (
+                        np.bincount(sample_run, weights=adjusted, minlength=n_runs)
+                        / chunk_n
+                    )
+                chunk_mean = np.nan_to_num(chunk_mean)
+                chunk_m2 = np.bincount(
+                    sample_run,
+                    weights=(adjusted - chunk_mean[sample_run]) ** 2,
+                    minlength=n_runs,
+                )
+                n, mean, m2 = merge_moments(n, mean, m2, chunk_n, chunk_mean, chunk_m2)
+                if writer:
+                    peaks = table.get("Peak Number", np.ones(len(rows), dtype=np.int64))
+                    times = table.get("Start Time", np.full(len(rows), "NaT", "M8[s]"))
+                    writer.writerows(
+                        zip(
+                            sample_run.tolist(),
+                            table["Sample Id"][sample].tolist(),
+                            peaks[sample].tolist(),
+                            np.datetime_as_string(times[sample]).tolist(),
+                            adjusted.tolist(),
+                        )
+                    )
+                release_pages(archive, *byte_range(archive, start, stop))
+    finally:
+        if out_file:
+            out_file.close()
+
+    if malformed is not None:
+        malformed.extend(sorted(problems))
+    summary = []
+    for run in selected.tolist():
+        start = int(archive["runs"][run])
+        stop = int(archive["run_stops"][run])
+        summary.append(
+            {
+                "run": run,
+                "first_row": start,
+                "rows": stop - start,
+                "start_time": str(archive["index"]["start_time"][start]),
+                "n_samples": int(n[run]),
+                "glucose_average": (
+                    standard_sum[run] / standard_count[run]
+                    if standard_count[run]
+                    else ""
+                ),
+                "mean": mean[run] if n[run] else "",
+                "stdev": np.sqrt(m2[run] / (n[run] - 1)) if n[run] > 1 else "",
+            }
+        )
+    return summary
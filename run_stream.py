@@ -0,0 +1,107 @@
+import csv
+import os
+import time
+
+from run_table import CALIBRATION_OFFSET, GLUCOSE_STANDARDS
+
+
+def follow_lines(file_path, poll_interval=1.0, idle_timeout=None):
+    with open(file_path, mode="r", newline="") as file:
+        partial = ""
+        idle = 0.0
+        while True:
+            line = file.readline()
+            if line:
+                idle = 0.0
+                partial += line
+                # The instrument may still be writing the row we just read.
+                if partial.endswith("\n"):
+                    yield partial
+                    partial = ""
+                continue
+
+            if os.stat(file_path).st_size < file.tell():
+                file.seek(0)
+                partial = ""
+                continue
+
+            if idle_timeout is not None and idle >= idle_timeout:
+                if partial:
+                    yield partial
+                return
+            time.sleep(poll_interval)
+            idle += poll_interval
+
+
+def correct_stream(
+    lines, n_standards=GLUCOSE_STANDARDS, calibration=CALIBRATION_OFFSET
+):
+    header = None
+    count = 0
+    mean = 0.0
+    for line in lines:
+        fields = next(csv.reader([line]), None)
+        if not fields or not any(field.strip() for field in fields):
+            continue
+        if fields[0].strip() == "Sample Id":
+            # A new header means the instrument started a new sequence.
+            header = [name.strip() for name in fields]
+            count = 0
+            mean = 0.0
+            continue
+        if header is None:
+            raise ValueError("Stream does not start with a Picarro header row")
+
+        row = dict(zip(header, fields))
+        sample_id = row["Sample Id"].strip()
+        delta_raw = float(row["Delta CRDS"])
+        if count < n_standards:
+            count += 1
+            mean += (delta_raw - mean) / count
+            yield {
+                "Sample Id": sample_id,
+                "standard": True,
+                "Delta CRDS": delta_raw,
+                "glucose_average": mean,
+                "Adjusted Delta": None,
+            }
+        else:
+            yield {
+                "Sample Id": sample_id,
+                "standard": False,
+                "Delta CRDS": delta_raw,
+                "glucose_average": mean,
+                "Adjusted Delta": delta_raw - (mean + calibration),
+            }
+
+
+def follow_run_file(file_path, output=None, poll_interval=1.0, idle_timeout=None):
+    writer = None
+    out_file = None
+    if output:
+        out_file = open(output, mode="w", newline="")
+        writer = csv.writer(out_file)
+        writer.writerow(["Sample Id", "Adjusted Delta"])
+    try:
+        print("\nCarbon Isotope Composition Report (live)\n", flush=True)
+        lines = follow_lines(file_path, poll_interval, idle_timeout)
+        for result in correct_stream(lines):
+            if result["standard"]:
+                print(
+                    f"Standard {result['Sample Id']}: Delta CRDS = "
+                    f"{result['Delta CRDS']:.3f}, running glucose mean = "
+                    f"{result['glucose_average']:.3f}",
+                    flush=True,
+                )
+                continue
+            print(
+                f"Sample ID: {result['Sample Id']}, "
+                f"Adjusted Delta value = {result['Adjusted Delta']:.3f}",
+                flush=True,
+            )
+            if writer:
+                writer.writerow([result["Sample Id"], result["Adjusted Delta"]])
+                out_file.flush()
+    finally:
+        if out_file:
+            out_file.close()
@@ -0,0 +1,474 @@
+import csv
+import io
+
+import numpy as np
+
+FLOAT_COLUMNS = (
+    "Max 12CO2 (ppm)",
+    "12CO2 Integral",
+    "13CO2 Integral",
+    "Delta CRDS",
+    "12CO2 Baseline",
+    "13CO2 Baseline",
+    "Threshold",
+    "Time interval (seconds)",
+)
+INTEGER_COLUMNS = ("Peak Number", "Number of data points")
+TIME_COLUMNS = ("Start Time", "End Time")
+TEXT_COLUMNS = ("Sample Id", "Description")
+
+REQUIRED_COLUMNS = ("Sample Id", "Delta CRDS")
+MISSING_VALUES = (b"", b"NA")
+# Bytes of a run file parsed at once.
+CHUNK_BYTES = 64 * 2**20
+MALFORMED_REPORT_LIMIT = 5
+
+GLUCOSE_STANDARDS = 3
+CALIBRATION_OFFSET = 11.768
+# Idle time between two peaks that separates two sequences.
+SEQUENCE_GAP = np.timedelta64(60, "m")
+
+
+def read_run_table(file_path, malformed=None, chunk_bytes=CHUNK_BYTES):
+    with open(file_path, mode="rb") as file:
+        header_line = file.readline()
+        return run_table_from_blocks(
+            header_line, read_blocks(file, chunk_bytes), malformed
+        )
+
+
+def read_blocks(file, chunk_bytes=CHUNK_BYTES):
+    line_number = 2
+    while True:
+        block = file.read(chunk_bytes)
+        if not block:
+            return
+        # Blocks end on a line break, so no row is split between two.
+        block += file.readline()
+        if not block.endswith(b"\n"):
+            block += b"\n"
+        yield line_number, block
+        line_number += block.count(b"\n")
+
+
+def parse_run_bytes(data, malformed=None):
+    header_line, _, body = data.partition(b"\n")
+    if body and not body.endswith(b"\n"):
+        body += b"\n"
+    return run_table_from_blocks(header_line, [(2, body)] if body else [], malformed)
+
+
+def parse_header(header_line):
+    header = [
+        name.strip() for name in next(csv.reader([header_line.decode("utf-8-sig")]))
+    ]
+    missing = [name for name in REQUIRED_COLUMNS if name not in header]
+    if missing:
+        raise ValueError(f"Run file has no {', '.join(missing)} column")
+    repeated = sorted({name for name in header if header.count(name) > 1})
+    if repeated:
+        raise ValueError(f"Run file repeats the {', '.join(repeated)} column")
+    return header
+
+
+def run_table_from_blocks(header_line, blocks, malformed=None):
+    if not header_line.strip():
+        return {}
+    header = parse_header(header_line)
+    problems = []
+    parts = [
+        parse_block(header, block, first_line, problems)[0]
+        for first_line, block in blocks
+    ]
+    problems.sort()
+    if problems and malformed is None:
+        report = "; ".join(
+            f"line {line}: {reason}"
+            for line, reason in problems[:MALFORMED_REPORT_LIMIT]
+        )
+        if len(problems) > MALFORMED_REPORT_LIMIT:
+            report += f" and {len(problems) - MALFORMED_REPORT_LIMIT} more"
+        raise ValueError(f"Malformed rows in run file: {report}")
+    if malformed is not None:
+        malformed.extend(problems)
+    if not parts:
+        return integer_columns(parse_block(header, b"", 0, [])[0])
+
+    return integer_columns(
+        {name: np.concatenate([part[name] for part in parts]) for name in header}
+    )
+
+
+def integer_columns(table):
+    # Integer columns are parsed as floats and kept so when a value is missing.
+    for name in INTEGER_COLUMNS:
+        if name in table and not np.isnan(table[name]).any():
+            table[name] = table[name].astype(np.int64)
+    return table
+
+
+def fixed_width_fields(data, starts, lengths, n_columns):
+    # Picarro pads every field to a fixed width, so most lines of a block
+    # have one length and their commas at the same offsets. Those lines form
+    # a grid of bytes and each column is a slice of it. Returns which lines
+    # fit the grid and the columns of those lines.
+    regular = np.zeros(len(starts), dtype=bool)
+    comma_positions = np.flatnonzero(data == 44)
+    counts = np.diff(np.searchsorted(comma_positions, np.append(starts, len(data))))
+    width = int(np.bincount(lengths).argmax())
+    candidates = np.flatnonzero((lengths == width) & (counts == n_columns - 1))
+    if not len(candidates):
+        return regular, None
+    reference = starts[candidates[len(candidates) // 2]]
+    commas = (
+        comma_positions[
+            np.searchsorted(comma_positions, reference) : np.searchsorted(
+                comma_positions, reference + width
+            )
+        ]
+        - reference
+    )
+    if len(candidates) == len(starts):
+        grid = data.reshape(-1, width)
+    else:
+        # Stretches of consecutive grid lines are contiguous in the block.
+        breaks = np.flatnonzero(np.diff(candidates) != 1) + 1
+        grid = np.concatenate(
+            [
+                data[starts[lines[0]] : starts[lines[0]] + len(lines) * width].reshape(
+                    -1, width
+                )
+                for lines in np.split(candidates, breaks)
+            ]
+        )
+    fits = (grid[:, commas] == 44).all(axis=1)
+    if not fits.all():
+        grid = grid[fits]
+    regular[candidates[fits]] = True
+    end = width - 2 if len(grid) and (grid[:, -2] == 13).all() else width - 1
+    column_starts = np.concatenate(([0], commas + 1))
+    column_stops = np.concatenate((commas, [end]))
+    return regular, [
+        (
+            np.ascontiguousarray(grid[:, start:stop]).view(f"S{stop - start}")[:, 0]
+            if stop > start
+            else np.zeros(len(grid), dtype="S1")
+        )
+        for start, stop in zip(column_starts, column_stops)
+    ]
+
+
+def split_fields(lines, line_numbers, n_columns, problems):
+    kept = []
+    for i, line in enumerate(lines):
+        count = line.count(b",") + 1
+        if count == n_columns:
+            kept.append(i)
+        elif line.strip():
+            problems.append(
+                (int(line_numbers[i]), f"expected {n_columns} fields, found {count}")
+            )
+    if not kept:
+        return [np.zeros(0, dtype="S1") for _ in range(n_columns)], np.zeros(0, int)
+    fields = np.array(b",".join([lines[i] for i in kept]).split(b","))
+    grid = fields.reshape(len(kept), n_columns)
+    return [grid[:, j] for j in range(n_columns)], line_numbers[kept]
+
+
+def quoted_fields(block, first_line, n_columns, problems):
+    # Quoted fields may hold commas (a free-text Description), so a block
+    # with quotes is read by the csv module. Bytes that are not UTF-8 pass
+    # through unchanged.
+    reader = csv.reader(io.StringIO(block.decode("utf-8", "surrogateescape")))
+    rows = []
+    line_numbers = []
+    line = first_line
+    for row in reader:
+        if len(row) == n_columns:
+            rows.append([field.encode("utf-8", "surrogateescape") for field in row])
+            line_numbers.append(line)
+        elif any(field.strip() for field in row):
+            problems.append((line, f"expected {n_columns} fields, found {len(row)}"))
+        line = first_line + reader.line_num
+    if not rows:
+        return [np.zeros(0, dtype="S1") for _ in range(n_columns)], np.zeros(0, int)
+    columns = [np.array(fields, dtype=bytes) for fields in zip(*rows)]
+    return columns, np.array(line_numbers, dtype=np.int64)
+
+
+def unquoted_fields(block, first_line, n_columns, problems):
+    data = np.frombuffer(block, dtype=np.uint8)
+    ends = np.flatnonzero(data == 10)
+    if not len(ends):
+        return [np.zeros(0, dtype="S1") for _ in range(n_columns)], np.zeros(0, int)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    line_numbers = first_line + np.arange(len(ends))
+    regular, columns = fixed_width_fields(data, starts, ends - starts + 1, n_columns)
+
+    # Lines that do not fit the grid (header rows of concatenated exports,
+    # unpadded or broken rows) are split one by one.
+    irregular = np.flatnonzero(~regular)
+    if len(irregular):
+        other, other_lines = split_fields(
+            [block[starts[i] : ends[i]] for i in irregular.tolist()],
+            line_numbers[irregular],
+            n_columns,
+            problems,
+        )
+        if columns is None:
+            columns, line_numbers = other, other_lines
+        else:
+            line_numbers = np.concatenate((line_numbers[regular], other_lines))
+            order = np.argsort(line_numbers, kind="stable")
+            columns = [
+                np.concatenate((fields, extra))[order]
+                for fields, extra in zip(columns, other)
+            ]
+            line_numbers = line_numbers[order]
+    else:
+        line_numbers = line_numbers[regular]
+    return columns, line_numbers
+
+
+def block_fields(header, block, first_line, problems):
+    # Field arrays of the data rows of a block, the rows' line numbers and
+    # the line numbers of repeated header rows. Splitting on commas is only
+    # right without quotes, which Picarro exports do not use.
+    n_columns = len(header)
+    if b'"' in block:
+        columns, line_numbers = quoted_fields(block, first_line, n_columns, problems)
+    else:
+        columns, line_numbers = unquoted_fields(block, first_line, n_columns, problems)
+
+    # Concatenated exports repeat the header row.
+    data_rows = np.char.strip(columns[0]) != header[0].encode("utf-8")
+    if not data_rows.all():
+        columns = [fields[data_rows] for fields in columns]
+    return columns, line_numbers[data_rows], line_numbers[~data_rows]
+
+
+def convert_fields(name, fields, line_numbers, problems):
+    convert = field_converter(name)
+    bad = np.zeros(len(fields), dtype=bool)
+    try:
+        return convert(fields), bad
+    except ValueError:
+        pass
+    bad[rejected_fields(convert, fields)] = True
+    for i in np.flatnonzero(bad):
+        value = fields[i].strip().decode("utf-8", "replace")
+        problems.append((int(line_numbers[i]), f"{name} '{value}' is not valid"))
+    return convert(np.where(bad, b"", fields)), bad
+
+
+def parse_block(header, block, first_line, problems):
+    columns, line_numbers, _ = block_fields(header, block, first_line, problems)
+    bad = np.zeros(len(line_numbers), dtype=bool)
+    part = {}
+    for name, fields in zip(header, columns):
+        part[name], rejected = convert_fields(name, fields, line_numbers, problems)
+        bad |= rejected
+    if bad.any():
+        part = {name: column[~bad] for name, column in part.items()}
+        line_numbers = line_numbers[~bad]
+    return part, line_numbers
+
+
+def rejected_fields(convert, fields):
+    # Positions of the fields the vectorized conversion fails on, found by
+    # bisection so that a few bad cells do not cost a Python-level loop.
+    try:
+        convert(fields)
+        return []
+    except ValueError:
+        if len(fields) == 1:
+            return [0]
+    middle = len(fields) // 2
+    return rejected_fields(convert, fields[:middle]) + [
+        middle + i for i in rejected_fields(convert, fields[middle:])
+    ]
+
+
+def field_converter(name):
+    if name in FLOAT_COLUMNS or name in INTEGER_COLUMNS:
+        return float_fields
+    if name in TIME_COLUMNS:
+        return time_fields
+    return text_fields
+
+
+def float_fields(fields):
+    try:
+        return fields.astype(np.float64)
+    except ValueError:
+        fields = np.char.strip(fields)
+        fields = np.where(np.isin(fields, MISSING_VALUES), b"nan", fields)
+        return fields.astype(np.float64)
+
+
+def time_fields(fields):
+    fields = np.char.strip(fields)
+    fields = np.where(fields == b"", b"NaT", fields)
+    # "2024/07/03 11:04:36" to ISO 8601, byte by byte.
+    characters = fields.view(np.uint8)
+    characters[characters == ord("/")] = ord("-")
+    characters[characters == ord(" ")] = ord("T")
+    return fields.astype("datetime64[s]")
+
+
+def text_fields(fields):
+    fields = np.char.strip(fields)
+    try:
+        return fields.astype(str)
+    except UnicodeDecodeError:
+        return np.char.decode(fields, "utf-8")
+
+
+def table_length(table):
+    for column in table.values():
+        return len(column)
+    return 0
+
+
+def glucose_average_table(table, n_standards=GLUCOSE_STANDARDS):
+    standards = table["Delta CRDS"][:n_standards]
+    if len(standards) == 0:
+        raise ZeroDivisionError("no glucose standard rows in the run")
+    return float(standards.mean())
+
+
+def adjusted_delta_table(
+    table, average, n_standards=GLUCOSE_STANDARDS, calibration=CALIBRATION_OFFSET
+):
+    adjustment = average + calibration
+    sample_ids = table["Sample Id"][n_standards:]
+    adjusted = table["Delta CRDS"][n_standards:] - adjustment
+    return sample_ids, adjusted
+
+
+def segment_correction(
+    delta, segments, n_segments, n_standards=GLUCOSE_STANDARDS, calibration=0.0
+):
+    # Rows are grouped into consecutive segments (runs or sequences) that each
+    # start with n_standards glucose standards. All segments are corrected in
+    # one pass: every segment's average is a bincount over its standards.
+    lengths = np.bincount(segments, minlength=n_segments)
+    position = np.arange(len(delta)) - (np.cumsum(lengths) - lengths)[segments]
+    standard = position < n_standards
+    counts = np.bincount(segments[standard], minlength=n_segments)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        averages = (
+            np.bincount(
+                segments[standard], weights=delta[standard], minlength=n_segments
+            )
+            / counts
+        )
+    adjusted = delta - averages[segments] - calibration
+    return adjusted, standard, averages, counts
+
+
+def adjusted_delta_batch(
+    tables, n_standards=GLUCOSE_STANDARDS, calibration=CALIBRATION_OFFSET
+):
+    # Corrects many runs in one pass, one segment per run.
+    lengths = np.array([table_length(table) for table in tables], dtype=np.int64)
+    delta = np.concatenate([table["Delta CRDS"] for table in tables])
+    sample_ids = np.concatenate([table["Sample Id"] for table in tables])
+    run = np.repeat(np.arange(len(tables)), lengths)
+    adjusted, standard, averages, counts = segment_correction(
+        delta, run, len(tables), n_standards, calibration
+    )
+    bounds = np.cumsum(lengths)[:-1]
+    return [
+        (ids[~is_standard], values[~is_standard], average if count else None)
+        for ids, values, is_standard, average, count in zip(
+            np.split(sample_ids, bounds),
+            np.split(adjusted, bounds),
+            np.split(standard, bounds),
+            averages.tolist(),
+            counts.tolist(),
+        )
+    ]
+
+
+def sequence_starts(table, gap=SEQUENCE_GAP, n_standards=GLUCOSE_STANDARDS):
+    # A new sequence starts after the instrument idled longer than gap, where
+    # the clock goes back, or where the Sample Ids of the first sequence's
+    # standards come back as a whole block after other samples. A single
+    # check standard that reuses a standard's id starts nothing.
+    n_rows = table_length(table)
+    starts = np.zeros(n_rows, dtype=bool)
+    if n_rows == 0:
+        return starts
+    starts[0] = True
+    if "Start Time" in table:
+        start = table["Start Time"]
+        end = table.get("End Time", start)
+        previous = np.where(np.isnat(end[:-1]), start[:-1], end[:-1])
+        starts[1:] |= start[1:] - previous > gap
+        starts[1:] |= start[1:] < start[:-1]
+    sample_ids = table["Sample Id"]
+    standard_ids = sample_ids[:n_standards]
+    restarts = np.zeros(n_rows, dtype=bool)
+    n_windows = n_rows - len(standard_ids) + 1
+    if n_windows > 0:
+        restarts[:n_windows] = True
+        for i, sample_id in enumerate(standard_ids):
+            restarts[:n_windows] &= sample_ids[i : i + n_windows] == sample_id
+    starts[1:] |= restarts[1:] & (sample_ids[:-1] != sample_ids[0])
+    return starts
+
+
+def sequence_ids(table, gap=SEQUENCE_GAP, n_standards=GLUCOSE_STANDARDS):
+    return np.cumsum(sequence_starts(table, gap, n_standards)) - 1
+
+
+def adjusted_delta_sequences(
+    table,
+    sequences,
+    n_standards=GLUCOSE_STANDARDS,
+    calibration=CALIBRATION_OFFSET,
+):
+    n_sequences = int(sequences[-1]) + 1 if len(sequences) else 0
+    delta = table["Delta CRDS"]
+    adjusted, standard, averages, _ = segment_correction(
+        delta, sequences, n_sequences, n_standards, calibration
+    )
+    samples = ~standard
+    return {
+        "Sample Id": table["Sample Id"][samples],
+        "sequence": sequences[samples],
+        "adjusted": adjusted[samples],
+        "standard": standard,
+        "averages": averages,
+        "residuals": averages[sequences[standard]] - delta[standard],
+        "standard_sequence": sequences[standard],
+    }
+
+
+def group_statistics(values, labels):
+    values = np.asarray(values, dtype=np.float64)
+    groups, inverse = np.unique(labels, return_inverse=True)
+    counts = np.bincount(inverse, minlength=len(groups))
+    sums = np.bincount(inverse, weights=values, minlength=len(groups))
+    means = sums / counts
+    squares = np.bincount(
+        inverse, weights=(values - means[inverse]) ** 2, minlength=len(groups)
+    )
+    with np.errstate(invalid="ignore", divide="ignore"):
+        stdevs = np.sqrt(squares / (counts - 1))
+
+    # Sorting by group then value puts each group's median at a fixed offset.
+    order = np.lexsort((values, inverse))
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    lower = values[order[starts + (counts - 1) // 2]]
+    upper = values[order[starts + counts // 2]]
+    medians = (lower + upper) / 2
+
+    return {
+        "group": groups,
+        "n": counts,
+        "mean": means,
+        "stdev": stdevs,
+        "median": medians,
+    }
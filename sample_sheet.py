@@ -0,0 +1,107 @@
+import csv
+import os
+
+SHEET_FIELDS = ("group", "name", "species", "treatment")
+
+
+def parse_group(value):
+    value = str(value).strip()
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+
+def normalize_entry(sample_id, entry):
+    sheet_entry = {field: entry.get(field) for field in SHEET_FIELDS}
+    sheet_entry["group"] = (
+        None if sheet_entry["group"] is None else parse_group(sheet_entry["group"])
+    )
+    for field in ("name", "species", "treatment"):
+        value = sheet_entry[field]
+        sheet_entry[field] = str(value).strip() if value not in (None, "") else None
+    return str(sample_id).strip(), sheet_entry
+
+
+def read_csv_sheet(file_path):
+    with open(file_path, mode="r", newline="") as file:
+        csv_reader = csv.DictReader(file)
+        rows = [
+            {key.strip().lower(): value for key, value in row.items()}
+            for row in csv_reader
+        ]
+    if rows and "sample id" not in rows[0]:
+        raise ValueError(f"Sample sheet '{file_path}' has no 'Sample Id' column")
+    return [(row["sample id"], row) for row in rows]
+
+
+def read_yaml_sheet(file_path):
+    try:
+        import yaml
+    except ImportError:
+        raise ImportError("Reading YAML sample sheets requires PyYAML") from None
+    with open(file_path, mode="r") as file:
+        content = yaml.safe_load(file) or {}
+    if isinstance(content, dict):
+        content = content.get("samples", content)
+    if isinstance(content, dict):
+        return [(sample_id, entry or {}) for sample_id, entry in content.items()]
+    entries = []
+    for entry in content:
+        entry = {str(key).strip().lower(): value for key, value in entry.items()}
+        if "sample id" not in entry:
+            raise ValueError(f"Sample sheet '{file_path}' entry has no 'Sample Id'")
+        entries.append((entry["sample id"], entry))
+    return entries
+
+
+def load_sample_sheet(file_path):
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension in (".yaml", ".yml"):
+        entries = read_yaml_sheet(file_path)
+    else:
+        entries = read_csv_sheet(file_path)
+    sheet = {}
+    for sample_id, entry in entries:
+        sample_id, entry = normalize_entry(sample_id, entry)
+        if sample_id in sheet:
+            raise ValueError(f"Sample Id '{sample_id}' appears twice in the sheet")
+        sheet[sample_id] = entry
+    return sheet
+
+
+def group_by_sheet(adjusted_values, sheet):
+    group_data = {}
+    unassigned = []
+    for sample_id, value in adjusted_values:
+        entry = sheet.get(str(sample_id).strip())
+        if entry is None or entry["group"] is None:
+            unassigned.append(sample_id)
+            continue
+        group_data.setdefault(entry["group"], []).append((sample_id, value))
+    group_data = {
+        group: group_data[group]
+        for group in sorted(
+            group_data, key=lambda group: (isinstance(group, str), group)
+        )
+    }
+    return group_data, unassigned
+
+
+def sample_names_from_sheet(sample_ids, sheet):
+    names = []
+    for sample_id in sample_ids:
+        entry = sheet.get(str(sample_id).strip())
+        names.append(entry["name"] if entry and entry["name"] else sample_id)
+    return names
+
+
+def join_sample_sheet(rows, sheet, key="Sample Id"):
+    for row in rows:
+        entry = sheet.get(str(row[key]).strip(), {})
+        for field in SHEET_FIELDS:
+            value = entry.get(field)
+            row[field] = "" if value is None else value
+    return rows
@@ -0,0 +1,344 @@
+import argparse
+import asyncio
+import csv
+import io
+import json
+import math
+import sys
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from group_stats import format_posthoc, format_report
+from run_table import adjusted_delta_batch, parse_run_bytes
+from session import AnalysisSession
+from species_db import DATABASE_PATH
+
+BATCH_WINDOW = 0.005
+MAX_BATCH_RUNS = 64
+MAX_BODY_BYTES = 64 * 2**20
+STATUS_TEXT = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def json_value(value):
+    if isinstance(value, dict):
+        return {str(key): json_value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [json_value(item) for item in value]
+    if isinstance(value, np.ndarray):
+        return json_value(value.tolist())
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+def correct_batch(tables):
+    results = []
+    for sample_ids, adjusted, average in adjusted_delta_batch(tables):
+        if average is None:
+            results.append({"error": "The run has no glucose standard rows"})
+        else:
+            results.append(
+                {
+                    "glucose_average": average,
+                    "adjusted_values": list(
+                        zip(sample_ids.tolist(), adjusted.tolist())
+                    ),
+                }
+            )
+    return results
+
+
+class CorrectionBatcher:
+    # Runs posted within one window are corrected together, so a burst of
+    # small requests costs one vectorized pass instead of one per request.
+    def __init__(self, window=BATCH_WINDOW, max_runs=MAX_BATCH_RUNS):
+        self.window = window
+        self.max_runs = max_runs
+        self.pending = []
+        self.timer = None
+        self.tasks = set()
+        self.batches = 0
+        self.runs = 0
+
+    def submit(self, table):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((table, future))
+        if len(self.pending) >= self.max_runs:
+            self.flush()
+        elif self.timer is None:
+            self.timer = loop.call_later(self.window, self.flush)
+        return future
+
+    def flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        pending, self.pending = self.pending, []
+        if pending:
+            task = asyncio.ensure_future(self.run(pending))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def run(self, pending):
+        self.batches += 1
+        self.runs += len(pending)
+        try:
+            results = await asyncio.to_thread(
+                correct_batch, [table for table, _ in pending]
+            )
+        except Exception as e:
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(pending, results):
+            if not future.done():
+                future.set_result(result)
+
+
+class AnalysisService:
+    def __init__(self, session, window=BATCH_WINDOW, max_batch_runs=MAX_BATCH_RUNS):
+        self.session = session
+        self.batcher = CorrectionBatcher(window, max_batch_runs)
+
+    async def handle(self, reader, writer):
+        try:
+            try:
+                method, target, headers, body = await read_request(reader)
+                status, content_type, payload = await self.route(
+                    method, target, headers, body
+                )
+            except HTTPError as e:
+                status, content_type, payload = error_response(e.status, str(e))
+            except Exception as e:
+                status, content_type, payload = error_response(
+                    500, f"{type(e).__name__}: {e}"
+                )
+            writer.write(
+                f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(payload)}\r\n"
+                "Connection: close\r\n\r\n".encode() + payload
+            )
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def route(self, method, target, headers, body):
+        url = urlsplit(target)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        as_csv = query.get("format") == "csv" or "text/csv" in headers.get("accept", "")
+        routes = {
+            "/health": ("GET", self.health),
+            "/correct": ("POST", self.correct),
+            "/species": ("GET", self.species),
+            "/statistics": ("POST", self.statistics),
+        }
+        if url.path not in routes:
+            raise HTTPError(404, f"No endpoint '{url.path}'")
+        allowed, handler = routes[url.path]
+        if method != allowed:
+            raise HTTPError(405, f"{url.path} only accepts {allowed}")
+        result = await handler(query, body)
+        if as_csv:
+            rows, fields = csv_rows(url.path, result)
+            return 200, "text/csv", write_csv_text(rows, fields).encode()
+        return 200, "application/json", json.dumps(json_value(result)).encode()
+
+    async def health(self, query, body):
+        return {
+            "status": "ok",
+            "species_records": len(self.session.species_data),
+            "batches": self.batcher.batches,
+            "runs": self.batcher.runs,
+        }
+
+    async def correct(self, query, body):
+        # Parsing a large body takes a while; off the event loop, other
+        # requests and the batcher's timer keep running meanwhile.
+        try:
+            table = await asyncio.to_thread(parse_run_bytes, body)
+        except (UnicodeDecodeError, ValueError, KeyError) as e:
+            raise HTTPError(400, f"Invalid run file: {e}")
+        if "Delta CRDS" not in table or "Sample Id" not in table:
+            raise HTTPError(400, "The run needs 'Sample Id' and 'Delta CRDS' columns")
+        result = await self.batcher.submit(table)
+        if "error" in result:
+            raise HTTPError(400, result["error"])
+        return result
+
+    async def species(self, query, body):
+        name = query.get("name", "").strip()
+        if not name:
+            raise HTTPError(400, "Pass the species as ?name=")
+        by_genus = query.get("genus", "") in ("1", "true", "yes")
+        result = self.session.lookup_species(name, by_genus)
+        if result is None:
+            return {
+                "species": name,
+                "found": False,
+                "suggestions": self.session.suggest_species(name),
+            }
+        return {
+            "species": result["species"],
+            "found": True,
+            "n_records": len(result["records"]),
+            "little.d13.org": result["little.d13.org"],
+            "big.D13.merged": result["big.D13.merged"],
+        }
+
+    async def statistics(self, query, body):
+        try:
+            request = json.loads(body or b"{}")
+            group_data = request_groups(request)
+        except (ValueError, TypeError, KeyError, AttributeError) as e:
+            raise HTTPError(400, f"Invalid statistics request: {e!r}")
+        if not group_data or any(not group for group in group_data.values()):
+            raise HTTPError(400, "Not enough data for statistical analysis")
+        # Each request gets its own session; only the species cache is shared.
+        result = await asyncio.to_thread(AnalysisSession().group_statistics, group_data)
+        return {
+            "groups": result["groups"],
+            "t_test": result["t_test"],
+            "anova": result["anova"],
+            "kruskal": result["kruskal"],
+            "welch": result["welch"],
+            "tukey_hsd": result["tukey_hsd"],
+            "report": format_report(result),
+            "posthoc": format_posthoc(result),
+        }
+
+
+def request_groups(request):
+    # Either {"groups": {"1": [["4", -15.3], ...]}} like group_data, or
+    # {"values": [["4", -15.3], ...], "sample_groups": {"4": 1, ...}}.
+    if "groups" in request:
+        return {
+            group: [(str(sample_id), float(value)) for sample_id, value in values]
+            for group, values in request["groups"].items()
+        }
+    sample_groups = {str(key): group for key, group in request["sample_groups"].items()}
+    group_data = {}
+    for sample_id, value in request["values"]:
+        group = sample_groups.get(str(sample_id))
+        if group is not None:
+            group_data.setdefault(group, []).append((str(sample_id), float(value)))
+    return group_data
+
+
+def csv_rows(path, result):
+    if path == "/correct":
+        return [
+            {"Sample Id": sample_id, "Adjusted Delta": value}
+            for sample_id, value in result["adjusted_values"]
+        ], ["Sample Id", "Adjusted Delta"]
+    if path == "/statistics":
+        groups = json_value(result["groups"])
+        fields = ["group", "n", "mean", "stdev", "median"]
+        rows = zip(*(groups[field] for field in fields))
+        return [dict(zip(fields, row)) for row in rows], fields
+    result = json_value(result)
+    return [result], list(result)
+
+
+def write_csv_text(rows, fieldnames):
+    output = io.StringIO()
+    csv_writer = csv.DictWriter(output, fieldnames=fieldnames, extrasaction="ignore")
+    csv_writer.writeheader()
+    csv_writer.writerows(rows)
+    return output.getvalue()
+
+
+def error_response(status, message):
+    return status, "application/json", json.dumps({"error": message}).encode()
+
+
+async def read_request(reader):
+    request_line = await reader.readline()
+    try:
+        method, target, _ = request_line.decode("latin-1").split()
+    except ValueError:
+        raise HTTPError(400, "Malformed request line")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise HTTPError(400, "Invalid Content-Length")
+    if length > MAX_BODY_BYTES:
+        raise HTTPError(413, f"Request body over {MAX_BODY_BYTES} bytes")
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), target, headers, body
+
+
+async def start_service(
+    host="127.0.0.1", port=8765, species_path=DATABASE_PATH, window=BATCH_WINDOW
+):
+    session = AnalysisSession()
+    if species_path:
+        # Loaded once; every request reads the same memory-mapped table.
+        await asyncio.to_thread(session.load_species, species_path)
+    service = AnalysisService(session, window)
+    server = await asyncio.start_server(service.handle, host, port)
+    return service, server
+
+
+async def serve(host, port, species_path, window):
+    _, server = await start_service(host, port, species_path, window)
+    address = server.sockets[0].getsockname()
+    print(f"Serving on http://{address[0]}:{address[1]}")
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="HTTP service for delta 13C correction, species lookup and statistics."
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument(
+        "--species-db", default=DATABASE_PATH, help="Species database CSV"
+    )
+    parser.add_argument(
+        "--batch-window",
+        type=float,
+        default=BATCH_WINDOW * 1000,
+        help="Milliseconds to wait for more runs to correct together",
+    )
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(
+            serve(args.host, args.port, args.species_db, args.batch_window / 1000)
+        )
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
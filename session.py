@@ -0,0 +1,195 @@
+import threading
+
+import numpy as np
+
+from group_stats import analyze_groups
+from replicates import collapse_replicates
+from run_table import (
+    GLUCOSE_STANDARDS,
+    adjusted_delta_table,
+    glucose_average_table,
+    read_run_table,
+    table_length,
+)
+from sample_sheet import group_by_sheet
+from species_db import DATABASE_PATH, load_species_table
+from species_search import build_search_index, suggest_species
+from spatial_index import RADIUS_KM, build_spatial_index, nearby_records, site_label
+
+SPECIES_VALUE_COLUMNS = ("little.d13.org", "big.D13.merged")
+
+
+def normalize_species_name(name):
+    return " ".join(name.split()).lower()
+
+
+def build_species_index(table):
+    by_species = {}
+    by_genus = {}
+    for i, species in enumerate(table["species"].tolist()):
+        name = normalize_species_name(species)
+        by_species.setdefault(name, []).append(i)
+        by_genus.setdefault(name.split(" ")[0], []).append(i)
+    by_species = {name: np.array(rows) for name, rows in by_species.items()}
+    by_genus = {name: np.array(rows) for name, rows in by_genus.items()}
+    return by_species, by_genus
+
+
+def species_statistics(name, records):
+    stats = {"species": name, "records": records}
+    for column in SPECIES_VALUE_COLUMNS:
+        values = records[column][~np.isnan(records[column])]
+        stats[column] = {
+            "n": len(values),
+            "mean": float(np.mean(values)) if len(values) else None,
+            "median": float(np.median(values)) if len(values) else None,
+        }
+    return stats
+
+
+def species_state(table):
+    by_species, by_genus = build_species_index(table)
+    search_index = build_search_index(table["species"].tolist())
+    return table, by_species, by_genus, search_index
+
+
+def group_values(group_data):
+    values = [item[1] for group in group_data.values() for item in group]
+    labels = [group_number for group_number, group in group_data.items() for _ in group]
+    return values, labels
+
+
+class AnalysisSession:
+    # All state of one analysis: the GUI, the CLI and the HTTP service each
+    # work on their own session, so several can run in one process. The
+    # containers are mutated in place, never rebound, so references handed
+    # out earlier (e.g. the data_analyze module names) stay current.
+    def __init__(self, sample_sheet=None, replicate_rules=()):
+        self.lock = threading.RLock()
+        self.run_table = None
+        self.adjusted_values = []
+        self.group_data = None
+        self.species_d13c_value = {}
+        self.sample_sheet = sample_sheet
+        self.replicate_rules = replicate_rules
+        self.species_data = []
+        self.species_index = {}
+        self.genus_index = {}
+        self.species_search_index = None
+        self.spatial_index = None
+
+    def correct_run(self, file_path):
+        # Reads and corrects a run without touching the session, so the GUI
+        # can do it off the Tk thread and store it with set_run when done.
+        table = read_run_table(file_path)
+        sample_ids, adjusted = adjusted_delta_table(table, glucose_average_table(table))
+        peaks = table.get("Peak Number", np.ones(table_length(table), dtype=np.int64))
+        peaks = peaks[GLUCOSE_STANDARDS:]
+        values = collapse_replicates(
+            list(zip(sample_ids.tolist(), adjusted.tolist())),
+            peaks.tolist(),
+            self.replicate_rules,
+        )
+        return table, values
+
+    def set_run(self, table, values):
+        with self.lock:
+            self.run_table = table
+            self.set_adjusted_values(values)
+
+    def load_run(self, file_path):
+        table, values = self.correct_run(file_path)
+        self.set_run(table, values)
+        return values
+
+    def set_adjusted_values(self, values):
+        with self.lock:
+            self.adjusted_values[:] = values
+            self.group_data = None
+
+    def load_species(self, file_path=DATABASE_PATH):
+        self.set_species(species_state(load_species_table(file_path)))
+
+    def set_species(self, state):
+        table, by_species, by_genus, search_index = state
+        with self.lock:
+            self.species_data = table
+            self.species_search_index = search_index
+            self.spatial_index = None
+            self.species_index.clear()
+            self.genus_index.clear()
+            self.species_index.update(by_species)
+            self.genus_index.update(by_genus)
+
+    def species_loaded(self):
+        return len(self.species_data) > 0
+
+    def lookup_species(self, species_name, by_genus=False):
+        name = normalize_species_name(species_name)
+        with self.lock:
+            if by_genus:
+                rows = self.genus_index.get(name.split(" ")[0])
+            else:
+                rows = self.species_index.get(name)
+            if rows is None:
+                return None
+            records = self.species_data[rows]
+        if not by_genus:
+            name = str(records["species"][0])
+        return species_statistics(name, records)
+
+    def suggest_species(self, species_name, limit=5):
+        if self.species_search_index is None:
+            return []
+        return suggest_species(self.species_search_index, species_name, limit)
+
+    def nearby_reference(
+        self,
+        latitude,
+        longitude,
+        radius_km=RADIUS_KM,
+        k=None,
+        ps_type=None,
+        years=None,
+    ):
+        with self.lock:
+            if not self.species_loaded():
+                return None
+            # Built on the first location query; name lookups never need it.
+            if self.spatial_index is None:
+                self.spatial_index = build_spatial_index(self.species_data)
+            index, table = self.spatial_index, self.species_data
+        rows, distances = nearby_records(
+            index, table, latitude, longitude, radius_km, k, ps_type, years
+        )
+        stats = species_statistics(
+            site_label(latitude, longitude, radius_km, k), table[rows]
+        )
+        stats["distance_km"] = distances
+        stats["species_count"] = len(np.unique(table["species"][rows]))
+        return stats
+
+    def record_species(self, species_name, value):
+        with self.lock:
+            self.species_d13c_value[species_name] = value
+
+    def groups_from_sheet(self, data=None):
+        if not self.sample_sheet:
+            return None, []
+        return group_by_sheet(
+            self.adjusted_values if data is None else data, self.sample_sheet
+        )
+
+    def set_group_data(self, group_data):
+        with self.lock:
+            self.group_data = group_data
+
+    def group_statistics(self, group_data=None):
+        if group_data is None:
+            group_data = self.group_data or self.groups_from_sheet()[0]
+        if not group_data:
+            return None
+        values, labels = group_values(group_data)
+        result = analyze_groups(values, labels)
+        self.set_group_data(group_data)
+        return result
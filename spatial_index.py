@@ -0,0 +1,165 @@
+import csv
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+RADIUS_KM = 100.0
+PS_TYPES = ("C3", "C4", "CAM")
+
+SITE_REFERENCE_FIELDS = [
+    "Sample Id",
+    "latitude",
+    "longitude",
+    "n",
+    "little.d13.org",
+    "big.D13.merged",
+    "nearest_km",
+]
+
+
+def site_vectors(latitude, longitude):
+    # Unit vectors on the sphere: the straight-line (chord) distance between
+    # two of them grows monotonically with the great-circle distance, so a
+    # Euclidean k-d tree answers great-circle queries.
+    latitude = np.radians(np.asarray(latitude, dtype=np.float64))
+    longitude = np.radians(np.asarray(longitude, dtype=np.float64))
+    return np.stack(
+        [
+            np.cos(latitude) * np.cos(longitude),
+            np.cos(latitude) * np.sin(longitude),
+            np.sin(latitude),
+        ],
+        axis=-1,
+    )
+
+
+def chord_length(distance_km):
+    angle = np.minimum(
+        np.asarray(distance_km, dtype=np.float64) / EARTH_RADIUS_KM, np.pi
+    )
+    return 2 * np.sin(angle / 2)
+
+
+def great_circle_km(chord):
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(np.asarray(chord) / 2, 1.0))
+
+
+def build_spatial_index(table):
+    from scipy.spatial import cKDTree
+
+    located = np.isfinite(table["latitude"]) & np.isfinite(table["longitude"])
+    rows = np.flatnonzero(located)
+    points = site_vectors(table["latitude"][rows], table["longitude"][rows])
+    return {"tree": cKDTree(points), "rows": rows}
+
+
+def record_filter(records, ps_type=None, years=None):
+    keep = np.ones(len(records), dtype=bool)
+    if ps_type:
+        wanted = [kind.upper() for kind in ps_type]
+        keep &= np.isin(np.char.upper(records["ps.type"]), wanted)
+    if years:
+        first, last = years
+        # Records without a year never match a year range.
+        with np.errstate(invalid="ignore"):
+            keep &= (records["year"] >= first) & (records["year"] <= last)
+    return keep
+
+
+def nearest_points(tree, point, k, bound, accept):
+    # The filters are applied to the candidates only, so a query costs
+    # O(candidates) rather than a pass over the whole database. The
+    # candidate count grows until k of them pass the filters.
+    want = k
+    while True:
+        count = min(want, tree.n)
+        distances, points = tree.query(point, k=count, distance_upper_bound=bound)
+        distances, points = np.atleast_1d(distances), np.atleast_1d(points)
+        found = points < tree.n
+        distances, points = distances[found], points[found]
+        keep = accept(points)
+        if keep.sum() >= k or count == tree.n or len(points) < count:
+            return points[keep][:k], distances[keep][:k]
+        want *= 4
+
+
+def nearby_records(
+    index,
+    table,
+    latitude,
+    longitude,
+    radius_km=RADIUS_KM,
+    k=None,
+    ps_type=None,
+    years=None,
+):
+    # Rows of the records within radius_km of the site (or its k nearest,
+    # optionally within radius_km), nearest first, with their distances.
+    tree = index["tree"]
+    point = site_vectors(latitude, longitude)
+    bound = np.inf if radius_km is None else float(chord_length(radius_km))
+
+    def accept(points):
+        return record_filter(table[index["rows"][points]], ps_type, years)
+
+    if k is None:
+        if radius_km is None:
+            raise ValueError("Pass a radius, a number of records or both")
+        points = np.array(tree.query_ball_point(point, bound), dtype=np.int64)
+        points = points[accept(points)]
+        distances = np.linalg.norm(tree.data[points] - point, axis=1)
+        order = np.argsort(distances, kind="stable")
+        points, distances = points[order], distances[order]
+    else:
+        points, distances = nearest_points(tree, point, k, bound, accept)
+    return index["rows"][points], great_circle_km(distances)
+
+
+def site_label(latitude, longitude, radius_km=RADIUS_KM, k=None):
+    place = f"{latitude:g}, {longitude:g}"
+    if k is None:
+        return f"within {radius_km:g} km of {place}"
+    if radius_km is None:
+        return f"nearest {k} to {place}"
+    return f"nearest {k} within {radius_km:g} km of {place}"
+
+
+def read_sites(file_path):
+    # CSV of Sample Id, latitude and longitude, one field site per sample.
+    with open(file_path, mode="r", newline="") as file:
+        csv_reader = csv.DictReader(file)
+        rows = [
+            {key.strip().lower(): value for key, value in row.items()}
+            for row in csv_reader
+        ]
+    missing = {"sample id", "latitude", "longitude"} - set(rows[0] if rows else ())
+    if missing:
+        raise ValueError(f"Site table needs the columns {', '.join(sorted(missing))}")
+    return [
+        (row["sample id"].strip(), float(row["latitude"]), float(row["longitude"]))
+        for row in rows
+    ]
+
+
+def site_reference_row(sample_id, latitude, longitude, stats):
+    distances = stats["distance_km"]
+    return {
+        "Sample Id": sample_id,
+        "latitude": latitude,
+        "longitude": longitude,
+        "n": len(distances),
+        "little.d13.org": stats["little.d13.org"]["mean"],
+        "big.D13.merged": stats["big.D13.merged"]["mean"],
+        "nearest_km": float(distances[0]) if len(distances) else None,
+    }
+
+
+def format_site_reference(stats):
+    values = stats["little.d13.org"]
+    if values["n"] == 0:
+        return f"No literature leaf delta 13C values {stats['species']}"
+    return (
+        f"Literature leaf delta 13C {stats['species']}: "
+        f"mean {values['mean']:.3f}, median {values['median']:.3f}, "
+        f"n = {values['n']} ({stats['species_count']} species)"
+    )
@@ -0,0 +1,138 @@
+import csv
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+DATABASE_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "leaf13C_database.csv"
+)
+
+TEXT_FIELDS = ("species", "ps.type", "author")
+FLOAT_FIELDS = (
+    "little.d13.org",
+    "big.D13.org",
+    "big.D13.merged",
+    "latitude",
+    "longitude",
+    "year",
+)
+
+
+def parse_species_value(value):
+    value = value.strip()
+    if value in ("", "NA"):
+        return np.nan
+    return float(value)
+
+
+def species_table_from_rows(rows):
+    widths = {
+        field: max([len(row.get(field, "").strip()) for row in rows] + [1])
+        for field in TEXT_FIELDS
+    }
+    dtype = [(field, f"U{widths[field]}") for field in TEXT_FIELDS] + [
+        (field, np.float64) for field in FLOAT_FIELDS
+    ]
+    records = [
+        tuple(row.get(field, "").strip() for field in TEXT_FIELDS)
+        + tuple(parse_species_value(row.get(field, "NA")) for field in FLOAT_FIELDS)
+        for row in rows
+    ]
+    return np.array(records, dtype=dtype)
+
+
+def parse_species_csv(file_path):
+    with open(file_path, mode="r", newline="") as file:
+        csv_reader = csv.DictReader(file)
+        rows = [
+            {key.strip(): value for key, value in row.items()} for row in csv_reader
+        ]
+    return species_table_from_rows(rows)
+
+
+def cache_paths(file_path):
+    return file_path + ".npy", file_path + ".npy.json"
+
+
+def file_sha256(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, mode="rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def source_fingerprint(file_path):
+    stat = os.stat(file_path)
+    return {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+
+def atomic_write(file_path, write):
+    directory = os.path.dirname(file_path) or "."
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode="wb") as file:
+            write(file)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def read_cache_metadata(metadata_path):
+    try:
+        with open(metadata_path, mode="r") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def write_cache_metadata(metadata_path, metadata):
+    atomic_write(metadata_path, lambda file: file.write(json.dumps(metadata).encode()))
+
+
+def cache_is_valid(file_path, metadata, fingerprint):
+    if metadata is None:
+        return False
+    if all(metadata.get(key) == value for key, value in fingerprint.items()):
+        return True
+    # The file was touched; only a content change invalidates the cache.
+    if metadata.get("size") == fingerprint["size"]:
+        return metadata.get("sha256") == file_sha256(file_path)
+    return False
+
+
+def write_species_cache(table, file_path, fingerprint=None):
+    array_path, metadata_path = cache_paths(file_path)
+    metadata = dict(fingerprint or source_fingerprint(file_path))
+    metadata["sha256"] = file_sha256(file_path)
+    atomic_write(array_path, lambda file: np.save(file, table, allow_pickle=False))
+    write_cache_metadata(metadata_path, metadata)
+
+
+def load_species_table(file_path=DATABASE_PATH, use_cache=True):
+    if not use_cache:
+        return parse_species_csv(file_path)
+
+    array_path, metadata_path = cache_paths(file_path)
+    fingerprint = source_fingerprint(file_path)
+    metadata = read_cache_metadata(metadata_path)
+    if cache_is_valid(file_path, metadata, fingerprint) and os.path.exists(array_path):
+        if metadata != dict(metadata, **fingerprint):
+            try:
+                write_cache_metadata(metadata_path, dict(metadata, **fingerprint))
+            except OSError:
+                pass
+        # Memory-mapped read-only, so every process shares the same pages.
+        return np.load(array_path, mmap_mode="r", allow_pickle=False)
+
+    table = parse_species_csv(file_path)
+    try:
+        write_species_cache(table, file_path, fingerprint)
+    except OSError:
+        pass
+    return table
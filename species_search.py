@@ -0,0 +1,85 @@
+import re
+from bisect import bisect_left
+from difflib import SequenceMatcher
+
+import numpy as np
+
+# Infraspecific ranks and qualifiers; everything from them on is dropped so
+# "Quercus ilex subsp. rotundifolia" resolves to "quercus ilex".
+RANK_MARKERS = re.compile(r"\s(subsp|ssp|var|f|cf|aff|sp|spp|x)\b\.?(\s.*)?$")
+CANDIDATES = 10
+
+
+def normalize_name(name):
+    return " ".join(name.replace("_", " ").split()).lower()
+
+
+def canonical_name(name):
+    name = normalize_name(name)
+    return RANK_MARKERS.sub("", name).strip()
+
+
+def trigrams(name):
+    padded = f"  {name} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def build_search_index(display_names):
+    names = {}
+    for display_name in display_names:
+        names.setdefault(normalize_name(display_name), display_name.strip())
+    ordered = sorted(names)
+    postings = {}
+    sizes = np.empty(len(ordered))
+    for i, name in enumerate(ordered):
+        grams = trigrams(name)
+        sizes[i] = len(grams)
+        for gram in grams:
+            postings.setdefault(gram, []).append(i)
+    postings = {gram: np.array(rows, dtype=np.int64) for gram, rows in postings.items()}
+    return {"names": ordered, "display": names, "trigrams": postings, "sizes": sizes}
+
+
+def complete_species(index, prefix, limit=10):
+    prefix = normalize_name(prefix)
+    if not prefix:
+        return []
+    names = index["names"]
+    matches = []
+    for i in range(bisect_left(names, prefix), len(names)):
+        if not names[i].startswith(prefix) or len(matches) >= limit:
+            break
+        matches.append(index["display"][names[i]])
+    return matches
+
+
+def suggest_species(index, query, limit=5, cutoff=0.6):
+    query = normalize_name(query)
+    if not query:
+        return []
+    canonical = canonical_name(query)
+    suggestions = []
+    if canonical != query and canonical in index["display"]:
+        suggestions.append((1.0, canonical))
+
+    grams = trigrams(query)
+    rows = [index["trigrams"][gram] for gram in grams if gram in index["trigrams"]]
+    names = index["names"]
+    if rows:
+        # Dice coefficient of the trigram sets picks the candidates in one
+        # bincount; only those few are scored by the slower SequenceMatcher.
+        shared = np.bincount(np.concatenate(rows), minlength=len(names))
+        dice = 2 * shared / (len(grams) + index["sizes"])
+        top = np.argpartition(-dice, min(CANDIDATES, len(names) - 1))[:CANDIDATES]
+        for i in top[dice[top] > 0].tolist():
+            name = names[i]
+            score = SequenceMatcher(None, canonical or query, name).ratio()
+            if score >= cutoff:
+                suggestions.append((score, name))
+
+    ranked = []
+    for _, name in sorted(suggestions, key=lambda item: (-item[0], item[1])):
+        display = index["display"][name]
+        if display not in ranked:
+            ranked.append(display)
+    return ranked[:limit]
@@ -0,0 +1,64 @@
+import subprocess
+import sys
+
+from benchmark import (
+    compare_results,
+    import_times,
+    load_results,
+    run_benchmarks,
+    save_results,
+    startup_report,
+    synthetic_species_rows,
+    write_synthetic_run,
+)
+from run_table import read_run_table
+
+
+def test_synthetic_run_is_a_valid_picarro_file(tmp_path):
+    path = tmp_path / "run.csv"
+    write_synthetic_run(str(path), 50)
+
+    table = read_run_table(path)
+
+    assert len(table["Delta CRDS"]) == 50
+    assert table["Sample Id"][-1] == "50"
+    assert table["Start Time"][1] > table["Start Time"][0]
+    assert len(synthetic_species_rows(30)) == 30
+
+
+def test_benchmark_results_are_stored_and_compared(tmp_path):
+    results = run_benchmarks([20], [30], repeat=1, report=lambda line: None)
+    stages = {result["stage"] for result in results}
+    assert {"read_csv", "adjusted_delta_table", "species_lookup_indexed"} <= stages
+    assert "plot_adjusted_data" in stages
+
+    output = tmp_path / "results.jsonl"
+    first = save_results(str(output), results)
+    second = save_results(str(output), results)
+
+    assert len(load_results(str(output))) == 2
+    assert "1.00x" in compare_results(first, second)
+
+
+def test_importing_data_analyze_skips_scipy_and_matplotlib():
+    loaded = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, data_analyze; "
+            "print(' '.join(m for m in ('scipy', 'matplotlib', 'yaml') "
+            "if m in sys.modules))",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.split()
+    assert loaded == []
+
+
+def test_startup_report():
+    names = {name for name, _, _, _ in import_times("run_table")}
+    assert {"run_table", "numpy"} <= names
+    report = startup_report("run_table")
+    assert report.startswith("Importing run_table took")
+    assert "numpy" in report
@@ -0,0 +1,118 @@
+import json
+
+import numpy as np
+import pytest
+
+from calibration import (
+    DEFAULT_CALIBRATION,
+    calibrate_run,
+    fit_calibration,
+    identify_standards,
+    load_calibration_config,
+)
+from data_analyze import adjusted_delta, glucose_average, main, read_csv
+from run_table import read_run_table
+from test_data_analyzer import isotopic_data
+
+
+def make_table(sample_ids, true_values, hours, slope, intercept, drift):
+    true_values = np.asarray(true_values, dtype=float)
+    hours = np.asarray(hours, dtype=float)
+    measured = (true_values - intercept - drift * hours) / slope
+    start = np.datetime64("2024-07-03T08:00:00") + (hours * 3600).astype(
+        "timedelta64[s]"
+    )
+    return {
+        "Sample Id": np.array(sample_ids),
+        "Description": np.array([""] * len(sample_ids)),
+        "Delta CRDS": measured,
+        "Start Time": start,
+    }
+
+
+CONFIG = {
+    "model": "linear_drift",
+    "standards": [
+        {"name": "glucose", "pattern": "^GLU", "value": -11.768},
+        {"name": "USGS40", "pattern": "^USGS40$", "value": -26.39},
+    ],
+}
+
+
+def test_default_calibration_matches_first_three_rows_rule(tmp_path):
+    path = tmp_path / "run.csv"
+    path.write_text(isotopic_data)
+    rows = read_csv(path)
+    expected = adjusted_delta(rows, glucose_average(rows))
+
+    sample_ids, corrected, fit = calibrate_run(
+        read_run_table(path), DEFAULT_CALIBRATION
+    )
+
+    assert sample_ids.tolist() == ["4", "5"]
+    assert corrected.tolist() == pytest.approx([value for _, value in expected])
+    assert fit["standards"]["glucose"]["n"] == 3
+
+
+def test_linear_drift_calibration_recovers_true_values():
+    sample_ids = ["GLU-1", "USGS40", "A", "B", "GLU-2", "C", "USGS40", "GLU-3"]
+    true_values = [-11.768, -26.39, -28.0, -30.5, -11.768, -25.2, -26.39, -11.768]
+    hours = [0, 0.5, 1, 2, 3, 4, 5, 6]
+    table = make_table(sample_ids, true_values, hours, 1.02, 0.4, -0.15)
+
+    ids, corrected, fit = calibrate_run(table, CONFIG)
+
+    assert ids.tolist() == ["A", "B", "C"]
+    assert corrected.tolist() == pytest.approx([-28.0, -30.5, -25.2])
+    assert fit["coefficients"]["drift"] == pytest.approx(-0.15)
+    assert fit["standards"]["glucose"]["n"] == 3
+    assert fit["rmse"] == pytest.approx(0.0, abs=1e-9)
+
+
+def test_identify_standards_by_description():
+    table = {
+        "Sample Id": np.array(["1", "2", "3"]),
+        "Description": np.array(["glucose std", "leaf", "Glucose"]),
+        "Delta CRDS": np.zeros(3),
+    }
+    known, material = identify_standards(
+        table, [{"name": "glucose", "pattern": "glucose", "value": -11.768}]
+    )
+    assert material.tolist() == [0, -1, 0]
+    assert np.isnan(known[1])
+
+
+def test_linear_model_needs_two_reference_materials():
+    table = make_table(
+        ["GLU", "GLU", "A"], [-11.768, -11.768, -28.0], [0, 1, 2], 1, 0, 0
+    )
+    with pytest.raises(ValueError, match="two reference materials"):
+        fit_calibration(table, dict(CONFIG, model="linear"))
+
+
+def test_main_with_calibration_config(tmp_path):
+    config_path = tmp_path / "calibration.json"
+    config_path.write_text(
+        json.dumps(
+            {
+                "model": "offset",
+                "standards": [
+                    {"name": "glucose", "pattern": "^[123]$", "value": -11.768}
+                ],
+            }
+        )
+    )
+    assert load_calibration_config(config_path)["model"] == "offset"
+    run_path = tmp_path / "run.csv"
+    run_path.write_text(isotopic_data)
+    summary = tmp_path / "summary.csv"
+
+    exit_code = main(
+        [str(run_path), "-c", str(config_path), "-j", "1"]
+        + ["-o", str(tmp_path / "out.csv"), "-s", str(summary)]
+    )
+
+    assert exit_code == 0
+    row = read_csv(summary)[0]
+    assert row["calibration"].startswith("offset: intercept=")
+    assert float(row["glucose_average"]) == pytest.approx((-6.743 - 6.803 - 6.741) / 3)
@@ -2,6 +2,7 @@ import pytest
 import tempfile
 import os
 from unittest import mock
+import data_analyze
 from data_analyze import (
     read_csv,
     glucose_average,
@@ -13,7 +14,17 @@ from data_analyze import (
     ask_for_statistical_analysis,
     adjusted_values,
     offer_to_plot_data,
+    process_run_file,
+    collect_run_files,
+    batch_process,
+    main,
+    lookup_species,
+    species_index,
+    genus_index,
 )
+from run_table import parse_run_bytes
+from session import build_species_index
+from species_db import DATABASE_PATH, species_table_from_rows
 
 # Sample data for testing
 isotopic_data = """Sample Id,Peak Number,Description,Start Time,End Time,Max 12CO2 (ppm),12CO2 Integral,13CO2 Integral,Delta CRDS,12CO2 Baseline,13CO2 Baseline,Threshold,Number of data points,Time interval (seconds)
@@ -162,20 +173,24 @@ def test_adjusted_delta():
 
 @mock.patch("data_analyze.filedialog.askopenfilename")
 @mock.patch("data_analyze.messagebox.showinfo")
-@mock.patch("data_analyze.read_csv")
-@mock.patch("data_analyze.glucose_average")
+@mock.patch("session.read_run_table")
 def test_load_isotopic_data(
-    mock_glucose_average,
-    mock_read_csv,
+    mock_read_run_table,
     mock_showinfo,
     mock_askopenfilename,
 ):
     mock_askopenfilename.return_value = "/fake/path/to/file.csv"
+    mock_read_run_table.return_value = parse_run_bytes(isotopic_data.encode())
 
     load_isotopic_data()
 
     mock_askopenfilename.assert_called_once()
-    mock_read_csv.assert_called_once_with("/fake/path/to/file.csv")
+    mock_read_run_table.assert_called_once_with("/fake/path/to/file.csv")
+    assert data_analyze.session.run_table is mock_read_run_table.return_value
+    assert [sample_id for sample_id, _ in data_analyze.session.adjusted_values] == [
+        "4",
+        "5",
+    ]
     assert mock_showinfo.call_count == 2
     mock_showinfo.assert_any_call(
         "Info", "Processed isotopic data and calculated adjusted delta values."
@@ -197,11 +212,16 @@ def mock_showerror():
         yield m
 
 
-def test_load_species_data(mock_read_csv, mock_showerror):
+@mock.patch("data_analyze.load_species_table")
+def test_load_species_data(mock_load_species_table, mock_showerror):
+    mock_load_species_table.return_value = species_table_from_rows(
+        [{"species": "Quercus ilex", "little.d13.org": "-27.0"}]
+    )
 
     load_species_data()
-    mock_read_csv.assert_called_once_with("leaf13C_database.csv")
+    mock_load_species_table.assert_called_once_with(DATABASE_PATH)
     mock_showerror.assert_not_called()
+    assert species_index["quercus ilex"].tolist() == [0]
 
 
 @mock.patch("data_analyze.simpledialog.askinteger")
@@ -390,3 +410,77 @@ def test_offer_to_plot_data(mock_askyesno, mock_plot_adjusted_data):
     mock_plot_adjusted_data.assert_called_once_with(
         adjusted_values, species_d13c_value, group_data
     )
+
+
+def test_batch_process_reports_failed_files(tmp_path):
+    good_path = tmp_path / "run1.csv"
+    good_path.write_text(isotopic_data)
+    bad_path = tmp_path / "run2.csv"
+    bad_path.write_text("Sample Id,Delta CRDS\n")
+
+    file_paths = collect_run_files([str(tmp_path)])
+    assert file_paths == [str(good_path), str(bad_path)]
+
+    table, summary = batch_process(file_paths, workers=2)
+
+    expected = process_run_file(str(good_path))["adjusted_values"]
+    assert [(row["Sample Id"], row["Adjusted Delta"]) for row in table] == expected
+    assert summary[0]["status"] == "ok"
+    assert summary[0]["n_samples"] == 2
+    assert summary[1]["status"] == "failed"
+    assert "ZeroDivisionError" in summary[1]["error"]
+
+
+def test_main_writes_consolidated_table(tmp_path):
+    for name in ("run1.csv", "run2.csv"):
+        (tmp_path / name).write_text(isotopic_data)
+    output = tmp_path / "out.csv"
+    summary = tmp_path / "summary.csv"
+
+    exit_code = main(
+        [str(tmp_path / "*.csv"), "-o", str(output), "-s", str(summary), "-j", "1"]
+    )
+
+    assert exit_code == 0
+    rows = read_csv(output)
+    assert len(rows) == 4
+    assert {row["Sample Id"] for row in rows} == {"4", "5"}
+    assert len(read_csv(summary)) == 2
+
+
+def test_lookup_species_aggregates_all_records():
+    rows = [
+        {
+            "species": "Quercus ilex ",
+            "little.d13.org": "-27.0",
+            "big.D13.merged": "19.5",
+        },
+        {
+            "species": "quercus  ilex",
+            "little.d13.org": "-25.0",
+            "big.D13.merged": "18.5",
+        },
+        {"species": "Quercus ilex", "little.d13.org": "NA", "big.D13.merged": "20.0"},
+        {
+            "species": "Quercus robur",
+            "little.d13.org": "-29.0",
+            "big.D13.merged": "21.0",
+        },
+    ]
+    table = species_table_from_rows(rows)
+    by_species, by_genus = build_species_index(table)
+
+    with mock.patch("data_analyze.session.species_data", table), mock.patch.dict(
+        species_index, by_species, clear=True
+    ), mock.patch.dict(genus_index, by_genus, clear=True):
+        result = lookup_species("QUERCUS ILEX")
+        genus = lookup_species("Quercus suber", by_genus=True)
+        missing = lookup_species("Quercus suber")
+
+    assert result["species"] == "Quercus ilex"
+    assert len(result["records"]) == 3
+    assert result["little.d13.org"] == {"n": 2, "mean": -26.0, "median": -26.0}
+    assert result["big.D13.merged"]["n"] == 3
+    assert result["big.D13.merged"]["median"] == 19.5
+    assert genus["little.d13.org"]["n"] == 3
+    assert missing is None
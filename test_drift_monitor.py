@@ -0,0 +1,128 @@
+import csv
+import io
+from contextlib import redirect_stdout
+
+import pytest
+
+from data_analyze import main
+from drift_monitor import (
+    CHART_SETTINGS,
+    chart_update,
+    drift_history,
+    main as monitor_main,
+    record_runs,
+)
+from test_data_analyzer import isotopic_data
+from test_run_archive import shifted_run
+
+# Twenty in-control runs alternating around the standard, four runs shifted
+# by about two sigma and one far outside the limits.
+OFFSETS = [0.05, -0.05] * 10 + [0.1] * 4 + [1.0]
+
+
+@pytest.fixture
+def runs(tmp_path):
+    paths = []
+    for day, offset in enumerate(OFFSETS):
+        header, rows = shifted_run(day, offset)
+        path = tmp_path / f"run{day:02d}.csv"
+        path.write_text("\n".join([header] + rows) + "\n")
+        paths.append(str(path))
+    return paths
+
+
+def standard_flags(db_path):
+    return [row["flags"] for row in drift_history(db_path, metrics=["standard_mean"])]
+
+
+def test_charts_flag_shifts(tmp_path, runs):
+    db_path = str(tmp_path / "monitor.sqlite")
+    # Recorded out of order and in two batches: runs are charted by start
+    # time and the second batch continues from the stored state.
+    first = record_runs(db_path, runs[:20][::-1], instrument="G2131")
+    second = record_runs(db_path, runs, instrument="G2131")
+    assert first["recorded"][0][0] == runs[0]
+    assert second["skipped"] == runs[:20]
+    assert [path for path, _ in second["recorded"]] == runs[20:]
+
+    flags = standard_flags(db_path)
+    assert flags[:22] == [""] * 22
+    assert flags[22:] == ["", "ewma,cusum_high", "shewhart,ewma,cusum_high"]
+    history = drift_history(db_path, metrics=["standard_mean"])
+    assert history[20]["center"] == pytest.approx(-6.762333, abs=1e-6)
+    assert history[20]["sigma"] == pytest.approx(0.05 * (20 / 19) ** 0.5)
+    # The standard SD does not move when the whole run is shifted.
+    assert not any(
+        row["flags"] for row in drift_history(db_path, metrics=["standard_sd"])
+    )
+
+
+def test_chart_update_matches_batch_formulas():
+    settings = {
+        "baseline_runs": 3,
+        "shewhart_limit": 3.0,
+        "ewma_lambda": 0.5,
+        "ewma_limit": 3.0,
+        "cusum_k": 0.5,
+        "cusum_h": 5.0,
+    }
+    state = None
+    for value in (1.0, 2.0, 3.0, None, 4.0, 2.0):
+        state = chart_update(state, value, settings)
+    assert state["n"] == 3
+    assert (state["center"], state["sigma"]) == (2.0, 1.0)
+    assert state["ewma"] == pytest.approx(0.5 * 2.0 + 0.25 * 4.0 + 0.25 * 2.0)
+    assert state["cusum_high"] == pytest.approx(1.0)
+    assert state["cusum_low"] == 0.0
+
+
+def test_constant_baseline_flags_any_change():
+    settings = dict(CHART_SETTINGS, baseline_runs=3)
+    state = None
+    flags = []
+    for value in (5.0, 5.0, 5.0, 5.0, 5.5, 5.0):
+        state = chart_update(state, value, settings)
+        flags.append(state["flags"])
+    assert state["sigma"] == 0
+    assert flags == [[], [], [], [], ["shewhart"], []]
+
+
+def test_run_without_standards_fails(tmp_path):
+    empty = tmp_path / "empty.csv"
+    empty.write_text(isotopic_data.splitlines()[0] + "\n")
+    result = record_runs(str(tmp_path / "monitor.sqlite"), [str(empty)])
+    assert result["failed"] == [(str(empty), "The run has no glucose standard rows")]
+
+
+def test_main_records_and_plots(tmp_path, runs):
+    db_path = str(tmp_path / "monitor.sqlite")
+    arguments = runs + ["-o", str(tmp_path / "out.csv")]
+    arguments += ["-s", str(tmp_path / "summary.csv"), "-j", "1"]
+    assert main(arguments + ["--monitor", db_path]) == 0
+    assert standard_flags(db_path)[-1] == "shewhart,ewma,cusum_high"
+
+    plot = tmp_path / "drift.png"
+    output = io.StringIO()
+    with redirect_stdout(output):
+        assert (
+            monitor_main([db_path, "--metrics", "standard_mean", "--plot", str(plot)])
+            == 0
+        )
+    assert plot.stat().st_size > 0
+    rows = list(csv.DictReader(io.StringIO(output.getvalue())))
+    assert len(rows) == len(OFFSETS)
+    assert monitor_main([str(tmp_path / "missing.sqlite")]) == 1
+
+
+def test_main_reports_runs_the_monitor_cannot_record(tmp_path, capsys):
+    good = tmp_path / "good.csv"
+    good.write_text(isotopic_data)
+    empty = tmp_path / "empty.csv"
+    empty.write_text(isotopic_data.splitlines()[0] + "\n")
+    arguments = [str(good), str(empty), "-o", str(tmp_path / "out.csv")]
+    arguments += ["-s", str(tmp_path / "summary.csv"), "-j", "1"]
+
+    assert main(arguments + ["--monitor", str(tmp_path / "monitor.sqlite")]) == 1
+    output = capsys.readouterr()
+    assert "Recorded the standards of 1 of 2 new runs" in output.out
+    assert f"Not recorded: {empty}: The run has no glucose standard rows" in output.err
@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+from scipy.stats import kruskal, ttest_ind, tukey_hsd
+
+from group_stats import analyze_groups, format_posthoc, format_report
+
+values = [-15.3, -14.5, -14.7, -14.7, -15.2, -15.3, -14.9, -15.7, -14.6, -14.7]
+labels = [1, 2, 2, 3, 1, 3, 1, 2, 3, 1]
+
+
+def group_values():
+    return [
+        [v for v, label in zip(values, labels) if label == group] for group in (1, 2, 3)
+    ]
+
+
+def test_analyze_groups_descriptives_and_omnibus_tests():
+    result = analyze_groups(values, labels)
+    groups = result["groups"]
+
+    assert groups["group"].tolist() == [1, 2, 3]
+    assert groups["n"].tolist() == [4, 3, 3]
+    assert groups["mean"][1] == pytest.approx(np.mean(group_values()[1]))
+    assert groups["stdev"][1] == pytest.approx(np.std(group_values()[1], ddof=1))
+    assert groups["median"].tolist() == [-15.05, -14.7, -14.7]
+    assert result["t_test"] is None
+    assert result["anova"]["pvalue"] > 0.05
+    assert result["kruskal"]["statistic"] == pytest.approx(
+        kruskal(*group_values()).statistic
+    )
+    assert format_report(result).splitlines()[-1].startswith("ANOVA: F-statistic")
+
+
+def test_posthoc_tests_match_scipy():
+    result = analyze_groups(values, labels)
+    samples = group_values()
+
+    welch = result["welch"]
+    assert list(zip(welch["group_a"].tolist(), welch["group_b"].tolist())) == [
+        (1, 2),
+        (1, 3),
+        (2, 3),
+    ]
+    expected = ttest_ind(samples[0], samples[1], equal_var=False)
+    assert welch["statistic"][0] == pytest.approx(expected.statistic)
+    assert welch["pvalue"][0] == pytest.approx(expected.pvalue)
+
+    tukey = result["tukey_hsd"]
+    expected = tukey_hsd(*samples)
+    assert tukey["pvalue"].tolist() == pytest.approx(
+        [expected.pvalue[0, 1], expected.pvalue[0, 2], expected.pvalue[1, 2]],
+        abs=1e-4,
+    )
+    assert "Tukey HSD 1 vs 2" in format_posthoc(result)
+
+
+def test_two_groups_use_t_test():
+    result = analyze_groups(
+        [1.0, 2.0, 3.0, 4.0, 5.0, 6.0], ["a", "a", "a", "b", "b", "b"]
+    )
+    assert result["t_test"]["statistic"] == pytest.approx(
+        ttest_ind([1.0, 2.0, 3.0], [4.0, 5.0, 6.0]).statistic
+    )
+    assert result["anova"] is None
+
+
+def test_many_groups():
+    rng = np.random.default_rng(0)
+    labels = np.repeat(np.arange(300), 20)
+    values = rng.normal(-27, 1, len(labels)) + (labels == 7) * 5
+
+    result = analyze_groups(values, labels)
+
+    assert len(result["groups"]["n"]) == 300
+    assert len(result["welch"]["pvalue"]) == 300 * 299 // 2
+    assert np.isnan(result["tukey_hsd"]["pvalue"]).all()
+    pairs_with_7 = (result["tukey_hsd"]["group_a"] == 7) | (
+        result["tukey_hsd"]["group_b"] == 7
+    )
+    assert result["tukey_hsd"]["reject"][pairs_with_7].all()
+    assert "pairs differ" in format_posthoc(result)
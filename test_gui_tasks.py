@@ -0,0 +1,83 @@
+import threading
+import time
+from unittest import mock
+
+import pytest
+
+import data_analyze
+from gui_tasks import TaskCancelled, TaskRunner
+from test_data_analyzer import isotopic_data
+
+
+def wait_for(runner, timeout=5):
+    deadline = time.monotonic() + timeout
+    while runner.busy() and time.monotonic() < deadline:
+        runner.process_events()
+        time.sleep(0.01)
+    assert not runner.busy()
+
+
+@pytest.fixture
+def runner():
+    runner = TaskRunner()
+    yield runner
+    runner.shutdown()
+
+
+def test_results_and_progress_come_back_on_the_polling_thread(runner):
+    caller = threading.get_ident()
+    progress = []
+    done = []
+    runner.on_progress = lambda task_id, fraction, message: progress.append(
+        (fraction, message, threading.get_ident())
+    )
+
+    def work(value, task):
+        task.progress(0.5, "halfway")
+        return value * 2, threading.get_ident()
+
+    runner.submit(work, 21, on_done=done.append)
+    wait_for(runner)
+
+    assert done[0][0] == 42
+    assert done[0][1] != caller
+    assert progress[0] == (0.5, "halfway", caller)
+    assert progress[-1][1] == "Ready"
+
+
+def test_cancelled_task_reports_cancellation(runner):
+    started = threading.Event()
+    errors = []
+
+    def work(task):
+        started.set()
+        while True:
+            task.check_cancelled()
+            time.sleep(0.01)
+
+    task_id = runner.submit(work, on_error=errors.append)
+    started.wait(5)
+    runner.cancel(task_id)
+    wait_for(runner)
+
+    assert isinstance(errors[0], TaskCancelled)
+
+
+@mock.patch("data_analyze.messagebox.showinfo")
+@mock.patch("data_analyze.filedialog.askopenfilename")
+def test_load_isotopic_data_runs_in_background(
+    mock_askopenfilename, mock_showinfo, runner, tmp_path
+):
+    path = tmp_path / "run.csv"
+    path.write_text(isotopic_data)
+    mock_askopenfilename.return_value = str(path)
+
+    with mock.patch.object(data_analyze, "task_runner", runner):
+        data_analyze.load_isotopic_data()
+        assert runner.busy()
+        wait_for(runner)
+
+    assert [sample_id for sample_id, _ in data_analyze.adjusted_values] == ["4", "5"]
+    mock_showinfo.assert_any_call(
+        "Info", "Processed isotopic data and calculated adjusted delta values."
+    )
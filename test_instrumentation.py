@@ -0,0 +1,100 @@
+import json
+
+import pytest
+
+import instrumentation
+from data_analyze import glucose_average, main
+from instrumentation import (
+    OFF,
+    count_rows,
+    current_profile,
+    finish_profile,
+    run_profiled,
+    stage,
+    start_profile,
+)
+from run_table import parse_run_bytes
+from test_data_analyzer import isotopic_data
+
+
+def test_hooks_do_nothing_when_off():
+    assert current_profile() is None
+    assert stage("read_run_table") is OFF
+    count_rows("read_run_table", 5)
+    table = parse_run_bytes(isotopic_data.encode())
+    assert glucose_average(table) == pytest.approx((-6.743 - 6.803 - 6.741) / 3)
+    assert current_profile() is None
+
+
+def test_nested_profiles_and_captures():
+    table = parse_run_bytes(isotopic_data.encode())
+    outer = start_profile("batch", ("cprofile", "tracemalloc"))
+    try:
+        with stage("read_run_table"):
+            count_rows("read_run_table", 5)
+        average, report = run_profiled(
+            "run.csv", ("cprofile", "tracemalloc"), glucose_average, table
+        )
+        outer["runs"].append(report)
+    finally:
+        outer_report = finish_profile(outer)
+    assert current_profile() is None
+
+    assert average == pytest.approx((-6.743 - 6.803 - 6.741) / 3)
+    assert report["label"] == "run.csv"
+    assert report["stages"]["glucose_average"]["calls"] == 1
+    # The outer profile already hooks cProfile, so the run only traces memory.
+    assert "cprofile" not in report and report["tracemalloc"]["peak_bytes"] > 0
+    assert outer_report["stages"]["read_run_table"] == {
+        "calls": 1,
+        "seconds": pytest.approx(0, abs=1),
+        "rows": 5,
+    }
+    assert "glucose_average" not in outer_report["stages"]
+    assert any("glucose_average" in row["function"] for row in outer_report["cprofile"])
+    assert outer_report["runs"] == [report]
+
+
+def test_main_writes_a_report_per_run(tmp_path, monkeypatch):
+    paths = []
+    for name in ("run1.csv", "run2.csv"):
+        path = tmp_path / name
+        path.write_text(isotopic_data)
+        paths.append(str(path))
+    arguments = paths + ["-o", str(tmp_path / "out.csv")]
+    arguments += ["-s", str(tmp_path / "summary.csv"), "-j", "1"]
+
+    report_path = tmp_path / "profile.json"
+    assert (
+        main(
+            arguments + ["--profile", str(report_path), "--profile-capture", "cprofile"]
+        )
+        == 0
+    )
+    report = json.loads(report_path.read_text())
+    assert report["argv"][-1] == "cprofile"
+    assert report["stages"]["batch_process"]["calls"] == 1
+    assert [run["label"] for run in report["runs"]] == paths
+    run = report["runs"][0]
+    assert run["stages"]["read_run_table"]["rows"] == 5
+    assert run["stages"]["adjusted_delta"]["rows"] == 2
+    assert run["cprofile"] and "tracemalloc" not in run
+
+    # Rows are counted under the stage that corrected them.
+    assert (
+        main(arguments + ["--profile", str(report_path), "--sequence-gap", "60"]) == 0
+    )
+    run = json.loads(report_path.read_text())["runs"][0]
+    assert run["stages"]["adjusted_delta_sequences"] == {
+        "calls": 1,
+        "seconds": pytest.approx(0, abs=1),
+        "rows": 2,
+    }
+    assert "adjusted_delta" not in run["stages"]
+
+    env_report = tmp_path / "env.json"
+    monkeypatch.setenv(instrumentation.PROFILE_ENV, str(env_report))
+    assert main(arguments) == 0
+    assert len(json.loads(env_report.read_text())["runs"]) == 2
+    monkeypatch.setenv(instrumentation.CAPTURE_ENV, "perf")
+    assert main(arguments) == 1
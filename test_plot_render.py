@@ -0,0 +1,103 @@
+import os
+
+from matplotlib import colormaps
+from matplotlib.figure import Figure
+
+from data_analyze import main
+from plot_render import (
+    draw_adjusted_data,
+    plot_paths,
+    render_adjusted_plot,
+    render_plots,
+)
+from test_data_analyzer import isotopic_data
+
+adjusted_values = [("Sample1", -15.0), ("Sample2", -14.5), ("Sample3", -14.8)]
+group_data = {1: [("Sample1", -15.0), ("Sample3", -14.8)], 2: ["Sample2"]}
+
+
+def test_draw_colors_bars_by_group():
+    ax = Figure().add_subplot()
+
+    bars = draw_adjusted_data(ax, adjusted_values, {"Quercus ilex": -27.0}, group_data)
+
+    colors = colormaps["tab10"].colors
+    assert bars[0].get_facecolor()[:3] == colors[1]
+    assert bars[2].get_facecolor()[:3] == colors[1]
+    assert bars[1].get_facecolor()[:3] == colors[2]
+    assert ax.get_legend() is not None
+
+
+def test_render_adjusted_plot_formats(tmp_path):
+    signatures = {"png": b"\x89PNG", "svg": b"<?xml", "pdf": b"%PDF"}
+    for plot_format, signature in signatures.items():
+        path = tmp_path / f"plot.{plot_format}"
+        render_adjusted_plot(str(path), adjusted_values, group_data=group_data)
+        assert path.read_bytes().startswith(signature)
+
+
+def test_render_plots_reports_failures(tmp_path):
+    jobs = [
+        {"output_path": str(tmp_path / "ok.png"), "adjusted_values": adjusted_values},
+        {
+            "output_path": str(tmp_path / "missing" / "bad.png"),
+            "adjusted_values": adjusted_values,
+        },
+    ]
+
+    results = render_plots(jobs, workers=2)
+
+    assert results[0] == (str(tmp_path / "ok.png"), None)
+    assert results[1][1].startswith("FileNotFoundError")
+    assert (tmp_path / "ok.png").exists()
+
+
+def test_main_renders_one_plot_per_run(tmp_path):
+    for name in ("run1.csv", "run2.csv"):
+        (tmp_path / name).write_text(isotopic_data)
+    plot_dir = tmp_path / "plots"
+
+    exit_code = main(
+        [str(tmp_path / "run*.csv"), "--plot-dir", str(plot_dir)]
+        + ["--plot-format", "svg", "-j", "2"]
+        + ["-o", str(tmp_path / "out.csv"), "-s", str(tmp_path / "summary.csv")]
+    )
+
+    assert exit_code == 0
+    assert sorted(path.name for path in plot_dir.iterdir()) == [
+        "run1.svg",
+        "run2.svg",
+    ]
+
+
+def test_runs_named_alike_get_their_own_plots(tmp_path):
+    runs = ["data/day1/run.csv", "data/day2/run.csv", "other.csv", "day1_run.csv"]
+    assert plot_paths("plots", runs) == [
+        os.path.join("plots", "day1_run.png"),
+        os.path.join("plots", "day2_run.png"),
+        os.path.join("plots", "other.png"),
+        os.path.join("plots", "day1_run_2.png"),
+    ]
+
+    for day in ("day1", "day2"):
+        (tmp_path / day).mkdir()
+        (tmp_path / day / "run.csv").write_text(isotopic_data)
+    plot_dir = tmp_path / "plots"
+    exit_code = main(
+        [str(tmp_path / "day1"), str(tmp_path / "day2"), "--plot-dir", str(plot_dir)]
+        + ["-j", "1", "-o", str(tmp_path / "out.csv")]
+        + ["-s", str(tmp_path / "summary.csv")]
+    )
+    assert exit_code == 0
+    assert sorted(path.name for path in plot_dir.iterdir()) == [
+        "day1_run.png",
+        "day2_run.png",
+    ]
+
+
+def test_render_plots_reports_each_job(tmp_path):
+    path = str(tmp_path / "missing" / "same.png")
+    jobs = [{"output_path": path, "adjusted_values": adjusted_values}] * 2
+    results = render_plots(jobs, workers=1)
+    assert [output_path for output_path, _ in results] == [path, path]
+    assert all(error.startswith("FileNotFoundError") for _, error in results)
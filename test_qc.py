@@ -0,0 +1,152 @@
+import csv
+import json
+
+import numpy as np
+import pytest
+
+from calibration import DEFAULT_CALIBRATION, fit_calibration
+from data_analyze import main, process_run_file
+from qc import (
+    QC_LIMITS,
+    failed_rows,
+    flag_reasons,
+    load_qc_limits,
+    qc_report_rows,
+    quality_flags,
+)
+from run_table import read_run_table
+from test_data_analyzer import isotopic_data
+
+
+def write_run(tmp_path, text=isotopic_data, name="run.csv"):
+    path = tmp_path / name
+    path.write_text(text)
+    return path
+
+
+def bad_run():
+    lines = isotopic_data.splitlines()
+    # Sample 4: low CO2 and few data points; sample 5: 13C integral off.
+    lines[4] = lines[4].replace("3526.403", "512.000").replace(",427,", ",120,")
+    lines[5] = lines[5].replace("6603.579", "6703.579")
+    return "\n".join(lines) + "\n"
+
+
+def test_clean_run_passes_all_checks(tmp_path):
+    table = read_run_table(write_run(tmp_path))
+    flags = quality_flags(table)
+    assert set(flags) == {
+        "co2_range",
+        "baseline_12co2",
+        "baseline_13co2",
+        "data_points",
+        "ratio_mismatch",
+    }
+    assert not failed_rows(flags, 5).any()
+
+
+def test_quality_flags_and_reasons(tmp_path):
+    table = read_run_table(write_run(tmp_path, bad_run()))
+    flags = quality_flags(table)
+    assert failed_rows(flags, 5).tolist() == [False, False, False, True, True]
+    reasons = flag_reasons(flags, 5)
+    assert reasons[3] == "co2_range;data_points"
+    assert reasons[4] == "ratio_mismatch"
+
+    report = qc_report_rows(table, flags, "run.csv")
+    assert [row["Sample Id"] for row in report] == ["4", "5"]
+    assert report[0]["row"] == 4
+
+
+def test_missing_values_fail_and_missing_columns_are_skipped():
+    table = {
+        "Sample Id": np.array(["1", "2"]),
+        "Delta CRDS": np.array([-6.7, -6.8]),
+        "Max 12CO2 (ppm)": np.array([3000.0, np.nan]),
+    }
+    flags = quality_flags(table, {"min_co2_ppm": 2000})
+    assert list(flags) == ["co2_range"]
+    assert flags["co2_range"].tolist() == [False, True]
+
+    report = qc_report_rows(table, flags)
+    assert len(report) == 1
+    assert np.isnan(report[0]["Max 12CO2 (ppm)"])
+    assert report[0]["12CO2 Baseline"] == ""
+    assert report[0]["integral residual"] == ""
+
+
+def test_qc_on_a_run_with_only_ids_and_deltas(tmp_path):
+    path = write_run(
+        tmp_path, "Sample Id,Delta CRDS\n1,-6.743\n2,-6.803\n3,-6.741\n4,-10.310\n"
+    )
+    result = process_run_file(str(path), qc="flag")
+    assert result["error"] is None
+    assert result["qc_report"] == []
+    assert result["qc_failed"] == 0
+
+
+def test_load_qc_limits(tmp_path):
+    path = tmp_path / "limits.json"
+    path.write_text(json.dumps({"max_12co2_baseline": 10}))
+    limits = load_qc_limits(path)
+    assert limits["max_12co2_baseline"] == 10
+    assert limits["min_co2_ppm"] == QC_LIMITS["min_co2_ppm"]
+
+    path.write_text(json.dumps({"max_baseline": 10}))
+    with pytest.raises(ValueError, match="max_baseline"):
+        load_qc_limits(path)
+
+
+def test_failed_standard_is_left_out_of_the_fit(tmp_path):
+    table = read_run_table(write_run(tmp_path))
+    exclude = np.array([False, True, False, False, False])
+    fit = fit_calibration(table, DEFAULT_CALIBRATION, exclude)
+    assert fit["n_standards"] == 2
+    assert fit["standards"]["glucose"]["measured_mean"] == pytest.approx(
+        (-6.743 - 6.741) / 2
+    )
+    assert fit["is_standard"].tolist() == [True, True, True, False, False]
+
+
+def test_process_run_file_flag_and_drop(tmp_path):
+    path = write_run(tmp_path, bad_run())
+    flagged = process_run_file(str(path), qc="flag")
+    assert flagged["qc_failed"] == 2
+    assert [value[0] for value in flagged["adjusted_values"]] == ["4", "5"]
+    assert flagged["qc_reasons"] == ["co2_range;data_points", "ratio_mismatch"]
+
+    dropped = process_run_file(str(path), qc="drop")
+    assert dropped["adjusted_values"] == []
+    assert len(dropped["qc_report"]) == 2
+
+
+def test_main_writes_qc_report(tmp_path):
+    good = write_run(tmp_path, name="good.csv")
+    bad = write_run(tmp_path, bad_run(), name="bad.csv")
+    output = tmp_path / "out.csv"
+    report = tmp_path / "qc.csv"
+    assert (
+        main(
+            [
+                str(good),
+                str(bad),
+                "-o",
+                str(output),
+                "-s",
+                str(tmp_path / "summary.csv"),
+                "--qc",
+                "drop",
+                "--qc-report",
+                str(report),
+                "-j",
+                "1",
+            ]
+        )
+        == 0
+    )
+    with open(output, newline="") as file:
+        rows = list(csv.DictReader(file))
+    assert [row["file"] for row in rows] == [str(good), str(good)]
+    with open(report, newline="") as file:
+        failures = list(csv.DictReader(file))
+    assert [row["Sample Id"] for row in failures] == ["4", "5"]
@@ -0,0 +1,102 @@
+import csv
+
+import numpy as np
+import pytest
+
+from data_analyze import main, process_isotopic_file
+from gui_tasks import TaskContext
+from replicates import (
+    aggregate_replicates,
+    collapse_replicates,
+    reject_outliers,
+    replicate_groups,
+)
+from test_data_analyzer import isotopic_data
+
+VALUES = [-10.0, -10.1, -9.9, -10.05, -14.0, -20.0, -20.1, -5.0]
+SAMPLE_IDS = ["4", "4", "4", "4", "4", "5", "5", "6"]
+
+
+def test_replicate_groups_keep_run_order():
+    keys, inverse = replicate_groups(
+        ["9", "2", "9", "2", "2"], peaks=[1, 1, 1, 1, 2], files=["a"] * 5
+    )
+    assert keys["id"].tolist() == ["9", "2", "2"]
+    assert keys["peak"].tolist() == [1, 1, 2]
+    assert inverse.tolist() == [0, 1, 0, 1, 2]
+
+
+def test_aggregate_without_rejection():
+    aggregate = aggregate_replicates(VALUES, SAMPLE_IDS)
+    assert aggregate["Sample Id"].tolist() == ["4", "5", "6"]
+    assert aggregate["n"].tolist() == [5, 2, 1]
+    assert aggregate["mean"][1] == pytest.approx(-20.05)
+    assert aggregate["sd"][1] == pytest.approx(np.std([-20.0, -20.1], ddof=1))
+    assert np.isnan(aggregate["sd"][2])
+
+
+@pytest.mark.parametrize("rule", ["grubbs", "mad"])
+def test_outlier_rules_reject_the_odd_injection(rule):
+    aggregate = aggregate_replicates(VALUES, SAMPLE_IDS, rules=(rule,))
+    assert np.flatnonzero(aggregate["rejected"]).tolist() == [4]
+    assert aggregate["n_rejected"].tolist() == [1, 0, 0]
+    assert aggregate["mean"][0] == pytest.approx(-10.0125)
+
+
+def test_drop_first_keeps_single_injections():
+    _, inverse = replicate_groups(SAMPLE_IDS)
+    rejected = reject_outliers(VALUES, inverse, ("drop_first",))
+    assert np.flatnonzero(rejected).tolist() == [0, 5]
+
+
+def test_unknown_rule():
+    _, inverse = replicate_groups(SAMPLE_IDS)
+    with pytest.raises(ValueError, match="median"):
+        reject_outliers(VALUES, inverse, ("median",))
+
+
+def test_collapse_replicates():
+    values = list(zip(SAMPLE_IDS, VALUES))
+    collapsed = collapse_replicates(values, rules=("drop_first", "grubbs"))
+    assert [sample_id for sample_id, _ in collapsed] == ["4", "5", "6"]
+    assert collapsed[0][1] == pytest.approx(np.mean([-10.1, -9.9, -10.05]))
+
+
+def replicate_run():
+    lines = isotopic_data.splitlines()
+    return "\n".join(lines + [lines[4].replace("-10.310", "-10.210")]) + "\n"
+
+
+def test_process_isotopic_file_collapses_replicates(tmp_path):
+    path = tmp_path / "run.csv"
+    path.write_text(replicate_run())
+    _, values = process_isotopic_file(str(path), TaskContext())
+    assert [sample_id for sample_id, _ in values] == ["4", "5"]
+    average = (-6.743 - 6.803 - 6.741) / 3
+    assert values[0][1] == pytest.approx(-10.26 - average - 11.768)
+
+
+def test_main_writes_replicate_table(tmp_path):
+    path = tmp_path / "run.csv"
+    path.write_text(replicate_run())
+    output = tmp_path / "replicates.csv"
+    assert (
+        main(
+            [
+                str(path),
+                "-o",
+                str(tmp_path / "out.csv"),
+                "-s",
+                str(tmp_path / "summary.csv"),
+                "--replicates",
+                "--replicate-output",
+                str(output),
+                "-j",
+                "1",
+            ]
+        )
+        == 0
+    )
+    with open(output, newline="") as file:
+        rows = list(csv.DictReader(file))
+    assert [(row["Sample Id"], row["n"]) for row in rows] == [("4", "2"), ("5", "1")]
@@ -0,0 +1,113 @@
+import os
+
+import pytest
+
+from data_analyze import main
+from results_store import connect, ingest_files, query_results
+from sample_sheet import load_sample_sheet
+from test_data_analyzer import isotopic_data
+from test_sample_sheet import sheet_csv
+
+
+@pytest.fixture
+def runs(tmp_path):
+    first = tmp_path / "run1.csv"
+    first.write_text(isotopic_data)
+    second = tmp_path / "run2.csv"
+    second.write_text(isotopic_data.replace("2024/07/03", "2024/08/14"))
+    return [str(first), str(second)]
+
+
+def test_ingest_skips_stored_runs(tmp_path, runs):
+    db_path = str(tmp_path / "results.sqlite")
+    sheet_path = tmp_path / "sheet.csv"
+    sheet_path.write_text(sheet_csv)
+    sheet = load_sample_sheet(str(sheet_path))
+
+    first = ingest_files(db_path, runs[:1], instrument="G2131", sheet=sheet, workers=1)
+    second = ingest_files(db_path, runs, instrument="G2131", sheet=sheet, workers=1)
+
+    assert first["ingested"] == [(runs[0], 2)]
+    assert second["ingested"] == [(runs[1], 2)]
+    assert second["skipped"] == [runs[0]]
+    connection = connect(db_path)
+    assert connection.execute("SELECT COUNT(*) FROM results").fetchone() == (4,)
+    connection.close()
+
+    rows = query_results(db_path, group=2, start="2024-08-01")
+    assert [(row["sample_id"], row["start_time"]) for row in rows] == [
+        ("5", "2024-08-14T12:06:36")
+    ]
+    assert rows[0]["adjusted_delta"] == pytest.approx(
+        -9.451 - ((-6.743 - 6.803 - 6.741) / 3 + 11.768)
+    )
+    assert len(query_results(db_path, species="Quercus ilex", instrument="G2131")) == 4
+    assert query_results(db_path, instrument="other") == []
+
+
+def test_failed_run_is_reported_and_not_stored(tmp_path, runs):
+    bad = tmp_path / "bad.csv"
+    bad.write_text("Sample Id,Delta CRDS\n")
+    db_path = str(tmp_path / "results.sqlite")
+
+    result = ingest_files(db_path, [runs[0], str(bad)], workers=1)
+
+    assert result["ingested"] == [(runs[0], 2)]
+    assert result["failed"][0][0] == str(bad)
+    assert len(query_results(db_path)) == 2
+
+
+def test_run_without_start_time_is_stored(tmp_path):
+    run = tmp_path / "untimed.csv"
+    run.write_text(
+        "Sample Id,Delta CRDS\n1,-6.743\n2,-6.803\n3,-6.741\n4,-10.310\n5,-9.451\n"
+    )
+    db_path = str(tmp_path / "results.sqlite")
+
+    result = ingest_files(db_path, [str(run)], workers=1)
+
+    assert result["failed"] == []
+    assert result["ingested"] == [(str(run), 2)]
+    assert [row["start_time"] for row in query_results(db_path)] == [None, None]
+
+
+def test_replicate_injections_are_stored(tmp_path):
+    # Sample 4 is injected twice with the same Peak Number.
+    lines = isotopic_data.splitlines()
+    lines.append(lines[4].replace("11:51:04", "12:20:00").replace("-10.310", "-10.250"))
+    run = tmp_path / "rep.csv"
+    run.write_text("\n".join(lines) + "\n")
+    db_path = str(tmp_path / "results.sqlite")
+
+    result = ingest_files(db_path, [str(run)], workers=1)
+
+    assert result["failed"] == []
+    assert result["ingested"] == [(str(run), 3)]
+    rows = query_results(db_path)
+    assert [(row["sample_id"], row["peak"], row["injection"]) for row in rows] == [
+        ("4", 1, 1),
+        ("5", 1, 1),
+        ("4", 1, 2),
+    ]
+    assert rows[2]["delta_raw"] == -10.25
+
+
+def test_main_ingests_into_db(tmp_path, runs, capsys):
+    db_path = str(tmp_path / "results.sqlite")
+
+    assert main(runs + ["--db", db_path, "-j", "1"]) == 0
+    assert main(runs + ["--db", db_path, "-j", "1"]) == 0
+
+    assert "skipped 2 already stored runs" in capsys.readouterr().out
+    assert len(query_results(db_path)) == 4
+
+
+def test_main_rejects_batch_options_with_db(tmp_path, runs, capsys):
+    db_path = str(tmp_path / "results.sqlite")
+
+    with pytest.raises(SystemExit) as error:
+        main(runs + ["--db", db_path, "-o", "out.csv", "--replicates"])
+
+    assert error.value.code == 2
+    assert "-o/--output, --replicates" in capsys.readouterr().err
+    assert not os.path.exists(db_path)
@@ -0,0 +1,128 @@
+import csv
+import os
+
+import numpy as np
+import pytest
+
+from data_analyze import main
+from run_archive import (
+    close_archive,
+    correct_archive,
+    day_ranges,
+    index_paths,
+    open_archive,
+    read_rows,
+)
+from run_table import adjusted_delta_table, glucose_average_table, parse_run_bytes
+from test_data_analyzer import isotopic_data
+
+
+def shifted_run(days, offset):
+    # The test run moved by whole days, with Delta CRDS shifted by offset.
+    header, *lines = isotopic_data.splitlines()
+    table = parse_run_bytes(isotopic_data.encode())
+    rows = []
+    for line, start, end, delta in zip(
+        lines,
+        table["Start Time"] + np.timedelta64(days, "D"),
+        table["End Time"] + np.timedelta64(days, "D"),
+        table["Delta CRDS"] + offset,
+    ):
+        fields = line.split(",")
+        fields[3] = str(start).replace("-", "/").replace("T", " ")
+        fields[4] = str(end).replace("-", "/").replace("T", " ")
+        fields[8] = f"{delta:.3f}"
+        rows.append(",".join(fields))
+    return header, rows
+
+
+@pytest.fixture
+def archive_path(tmp_path):
+    header, first = shifted_run(0, 0.0)
+    _, second = shifted_run(1, 0.5)
+    _, third = shifted_run(3, -1.0)
+    lines = [header] + first + [header] + second + ["", header] + third
+    path = tmp_path / "archive.csv"
+    path.write_text("\n".join(lines) + "\n")
+    return str(path)
+
+
+def test_archive_runs_match_per_run_correction(archive_path):
+    archive = open_archive(archive_path)
+    try:
+        assert archive["runs"].tolist() == [0, 5, 10]
+        assert len(archive["index"]) == 15
+        output = archive_path + ".corrected.csv"
+        summary = correct_archive(archive, output, chunk_rows=4)
+    finally:
+        close_archive(archive)
+
+    expected = []
+    for run, offset in enumerate((0.0, 0.5, -1.0)):
+        table = parse_run_bytes(isotopic_data.encode())
+        table["Delta CRDS"] = table["Delta CRDS"] + offset
+        sample_ids, adjusted = adjusted_delta_table(table, glucose_average_table(table))
+        expected += [(run, *pair) for pair in zip(sample_ids.tolist(), adjusted)]
+        assert summary[run]["n_samples"] == 2
+        assert summary[run]["mean"] == pytest.approx(adjusted.mean())
+        assert summary[run]["stdev"] == pytest.approx(adjusted.std(ddof=1))
+
+    with open(output, newline="") as file:
+        rows = list(csv.DictReader(file))
+    assert [(int(row["run"]), row["Sample Id"]) for row in rows] == [
+        (run, sample_id) for run, sample_id, _ in expected
+    ]
+    assert [float(row["Adjusted Delta"]) for row in rows] == pytest.approx(
+        [value for _, _, value in expected]
+    )
+    assert rows[0]["Peak Number"] == "1"
+
+
+def test_row_ranges_and_days_without_a_scan(archive_path):
+    archive = open_archive(archive_path)
+    try:
+        table, rows = read_rows(archive, 6, 11)
+        assert rows.tolist() == [6, 7, 8, 9, 10]
+        assert table["Sample Id"].tolist() == ["2", "3", "4", "5", "1"]
+
+        assert day_ranges(archive, "2024-07-04") == [(5, 10)]
+        assert day_ranges(archive, "2024-07-05") == []
+        summary = correct_archive(archive, day="2024-07-06")
+        assert [row["run"] for row in summary] == [2]
+        with pytest.raises(ValueError, match="no run 3"):
+            correct_archive(archive, runs=[3])
+    finally:
+        close_archive(archive)
+
+
+def test_index_is_reused_until_the_archive_changes(archive_path):
+    index_path, _ = index_paths(archive_path)
+    close_archive(open_archive(archive_path))
+    built = os.stat(index_path).st_mtime_ns
+    close_archive(open_archive(archive_path))
+    assert os.stat(index_path).st_mtime_ns == built
+
+    with open(archive_path, "a") as file:
+        file.write("1,1,,2024/07/10 10:00:00,oops,1,1,1,-6.7,1,1,1,1,1\n")
+        file.write("broken\n")
+    archive = open_archive(archive_path)
+    try:
+        assert len(archive["index"]) == 16
+        malformed = []
+        correct_archive(archive, malformed=malformed)
+    finally:
+        close_archive(archive)
+    assert malformed == [
+        (20, "End Time 'oops' is not valid"),
+        (21, "expected 14 fields, found 1"),
+    ]
+
+
+def test_main_archive_mode(archive_path, tmp_path):
+    output = tmp_path / "corrected.csv"
+    summary = tmp_path / "summary.csv"
+    arguments = [archive_path, "--archive", "-o", str(output), "-s", str(summary)]
+    assert main(arguments + ["--runs", "0", "2"]) == 0
+    with open(summary, newline="") as file:
+        assert [row["run"] for row in csv.DictReader(file)] == ["0", "2"]
+    assert main(arguments + ["--day", "July"]) == 1
@@ -0,0 +1,69 @@
+import threading
+import time
+
+import pytest
+
+from data_analyze import read_csv, glucose_average, adjusted_delta, main
+from run_stream import correct_stream, follow_lines
+from test_data_analyzer import isotopic_data
+
+
+def test_correct_stream_matches_batch_correction(tmp_path):
+    path = tmp_path / "run.csv"
+    path.write_text(isotopic_data)
+    data = read_csv(path)
+    expected = adjusted_delta(data, glucose_average(data))
+
+    results = list(correct_stream(isotopic_data.splitlines(keepends=True)))
+
+    assert [result["standard"] for result in results] == [True] * 3 + [False] * 2
+    assert results[2]["glucose_average"] == pytest.approx(glucose_average(data))
+    corrected = [(r["Sample Id"], r["Adjusted Delta"]) for r in results[3:]]
+    assert [sample_id for sample_id, _ in corrected] == ["4", "5"]
+    assert [value for _, value in corrected] == pytest.approx(
+        [value for _, value in expected]
+    )
+
+
+def test_correct_stream_resets_on_new_header():
+    lines = isotopic_data.splitlines(keepends=True)
+    results = list(correct_stream(lines + lines))
+
+    assert [result["standard"] for result in results] == [True] * 3 + [False] * 2 + [
+        True
+    ] * 3 + [False] * 2
+    assert results[5]["glucose_average"] == pytest.approx(-6.743)
+
+
+def test_follow_lines_waits_for_appended_rows(tmp_path):
+    path = tmp_path / "run.csv"
+    lines = isotopic_data.splitlines(keepends=True)
+    path.write_text("".join(lines[:2]) + lines[2][:10])
+
+    def append_rest():
+        time.sleep(0.05)
+        with open(path, mode="a") as file:
+            file.write(lines[2][10:])
+            file.writelines(lines[3:])
+
+    writer = threading.Thread(target=append_rest)
+    writer.start()
+    followed = list(follow_lines(path, poll_interval=0.01, idle_timeout=0.2))
+    writer.join()
+
+    assert followed == lines
+
+
+def test_main_follow_writes_corrected_rows(tmp_path, capsys):
+    path = tmp_path / "run.csv"
+    path.write_text(isotopic_data)
+    output = tmp_path / "live.csv"
+
+    exit_code = main(
+        [str(path), "--follow", "--poll", "0.01", "--idle-timeout", "0.02"]
+        + ["-o", str(output)]
+    )
+
+    assert exit_code == 0
+    assert [row["Sample Id"] for row in read_csv(output)] == ["4", "5"]
+    assert "Sample ID: 5" in capsys.readouterr().out
@@ -0,0 +1,204 @@
+import csv
+
+import numpy as np
+import pytest
+
+from data_analyze import read_csv, glucose_average, adjusted_delta, main
+from run_table import (
+    SEQUENCE_GAP,
+    adjusted_delta_sequences,
+    adjusted_delta_table,
+    glucose_average_table,
+    parse_run_bytes,
+    read_run_table,
+    sequence_ids,
+    table_length,
+    group_statistics,
+)
+from test_data_analyzer import isotopic_data
+from test_run_archive import shifted_run
+
+
+@pytest.fixture
+def run_file(tmp_path):
+    path = tmp_path / "run.csv"
+    path.write_text(isotopic_data)
+    return path
+
+
+def test_read_run_table_types(run_file):
+    table = read_run_table(run_file)
+
+    assert table["Delta CRDS"].dtype == np.float64
+    assert table["Number of data points"].dtype == np.int64
+    assert table["Start Time"].dtype == np.dtype("datetime64[s]")
+    assert table["Sample Id"].tolist() == ["1", "2", "3", "4", "5"]
+    assert table["Start Time"][0] == np.datetime64("2024-07-03T11:04:36")
+    assert table["Max 12CO2 (ppm)"][1] == pytest.approx(3811.591)
+
+
+def test_header_only_run_keeps_column_types():
+    table = parse_run_bytes(isotopic_data.split("\n", 1)[0].encode())
+
+    assert table_length(table) == 0
+    assert table["Delta CRDS"].dtype == np.float64
+    assert table["Peak Number"].dtype == np.int64
+    assert table["Start Time"].dtype == np.dtype("datetime64[s]")
+
+
+def test_read_run_table_strips_padded_picarro_export():
+    table = read_run_table("Isotopic_data.csv")
+
+    assert table_length(table) == 13
+    assert table["Sample Id"][0] == "1"
+    assert table["Delta CRDS"][0] == pytest.approx(-6.743)
+
+
+def test_table_correction_matches_row_correction(run_file):
+    rows = read_csv(run_file)
+    table = read_run_table(run_file)
+
+    assert glucose_average(table) == pytest.approx(glucose_average(rows))
+    table_values = adjusted_delta(table, glucose_average(table))
+    row_values = adjusted_delta(rows, glucose_average(rows))
+    assert [sample_id for sample_id, _ in table_values] == ["4", "5"]
+    assert [value for _, value in table_values] == pytest.approx(
+        [value for _, value in row_values]
+    )
+
+
+def test_group_statistics(tmp_path):
+    # Every sample injected twice.
+    path = tmp_path / "twice.csv"
+    path.write_text(isotopic_data + isotopic_data.split("\n", 1)[1])
+    table = read_run_table(path)
+    assert table_length(table) == 10
+
+    stats = group_statistics(table["Delta CRDS"], table["Sample Id"])
+
+    assert stats["group"].tolist() == ["1", "2", "3", "4", "5"]
+    assert stats["n"].tolist() == [2, 2, 2, 2, 2]
+    assert stats["mean"][3] == pytest.approx(-10.310)
+    assert stats["stdev"][3] == pytest.approx(0.0)
+
+    values = [3.0, 1.0, 2.0, 10.0, 20.0]
+    stats = group_statistics(values, [1, 1, 1, 2, 2])
+    assert stats["median"].tolist() == [2.0, 15.0]
+    assert stats["stdev"][0] == pytest.approx(1.0)
+
+
+def test_fixed_width_and_irregular_files_parse_alike(tmp_path):
+    export = open("Isotopic_data.csv", "rb").read()
+    header, _, body = export.partition(b"\n")
+    lines = body.splitlines()
+    # A concatenated export: the header repeats and a line loses its padding.
+    lines[4] = b",".join(field.strip() for field in lines[4].split(b","))
+    irregular = b"\r\n".join([header] + lines[:6] + [header] + lines[6:] + [b""])
+    path = tmp_path / "concatenated.csv"
+    path.write_bytes(irregular)
+
+    fixed = read_run_table("Isotopic_data.csv", chunk_bytes=256)
+    table = read_run_table(path)
+    assert table_length(table) == 13
+    for name, column in fixed.items():
+        assert column.tolist() == table[name].tolist()
+    assert table["Start Time"].dtype == np.dtype("datetime64[s]")
+    assert table["Peak Number"].dtype == np.int64
+
+
+def test_malformed_rows_are_reported_by_line(run_file):
+    lines = run_file.read_text().splitlines()
+    lines[2] = lines[2].replace("-6.803", "oops")
+    lines[4] = "4,1"
+    lines.append("6,1,,2024/07/03 12:00:00,not a time,1,1,1,-14,1,1,1,1,1")
+    data = "\n".join(lines).encode()
+
+    with pytest.raises(ValueError, match="line 3: Delta CRDS 'oops'.*line 5"):
+        parse_run_bytes(data)
+
+    malformed = []
+    table = parse_run_bytes(data, malformed)
+    assert malformed == [
+        (3, "Delta CRDS 'oops' is not valid"),
+        (5, "expected 14 fields, found 2"),
+        (7, "End Time 'not a time' is not valid"),
+    ]
+    assert table["Sample Id"].tolist() == ["1", "3", "5"]
+
+
+def test_quoted_fields_keep_their_commas(run_file):
+    lines = run_file.read_text().splitlines()
+    lines[4] = lines[4].replace("1,,2024", '1,"leaf, sun",2024', 1)
+    lines.append('6,1,"shade",2024/07/03 12:20:00,,1,1,1,-14,1,1,1,1,1')
+    lines.append('7,1,"broken, row",1')
+    malformed = []
+    table = parse_run_bytes("\n".join(lines).encode(), malformed)
+    assert malformed == [(8, "expected 14 fields, found 4")]
+    assert table["Sample Id"].tolist() == ["1", "2", "3", "4", "5", "6"]
+    assert table["Description"].tolist() == ["", "", "", "leaf, sun", "", "shade"]
+    assert table["Delta CRDS"][3] == -10.310
+    assert np.isnat(table["End Time"][5])
+
+
+def test_header_schema_is_validated():
+    with pytest.raises(ValueError, match="no Delta CRDS column"):
+        parse_run_bytes(b"Sample Id,Peak Number\n1,1\n")
+    with pytest.raises(ValueError, match="repeats the Sample Id column"):
+        parse_run_bytes(b"Sample Id,Delta CRDS, Sample Id\n1,1,1\n")
+    assert parse_run_bytes(b"") == {}
+    assert table_length(parse_run_bytes(b"Sample Id,Delta CRDS\n")) == 0
+
+
+def test_sequences_are_corrected_independently(tmp_path):
+    header, first = shifted_run(0, 0.0)
+    _, second = shifted_run(1, 0.5)
+    _, third = shifted_run(0, -1.0)
+    # The third sequence starts right after the second: only the Sample Id
+    # restart separates them.
+    third = [
+        line.replace("2024/07/03 12:", "2024/07/04 14:").replace(
+            "2024/07/03 11:", "2024/07/04 13:"
+        )
+        for line in third
+    ]
+    path = tmp_path / "week.csv"
+    path.write_text("\n".join([header] + first + second + third) + "\n")
+    table = read_run_table(path)
+
+    sequences = sequence_ids(table)
+    assert sequences.tolist() == [0] * 5 + [1] * 5 + [2] * 5
+    assert sequence_ids(table, np.timedelta64(30, "D")).tolist() == sequences.tolist()
+    table["Sample Id"][10] = "6"
+    assert sequence_ids(table).tolist()[10:] == [1] * 5
+    table["Sample Id"][10] = "1"
+    # A check standard reusing the first standard's id, followed by samples,
+    # stays in its sequence.
+    table["Sample Id"][3] = "1"
+    assert sequence_ids(table).tolist() == sequences.tolist()
+    table["Sample Id"][11] = "7"
+    assert sequence_ids(table).tolist()[10:] == [1] * 5
+    table["Sample Id"][11] = "2"
+    table["Sample Id"][3] = "4"
+
+    result = adjusted_delta_sequences(table, sequences)
+    single = parse_run_bytes(isotopic_data.encode())
+    _, expected = adjusted_delta_table(single, glucose_average_table(single))
+    assert result["Sample Id"].tolist() == ["4", "5"] * 3
+    assert result["sequence"].tolist() == [0, 0, 1, 1, 2, 2]
+    assert result["adjusted"] == pytest.approx(np.tile(expected, 3))
+    assert result["averages"] - result["averages"][0] == pytest.approx([0, 0.5, -1])
+    assert len(result["residuals"]) == 9
+    assert SEQUENCE_GAP == np.timedelta64(1, "h")
+
+    output = tmp_path / "out.csv"
+    arguments = [str(path), "-o", str(output), "-s", str(tmp_path / "summary.csv")]
+    assert main(arguments + ["-j", "1", "--sequence-gap", "60"]) == 0
+    with open(output, newline="") as file:
+        rows = list(csv.DictReader(file))
+    assert [row["sequence"] for row in rows] == ["0", "0", "1", "1", "2", "2"]
+    assert [float(row["Adjusted Delta"]) for row in rows] == pytest.approx(
+        np.tile(expected, 3)
+    )
+    with open(tmp_path / "summary.csv", newline="") as file:
+        assert next(csv.DictReader(file))["sequences"] == "3"
+    assert main(arguments + ["--sequence-gap", "60", "--qc", "flag"]) == 1
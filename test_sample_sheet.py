@@ -0,0 +1,109 @@
+from unittest import mock
+
+import pytest
+
+from data_analyze import main, plot_adjusted_data, read_csv, statistical_analysis
+from sample_sheet import group_by_sheet, load_sample_sheet, sample_names_from_sheet
+from test_data_analyzer import isotopic_data
+
+sheet_csv = """Sample Id,Group,Name,Species,Treatment
+4,1,Control A,Quercus ilex,control
+5,2,Drought A,Quercus ilex,drought
+6,2,,Quercus ilex,drought
+7,,Blank,,
+"""
+
+adjusted_values = [("4", -15.3), ("5", -14.5), ("6", -14.7), ("7", -14.9)]
+
+
+@pytest.fixture
+def sheet_path(tmp_path):
+    path = tmp_path / "sheet.csv"
+    path.write_text(sheet_csv)
+    return str(path)
+
+
+def test_load_csv_sample_sheet(sheet_path):
+    sheet = load_sample_sheet(sheet_path)
+
+    assert sheet["4"] == {
+        "group": 1,
+        "name": "Control A",
+        "species": "Quercus ilex",
+        "treatment": "control",
+    }
+    assert sheet["6"]["name"] is None
+    assert sheet["7"]["group"] is None
+
+
+def test_load_yaml_sample_sheet(tmp_path):
+    pytest.importorskip("yaml")
+    path = tmp_path / "sheet.yaml"
+    path.write_text(
+        "samples:\n"
+        "  4: {group: 1, name: Control A}\n"
+        "  5: {group: drought, treatment: drought}\n"
+    )
+
+    sheet = load_sample_sheet(str(path))
+
+    assert sheet["4"]["group"] == 1
+    assert sheet["5"]["group"] == "drought"
+    assert sheet["5"]["name"] is None
+
+
+def test_group_by_sheet(sheet_path):
+    sheet = load_sample_sheet(sheet_path)
+
+    group_data, unassigned = group_by_sheet(adjusted_values, sheet)
+
+    assert group_data == {1: [("4", -15.3)], 2: [("5", -14.5), ("6", -14.7)]}
+    assert unassigned == ["7"]
+    assert sample_names_from_sheet(["4", "6", "8"], sheet) == ["Control A", "6", "8"]
+
+
+@mock.patch("data_analyze.simpledialog.askinteger")
+def test_statistical_analysis_with_sample_sheet(mock_askinteger, sheet_path):
+    sheet = load_sample_sheet(sheet_path)
+
+    group_data, report = statistical_analysis(adjusted_values, sheet)
+
+    mock_askinteger.assert_not_called()
+    assert list(group_data) == [1, 2]
+    assert report.splitlines()[-1].startswith("T-Test")
+
+
+@mock.patch("matplotlib.pyplot.show")
+@mock.patch("data_analyze.simpledialog.askstring")
+@mock.patch("data_analyze.simpledialog.askinteger")
+@mock.patch("data_analyze.messagebox.askyesno")
+def test_plot_with_sample_sheet_asks_nothing(
+    mock_askyesno, mock_askinteger, mock_askstring, mock_show, sheet_path
+):
+    sheet = load_sample_sheet(sheet_path)
+
+    plot_adjusted_data(adjusted_values, None, sheet=sheet)
+
+    mock_askyesno.assert_not_called()
+    mock_askinteger.assert_not_called()
+    mock_askstring.assert_not_called()
+    mock_show.assert_called_once()
+
+
+def test_main_joins_sample_sheet(tmp_path, sheet_path, capsys):
+    run_path = tmp_path / "run.csv"
+    run_path.write_text(isotopic_data)
+    output = tmp_path / "out.csv"
+
+    exit_code = main(
+        [str(run_path), "--sample-sheet", sheet_path, "-j", "1"]
+        + ["-o", str(output), "-s", str(tmp_path / "summary.csv")]
+    )
+
+    assert exit_code == 0
+    rows = read_csv(output)
+    assert [(row["Sample Id"], row["group"], row["name"]) for row in rows] == [
+        ("4", "1", "Control A"),
+        ("5", "2", "Drought A"),
+    ]
+    assert "Group 1: Mean" in capsys.readouterr().out
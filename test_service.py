@@ -0,0 +1,136 @@
+import asyncio
+import json
+import shutil
+import threading
+
+import pytest
+
+from data_analyze import adjusted_delta, glucose_average, read_csv
+import service
+from service import correct_batch, start_service
+from run_table import parse_run_bytes
+from species_db import DATABASE_PATH
+from test_data_analyzer import isotopic_data
+
+
+async def request(port, method, path, body=b"", headers=None):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    lines = [f"{method} {path} HTTP/1.1", "Host: localhost"]
+    lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+    lines.append(f"Content-Length: {len(body)}")
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, payload = response.partition(b"\r\n\r\n")
+    status = int(head.split()[1])
+    return status, payload
+
+
+def run_with_service(tmp_path, scenario, window=0.005):
+    database = tmp_path / "leaf13C_database.csv"
+    shutil.copy(DATABASE_PATH, database)
+
+    async def main():
+        service, server = await start_service(
+            port=0, species_path=str(database), window=window
+        )
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            return await scenario(service, port)
+
+    return asyncio.run(main())
+
+
+def test_correct_batch_matches_adjusted_delta(tmp_path):
+    path = tmp_path / "run.csv"
+    path.write_text(isotopic_data)
+    rows = read_csv(path)
+    expected = adjusted_delta(rows, glucose_average(rows), verbose=False)
+
+    table = parse_run_bytes(isotopic_data.encode())
+    empty = parse_run_bytes(isotopic_data.splitlines()[0].encode())
+    results = correct_batch([table, table, empty])
+
+    for result in results[:2]:
+        assert [sample_id for sample_id, _ in result["adjusted_values"]] == ["4", "5"]
+        assert [value for _, value in result["adjusted_values"]] == pytest.approx(
+            [value for _, value in expected]
+        )
+    assert "error" in results[2]
+
+
+def test_concurrent_corrections_are_batched(tmp_path):
+    async def scenario(service, port):
+        responses = await asyncio.gather(
+            *[
+                request(port, "POST", "/correct", isotopic_data.encode())
+                for _ in range(6)
+            ]
+        )
+        csv_response = await request(
+            port, "POST", "/correct?format=csv", isotopic_data.encode()
+        )
+        return responses, csv_response, service.batcher.batches
+
+    responses, csv_response, batches = run_with_service(tmp_path, scenario, window=0.2)
+    for status, payload in responses:
+        assert status == 200
+        values = json.loads(payload)["adjusted_values"]
+        assert [sample_id for sample_id, _ in values] == ["4", "5"]
+    assert batches == 2
+    assert csv_response[0] == 200
+    assert csv_response[1].decode().splitlines()[0] == "Sample Id,Adjusted Delta"
+
+
+def test_run_bodies_are_parsed_off_the_event_loop(tmp_path, monkeypatch):
+    threads = []
+
+    def parse(body):
+        threads.append(threading.current_thread())
+        return parse_run_bytes(body)
+
+    monkeypatch.setattr(service, "parse_run_bytes", parse)
+
+    async def scenario(service, port):
+        return await request(port, "POST", "/correct", isotopic_data.encode())
+
+    status, _ = run_with_service(tmp_path, scenario)
+    assert status == 200
+    assert threads and threads[0] is not threading.main_thread()
+
+
+def test_species_statistics_and_errors(tmp_path):
+    async def scenario(service, port):
+        return (
+            await request(port, "GET", "/species?name=Achillea%20millefolium"),
+            await request(port, "GET", "/species?name=Reaumuria%20songarica"),
+            await request(
+                port,
+                "POST",
+                "/statistics",
+                json.dumps(
+                    {
+                        "values": [["4", -15.3], ["5", -15.1], ["6", -14.2]],
+                        "sample_groups": {"4": 1, "5": 1, "6": 2},
+                    }
+                ).encode(),
+            ),
+            await request(port, "POST", "/statistics", b"[1, 2]"),
+            await request(port, "GET", "/correct"),
+            await request(port, "GET", "/nothing"),
+        )
+
+    found, missing, statistics, invalid, wrong_method, unknown = run_with_service(
+        tmp_path, scenario
+    )
+    assert found[0] == 200
+    assert json.loads(found[1])["species"] == "Achillea millefolium"
+    assert json.loads(missing[1])["suggestions"][0] == "Reaumuria soongarica"
+
+    result = json.loads(statistics[1])
+    assert result["groups"]["n"] == [2, 1]
+    assert result["report"].startswith("Group 1: Mean = -15.200")
+    assert invalid[0] == 400
+    assert wrong_method[0] == 405
+    assert unknown[0] == 404
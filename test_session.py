@@ -0,0 +1,76 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import data_analyze
+from session import AnalysisSession, species_state
+from species_db import species_table_from_rows
+from test_data_analyzer import isotopic_data
+
+
+def write_run(tmp_path, name, offset):
+    lines = isotopic_data.splitlines()
+    for i in (4, 5):
+        fields = lines[i].split(",")
+        fields[8] = f"{float(fields[8]) + offset:.3f}"
+        lines[i] = ",".join(fields)
+    path = tmp_path / name
+    path.write_text("\n".join(lines) + "\n")
+    return str(path)
+
+
+def test_load_run_matches_the_gui_correction(tmp_path):
+    path = write_run(tmp_path, "run.csv", 0)
+    session = AnalysisSession()
+    values = session.load_run(path)
+    table, expected = data_analyze.process_isotopic_file(
+        path, data_analyze.TaskContext()
+    )
+    assert [sample_id for sample_id, _ in values] == ["4", "5"]
+    assert [value for _, value in values] == pytest.approx(
+        [value for _, value in expected]
+    )
+    assert session.adjusted_values == values
+    assert session.run_table["Sample Id"].tolist() == table["Sample Id"].tolist()
+
+
+def test_sessions_do_not_share_state(tmp_path):
+    paths = [write_run(tmp_path, f"run{i}.csv", i) for i in range(8)]
+    sessions = [AnalysisSession() for _ in paths]
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(lambda args: args[0].load_run(args[1]), zip(sessions, paths)))
+
+    first = [value for _, value in sessions[0].adjusted_values]
+    for i, session in enumerate(sessions):
+        values = [value for _, value in session.adjusted_values]
+        assert values == pytest.approx([value + i for value in first])
+    assert data_analyze.session not in sessions
+
+
+def test_species_lookup_and_group_statistics():
+    session = AnalysisSession(
+        sample_sheet={
+            "4": {"group": 1, "name": None, "species": None, "treatment": None},
+            "5": {"group": 1, "name": None, "species": None, "treatment": None},
+            "6": {"group": 2, "name": None, "species": None, "treatment": None},
+            "7": {"group": 2, "name": None, "species": None, "treatment": None},
+        }
+    )
+    assert session.lookup_species("Quercus ilex") is None
+    session.set_species(
+        species_state(
+            species_table_from_rows(
+                [{"species": "Quercus ilex", "little.d13.org": "-27.0"}]
+            )
+        )
+    )
+    assert session.lookup_species("quercus  ILEX")["little.d13.org"]["n"] == 1
+    assert session.suggest_species("Quercus ilx") == ["Quercus ilex"]
+
+    session.set_adjusted_values(
+        [("4", -15.3), ("5", -15.1), ("6", -14.2), ("7", -14.0)]
+    )
+    result = session.group_statistics()
+    assert result["groups"]["n"].tolist() == [2, 2]
+    assert list(session.group_data) == [1, 2]
+    assert AnalysisSession().group_statistics() is None
@@ -0,0 +1,119 @@
+import csv
+
+import numpy as np
+import pytest
+
+from data_analyze import main
+from session import AnalysisSession
+from spatial_index import build_spatial_index, great_circle_km, nearby_records
+from species_db import species_table_from_rows
+from test_data_analyzer import isotopic_data
+
+SITES = [
+    # species, ps.type, little.d13.org, latitude, longitude, year
+    ("Quercus ilex", "C3", "-27.0", "0", "0", "2001"),
+    ("Zea mays", "C4", "-12.0", "0", "0.5", "2005"),
+    ("Quercus robur", "C3", "-29.0", "0", "1", "1990"),
+    ("Agave sp", "CAM", "-14.0", "0", "179.9", "2010"),
+    ("Pinus nigra", "C3", "-26.0", "0", "-179.9", "NA"),
+]
+
+
+@pytest.fixture
+def table():
+    return species_table_from_rows(
+        [
+            {
+                "species": species,
+                "ps.type": ps_type,
+                "little.d13.org": value,
+                "big.D13.org": "NA",
+                "big.D13.merged": "NA",
+                "latitude": latitude,
+                "longitude": longitude,
+                "author": "Test_etal",
+                "year": year,
+            }
+            for species, ps_type, value, latitude, longitude, year in SITES
+        ]
+    )
+
+
+def test_radius_query_is_sorted_and_crosses_the_dateline(table):
+    index = build_spatial_index(table)
+    rows, distances = nearby_records(index, table, 0, 0.1, radius_km=101)
+    assert rows.tolist() == [0, 1, 2]
+    assert distances == pytest.approx([11.12, 44.48, 100.08], abs=0.05)
+
+    rows, distances = nearby_records(index, table, 0, 180, radius_km=20)
+    assert sorted(rows.tolist()) == [3, 4]
+    assert distances == pytest.approx([11.12, 11.12], abs=0.05)
+
+
+def test_filters_and_nearest(table):
+    index = build_spatial_index(table)
+    rows, _ = nearby_records(index, table, 0, 0, radius_km=500, ps_type=["c3"])
+    assert rows.tolist() == [0, 2]
+    rows, _ = nearby_records(
+        index, table, 0, 0, radius_km=None, k=2, years=(2000, 2020)
+    )
+    assert rows.tolist() == [0, 1]
+    # The nearest CAM record is on the other side of the globe.
+    rows, distances = nearby_records(index, table, 0, 0, None, k=1, ps_type=["CAM"])
+    assert rows.tolist() == [3]
+    assert distances[0] == pytest.approx(great_circle_km(2) - 11.12, abs=0.05)
+    with pytest.raises(ValueError):
+        nearby_records(index, table, 0, 0, radius_km=None)
+
+
+def test_matches_brute_force_on_random_records():
+    rng = np.random.default_rng(0)
+    latitude = rng.uniform(-90, 90, 2000)
+    longitude = rng.uniform(-180, 180, 2000)
+    table = np.zeros(2000, dtype=[("latitude", float), ("longitude", float)])
+    table["latitude"], table["longitude"] = latitude, longitude
+    index = build_spatial_index(table)
+
+    lat, lon = np.radians(latitude), np.radians(longitude)
+    site_lat, site_lon = np.radians(48.0), np.radians(11.0)
+    haversine = (
+        np.sin((lat - site_lat) / 2) ** 2
+        + np.cos(lat) * np.cos(site_lat) * np.sin((lon - site_lon) / 2) ** 2
+    )
+    expected = 2 * 6371.0 * np.arcsin(np.sqrt(haversine))
+
+    rows, distances = nearby_records(index, table, 48.0, 11.0, radius_km=1500)
+    assert sorted(rows.tolist()) == np.flatnonzero(expected <= 1500).tolist()
+    assert distances == pytest.approx(expected[rows], abs=1e-6)
+    rows, _ = nearby_records(index, table, 48.0, 11.0, None, k=25)
+    assert rows.tolist() == np.argsort(expected)[:25].tolist()
+
+
+def test_session_nearby_reference(table):
+    session = AnalysisSession()
+    assert session.nearby_reference(0, 0) is None
+    session.set_species((table, {}, {}, None))
+    stats = session.nearby_reference(0, 0, radius_km=150, ps_type=["C3"])
+    assert stats["species"] == "within 150 km of 0, 0"
+    assert stats["little.d13.org"] == {"n": 2, "mean": -28.0, "median": -28.0}
+    assert stats["species_count"] == 2
+
+
+def test_main_writes_site_references(tmp_path):
+    run = tmp_path / "run.csv"
+    run.write_text(isotopic_data)
+    sites = tmp_path / "sites.csv"
+    sites.write_text("Sample Id,Latitude,Longitude\n4,40.433,22\n5,-80,0\n")
+    output = tmp_path / "site_references.csv"
+    arguments = [str(run), "-o", str(tmp_path / "out.csv")]
+    arguments += ["-s", str(tmp_path / "summary.csv"), "-j", "1"]
+    arguments += ["--sites", str(sites), "--site-output", str(output)]
+    assert main(arguments + ["--site", "40.433", "22", "--radius", "50"]) == 0
+    with open(output, newline="") as file:
+        rows = list(csv.DictReader(file))
+    assert [row["Sample Id"] for row in rows] == ["4", "5"]
+    assert int(rows[0]["n"]) > 0 and float(rows[0]["nearest_km"]) < 1
+    assert rows[1]["n"] == "0" and rows[1]["nearest_km"] == ""
+
+    sites.write_text("Sample Id,Latitude\n4,40\n")
+    assert main(arguments) == 1
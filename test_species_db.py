@@ -0,0 +1,58 @@
+import os
+import shutil
+from unittest import mock
+
+import numpy as np
+import pytest
+
+import species_db
+from species_db import DATABASE_PATH, cache_paths, load_species_table
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = tmp_path / "leaf13C_database.csv"
+    shutil.copy(DATABASE_PATH, path)
+    return str(path)
+
+
+def test_load_species_table_types(database):
+    table = load_species_table(database, use_cache=False)
+
+    assert len(table) == 3985
+    assert table["species"][0] == "Achillea millefolium"
+    assert np.isnan(table["little.d13.org"][0])
+    assert table["big.D13.merged"][0] == pytest.approx(20.6)
+    assert table["year"][0] == 2001
+
+
+def test_cache_is_built_once_and_memory_mapped(database):
+    first = load_species_table(database)
+    assert all(os.path.exists(path) for path in cache_paths(database))
+
+    with mock.patch.object(species_db, "parse_species_csv") as mock_parse:
+        second = load_species_table(database)
+    mock_parse.assert_not_called()
+    assert isinstance(second, np.memmap)
+    assert np.array_equal(first["species"], second["species"])
+    assert np.array_equal(
+        first["little.d13.org"], second["little.d13.org"], equal_nan=True
+    )
+
+
+def test_cache_survives_touch_but_not_edit(database):
+    load_species_table(database)
+    stat = os.stat(database)
+    os.utime(database, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    with mock.patch.object(species_db, "parse_species_csv") as mock_parse:
+        load_species_table(database)
+    mock_parse.assert_not_called()
+
+    with open(database, mode="a") as file:
+        file.write("Zea mays,C4,-12.5,NA,NA,32.1,34.8,Someone_etal,2024\n")
+
+    table = load_species_table(database)
+    assert len(table) == 3986
+    assert table["species"][-1] == "Zea mays"
+    assert table["little.d13.org"][-1] == pytest.approx(-12.5)
@@ -0,0 +1,73 @@
+import time
+from unittest import mock
+
+import pytest
+
+import data_analyze
+from species_db import load_species_table
+from species_search import (
+    build_search_index,
+    canonical_name,
+    complete_species,
+    suggest_species,
+)
+
+
+@pytest.fixture(scope="module")
+def index():
+    return build_search_index(load_species_table(use_cache=False)["species"].tolist())
+
+
+def test_canonical_name_drops_infraspecific_ranks():
+    assert canonical_name("Quercus ilex subsp. rotundifolia") == "quercus ilex"
+    assert canonical_name("Pinus  nigra var. laricio") == "pinus nigra"
+    assert canonical_name("Fagus sylvatica") == "fagus sylvatica"
+
+
+def test_complete_species_by_prefix(index):
+    matches = complete_species(index, "reaumuria s")
+    assert matches == ["Reaumuria soongarica"]
+    assert all(
+        name.lower().startswith("quercus") for name in complete_species(index, "Querc")
+    )
+    assert len(complete_species(index, "q", limit=3)) == 3
+    assert complete_species(index, "") == []
+
+
+def test_suggest_species_for_typos_and_subspecies(index):
+    assert suggest_species(index, "Reaumuria songarica")[0] == "Reaumuria soongarica"
+    assert suggest_species(index, "fagus englerana")[0] == "Fagus engleriana"
+    assert (
+        suggest_species(index, "Quercus suber subsp. occidentalis")[0]
+        == "Quercus suber"
+    )
+    assert suggest_species(index, "zzzzzz") == []
+
+
+def test_lookups_are_fast(index):
+    queries = ["qu", "quer", "quercus s", "fagus eng", "pinus"]
+    start = time.perf_counter()
+    for _ in range(100):
+        for query in queries:
+            complete_species(index, query)
+    assert (time.perf_counter() - start) / 500 < 1e-3
+
+
+@mock.patch("data_analyze.messagebox.showinfo")
+@mock.patch("data_analyze.messagebox.askyesno")
+def test_search_species_offers_suggestion(mock_askyesno, mock_showinfo):
+    data_analyze.load_species_data()
+    mock_askyesno.side_effect = [True, False]
+    entry = mock.Mock()
+    entry.get.return_value = "Reaumuria songarica"
+
+    with mock.patch.object(data_analyze, "entry", entry, create=True), mock.patch.dict(
+        data_analyze.species_d13c_value, clear=True
+    ), mock.patch("data_analyze.ask_for_statistical_analysis"):
+        data_analyze.search_species()
+        found = dict(data_analyze.species_d13c_value)
+
+    assert (
+        "Did you mean 'Reaumuria soongarica'?" in mock_askyesno.call_args_list[0][0][1]
+    )
+    assert found["Reaumuria soongarica"] == pytest.approx(-26.5877, abs=1e-3)
@@ -0,0 +1,129 @@
+import csv
+
+import numpy as np
+import pytest
+
+from data_analyze import main, process_run_file
+from test_data_analyzer import isotopic_data
+from test_run_archive import shifted_run
+from test_sample_sheet import sheet_csv
+from uncertainty import propagate_uncertainty
+
+RESIDUALS = [[0.02, -0.04, 0.02], [0.1, -0.1, 0.05, -0.05]]
+
+
+def test_montecarlo_matches_the_analytic_uncertainty():
+    values = [-15.0, -14.0, -20.0]
+    result = propagate_uncertainty(
+        values, [0, 0, 1], RESIDUALS, n_draws=20000, seed=0, calibration_sd=0.05
+    )
+    standard_sd = np.array([np.std(r, ddof=1) for r in RESIDUALS])
+    offset_se = standard_sd / np.sqrt([3, 4])
+    expected = np.sqrt(standard_sd**2 + offset_se**2 + 0.05**2)[[0, 0, 1]]
+
+    assert result["mean"] == pytest.approx(values, abs=0.01)
+    assert result["sd"] == pytest.approx(expected, rel=0.05)
+    assert result["upper"] - result["lower"] == pytest.approx(
+        2 * 1.96 * expected, rel=0.05
+    )
+
+
+def test_replicate_scatter_and_chunking():
+    kwargs = dict(
+        values=[-15.0, -14.0],
+        runs=[0, 0],
+        run_residuals=[RESIDUALS[0]],
+        sd=[0.3, np.nan],
+        n=[4, 1],
+        n_draws=5000,
+        seed=1,
+    )
+    whole = propagate_uncertainty(**kwargs)
+    chunked = propagate_uncertainty(**kwargs, chunk_bytes=1)
+    assert whole["sd"][0] == pytest.approx(np.hypot(0.15, 0.0346 / np.sqrt(3)), rel=0.1)
+    assert chunked["sd"] == pytest.approx(whole["sd"], rel=0.1)
+
+
+def test_shared_run_offset_cancels_in_group_comparison():
+    result = propagate_uncertainty(
+        [-15.0, -15.1, -13.0, -13.1, -14.0],
+        [0, 0, 0, 0, 0],
+        [[0.5, -0.5, 0.4, -0.4]],
+        sd=[0.01] * 5,
+        n=[3] * 5,
+        labels=[1, 1, 2, 2, None],
+        n_draws=4000,
+        method="bootstrap",
+        seed=2,
+    )
+    groups = result["groups"]
+    assert groups["group"].tolist() == ["1", "2"]
+    pairs = groups["pairs"]
+    assert pairs["difference"][0] == pytest.approx(-2.0, abs=0.01)
+    # The offset error is shared by both groups, so the difference stays sharp.
+    assert pairs["upper"][0] - pairs["lower"][0] < 0.1
+    assert groups["upper"][0] - groups["lower"][0] > 0.5
+    assert pairs["pvalue"][0] == 0
+
+
+def test_unknown_method():
+    with pytest.raises(ValueError, match="jackknife"):
+        propagate_uncertainty([1.0], [0], [[0.1, -0.1]], method="jackknife")
+
+
+def test_process_run_file_returns_standard_residuals(tmp_path):
+    path = tmp_path / "run.csv"
+    path.write_text(isotopic_data)
+    result = process_run_file(str(path))
+    average = (-6.743 - 6.803 - 6.741) / 3
+    assert result["standard_residuals"] == pytest.approx(
+        [average + 6.743, average + 6.803, average + 6.741]
+    )
+    assert sum(result["standard_residuals"]) == pytest.approx(0)
+
+
+def test_main_writes_uncertainty_table(tmp_path):
+    run = tmp_path / "run.csv"
+    run.write_text(isotopic_data)
+    sheet = tmp_path / "sheet.csv"
+    sheet.write_text(sheet_csv)
+    output = tmp_path / "uncertainty.csv"
+    arguments = [str(run), "-o", str(tmp_path / "out.csv")]
+    arguments += ["-s", str(tmp_path / "summary.csv"), "-j", "1"]
+    arguments += ["--uncertainty", "2000", "--uncertainty-output", str(output)]
+    assert main(arguments + ["--sample-sheet", str(sheet)]) == 0
+    with open(output, newline="") as file:
+        rows = list(csv.DictReader(file))
+    assert [row["Sample Id"] for row in rows] == ["4", "5"]
+    for row in rows:
+        assert float(row["lower"]) < float(row["Adjusted Delta"]) < float(row["upper"])
+
+    config = tmp_path / "calibration.json"
+    config.write_text('{"model": "linear", "standards": []}')
+    assert main(arguments + ["-c", str(config)]) == 1
+
+
+def test_sequences_take_their_own_standard_scatter(tmp_path):
+    # The second sequence, a day later, has widely scattered standards.
+    header, first = shifted_run(0, 0.0)
+    _, second = shifted_run(1, 0.0)
+    for i, delta in enumerate(["-6.200", "-7.400", "-6.600"]):
+        fields = second[i].split(",")
+        fields[8] = delta
+        second[i] = ",".join(fields)
+    run = tmp_path / "run.csv"
+    run.write_text("\n".join([header] + first + second) + "\n")
+    output = tmp_path / "uncertainty.csv"
+    arguments = [str(run), "-o", str(tmp_path / "out.csv")]
+    arguments += ["-s", str(tmp_path / "summary.csv"), "-j", "1"]
+    arguments += ["--sequence-gap", "60", "--uncertainty", "20000"]
+    assert main(arguments + ["--uncertainty-output", str(output)]) == 0
+    with open(output, newline="") as file:
+        sd = [float(row["sd"]) for row in csv.DictReader(file)]
+
+    # One injection's scatter and the offset's standard error, per sequence.
+    for standards, sample_sd in zip(
+        [[-6.743, -6.803, -6.741], [-6.2, -7.4, -6.6]], [sd[:2], sd[2:]]
+    ):
+        expected = np.std(standards, ddof=1) * np.sqrt(1 + 1 / 3)
+        assert sample_sd == pytest.approx([expected, expected], rel=0.05)
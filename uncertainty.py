@@ -0,0 +1,191 @@
+import numpy as np
+
+UNCERTAINTY_METHODS = ("montecarlo", "bootstrap")
+DRAWS = 10**4
+CONFIDENCE = 0.95
+# Upper bound on the draws held in memory at once, in bytes.
+CHUNK_BYTES = 64 * 2**20
+UNCERTAINTY_FIELDS = [
+    "file",
+    "Sample Id",
+    "Adjusted Delta",
+    "sd",
+    "lower",
+    "upper",
+]
+
+
+def chunk_rows(n_draws, chunk_bytes=CHUNK_BYTES):
+    return max(1, chunk_bytes // (8 * n_draws))
+
+
+def offset_errors(run_residuals, n_draws, method, rng):
+    # Draws of (estimated - true) offset of every run. The offset is the mean
+    # of the standards' residuals, so its error is the error of that mean.
+    errors = np.zeros((len(run_residuals), n_draws))
+    for run, residuals in enumerate(run_residuals):
+        residuals = np.asarray(residuals, dtype=np.float64)
+        k = len(residuals)
+        if k < 2:
+            continue
+        if method == "bootstrap":
+            for start in range(0, n_draws, chunk_rows(k)):
+                stop = min(start + chunk_rows(k), n_draws)
+                picks = rng.integers(0, k, (stop - start, k))
+                errors[run, start:stop] = residuals[picks].mean(axis=1)
+            errors[run] -= residuals.mean()
+        else:
+            errors[run] = rng.normal(0, residuals.std(ddof=1) / np.sqrt(k), n_draws)
+    return errors
+
+
+def measurement_errors(runs, run_residuals, sd=None, n=None):
+    # Replicate scatter where a sample was injected more than once; otherwise
+    # the scatter of the run's standards stands in for one injection.
+    standard_sd = np.array(
+        [
+            np.std(residuals, ddof=1) if len(residuals) > 1 else 0.0
+            for residuals in run_residuals
+        ]
+    )
+    n = np.ones(len(runs)) if n is None else np.asarray(n, dtype=np.float64)
+    sd = np.full(len(runs), np.nan) if sd is None else np.asarray(sd, dtype=float)
+    replicated = (n > 1) & np.isfinite(sd)
+    scatter = np.where(replicated, sd, standard_sd[runs])
+    return scatter / np.sqrt(np.maximum(n, 1))
+
+
+def summarize_draws(draws, confidence):
+    tail = (1 - confidence) / 2
+    lower, upper = np.quantile(draws, [tail, 1 - tail], axis=1)
+    return draws.mean(axis=1), draws.std(axis=1, ddof=1), lower, upper
+
+
+def propagate_uncertainty(
+    values,
+    runs,
+    run_residuals,
+    sd=None,
+    n=None,
+    labels=None,
+    n_draws=DRAWS,
+    method="montecarlo",
+    calibration_sd=0.0,
+    confidence=CONFIDENCE,
+    seed=None,
+    chunk_bytes=CHUNK_BYTES,
+):
+    if method not in UNCERTAINTY_METHODS:
+        raise ValueError(f"Unknown uncertainty method '{method}'")
+    values = np.asarray(values, dtype=np.float64)
+    runs = np.asarray(runs, dtype=np.int64)
+    rng = np.random.default_rng(seed)
+
+    run_error = offset_errors(run_residuals, n_draws, method, rng)
+    # One reference value serves every run, so its error is shared.
+    reference_error = rng.normal(0, calibration_sd, n_draws) if calibration_sd else 0
+    noise = measurement_errors(runs, run_residuals, sd, n)
+
+    n_samples = len(values)
+    result = {
+        "mean": np.empty(n_samples),
+        "sd": np.empty(n_samples),
+        "lower": np.empty(n_samples),
+        "upper": np.empty(n_samples),
+    }
+    if labels is not None:
+        # Samples labelled None belong to no group.
+        grouped = np.array([label is not None for label in labels], dtype=bool)
+        groups, grouped_inverse = np.unique(
+            np.asarray(labels, dtype=object)[grouped].astype(str), return_inverse=True
+        )
+        inverse = np.full(n_samples, -1)
+        inverse[grouped] = grouped_inverse
+        group_sums = np.zeros((len(groups), n_draws))
+
+    # Samples are drawn a chunk at a time so memory stays bounded; only the
+    # per-group sums of the draws are kept for the group comparisons.
+    step = chunk_rows(n_draws, chunk_bytes)
+    for start in range(0, n_samples, step):
+        rows = slice(start, min(start + step, n_samples))
+        draws = rng.standard_normal((rows.stop - rows.start, n_draws))
+        draws *= noise[rows, None]
+        draws += values[rows, None]
+        draws += run_error[runs[rows]]
+        draws += reference_error
+        (
+            result["mean"][rows],
+            result["sd"][rows],
+            result["lower"][rows],
+            result["upper"][rows],
+        ) = summarize_draws(draws, confidence)
+        if labels is not None:
+            members = inverse[rows]
+            one_hot = members == np.arange(len(groups))[:, None]
+            group_sums += one_hot.astype(np.float64) @ draws
+
+    if labels is not None:
+        counts = np.bincount(grouped_inverse, minlength=len(groups))
+        result["groups"] = compare_groups(
+            groups, group_sums / counts[:, None], confidence, chunk_bytes
+        )
+    return result
+
+
+def compare_groups(groups, group_draws, confidence=CONFIDENCE, chunk_bytes=CHUNK_BYTES):
+    mean, sd, lower, upper = summarize_draws(group_draws, confidence)
+    a, b = np.triu_indices(len(groups), 1)
+    pairs = {
+        "group_a": groups[a],
+        "group_b": groups[b],
+        "difference": np.empty(len(a)),
+        "lower": np.empty(len(a)),
+        "upper": np.empty(len(a)),
+        "pvalue": np.empty(len(a)),
+    }
+    step = chunk_rows(group_draws.shape[1], chunk_bytes)
+    for start in range(0, len(a), step):
+        rows = slice(start, min(start + step, len(a)))
+        difference = group_draws[a[rows]] - group_draws[b[rows]]
+        center, _, low, high = summarize_draws(difference, confidence)
+        pairs["difference"][rows] = center
+        pairs["lower"][rows] = low
+        pairs["upper"][rows] = high
+        # Two-sided: how often the draws fall on the other side of zero.
+        above = (difference > 0).mean(axis=1)
+        pairs["pvalue"][rows] = np.minimum(1.0, 2 * np.minimum(above, 1 - above))
+    return {
+        "group": groups,
+        "mean": mean,
+        "sd": sd,
+        "lower": lower,
+        "upper": upper,
+        "pairs": pairs,
+    }
+
+
+def format_uncertainty(comparison, confidence=CONFIDENCE):
+    level = f"{confidence * 100:g}%"
+    report = [
+        f"Group {group}: Mean = {mean:.3f}, {level} CI [{lower:.3f}, {upper:.3f}]"
+        for group, mean, lower, upper in zip(
+            comparison["group"].tolist(),
+            comparison["mean"].tolist(),
+            comparison["lower"].tolist(),
+            comparison["upper"].tolist(),
+        )
+    ]
+    pairs = comparison["pairs"]
+    for a, b, difference, lower, upper, pvalue in zip(
+        pairs["group_a"].tolist(),
+        pairs["group_b"].tolist(),
+        pairs["difference"].tolist(),
+        pairs["lower"].tolist(),
+        pairs["upper"].tolist(),
+        pairs["pvalue"].tolist(),
+    ):
+        report.append(
+            f"{a} vs {b}: Difference = {difference:.3f}, "
+            f"{level} CI [{lower:.3f}, {upper:.3f}], P = {pvalue:.4g}"
+        )
+    return "\n".join(report)